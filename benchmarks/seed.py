@@ -0,0 +1,75 @@
+"""Scratch schema of authors, books and reviews shared by the benchmarks"""
+from __future__ import annotations
+
+import typing
+from contextlib import contextmanager
+from time import perf_counter
+
+from sqlalchemy.engine import Engine
+
+SCHEMA = "nebulo_benchmark"
+
+SQL_UP = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+SET search_path TO {SCHEMA};
+
+CREATE TABLE author (
+    id serial primary key,
+    name text not null
+);
+
+CREATE TABLE book (
+    id serial primary key,
+    author_id int not null references author(id),
+    title text not null
+);
+
+CREATE TABLE review (
+    id serial primary key,
+    book_id int not null references book(id),
+    rating int not null
+);
+
+CREATE INDEX book_author_id ON book (author_id);
+CREATE INDEX review_book_id ON review (book_id);
+
+INSERT INTO author (name)
+SELECT 'author ' || x FROM generate_series(1, %(authors)s) x;
+
+INSERT INTO book (author_id, title)
+SELECT a.id, 'book ' || x FROM author a, generate_series(1, %(books)s) x;
+
+INSERT INTO review (book_id, rating)
+SELECT b.id, x %% 5 FROM book b, generate_series(1, %(reviews)s) x;
+
+ANALYZE author;
+ANALYZE book;
+ANALYZE review;
+"""
+
+
+@contextmanager
+def scratch_schema(engine: Engine, authors: int, books: int, reviews: int) -> typing.Iterator[str]:
+    """Seed the scratch schema, yielding its name, and drop it afterwards"""
+    with engine.begin() as conn:
+        conn.execute(SQL_UP, authors=authors, books=books, reviews=reviews)
+    try:
+        yield SCHEMA
+    finally:
+        with engine.begin() as conn:
+            conn.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+
+
+def time_statement(engine: Engine, schema: str, query, iterations: int) -> typing.Tuple[typing.Any, typing.List[float]]:
+    """Result of *query* and the milliseconds taken by each of *iterations* executions, sorted"""
+    timings = []
+    with engine.connect() as conn:
+        conn.execute(f"SET search_path TO {schema}")
+        # Warm the cache
+        result = conn.execute(query).scalar()
+        for _ in range(iterations):
+            start = perf_counter()
+            conn.execute(query).scalar()
+            timings.append((perf_counter() - start) * 1000)
+    return result, sorted(timings)
@@ -62,5 +62,7 @@ setup(
         "dev": ["pylint", "black", "sqlalchemy-stubs", "pre-commit"],
         "nvim": ["neovim", "python-language-server"],
         "docs": ["mkdocs", "pygments", "pymdown-extensions", "mkautodoc"],
+        "orjson": ["orjson>=3"],
+        "brotli": ["brotli"],
     },
 )
@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import json
+import shutil
+import tempfile
+
 import click
 import uvicorn
 from graphql.utilities import print_schema
@@ -24,11 +28,105 @@ def main(**kwargs):
 @click.option("--jwt-secret", default=None, help="Secret key for JWT encryption")
 @click.option("--reload/--no-reload", default=False, help="Reload if source files change")
 @click.option("--default-role", type=str, default=None, help="Default PostgreSQL role for anonymous users")
-def run(connection, schema, host, port, jwt_identifier, jwt_secret, reload, workers, default_role):
+@click.option(
+    "--server-timing/--no-server-timing", default=False, help="Report phase timings in a Server-Timing header"
+)
+@click.option(
+    "--timing-extensions/--no-timing-extensions",
+    default=False,
+    help="Report phase timings in the response's extensions.timings",
+)
+@click.option("--metrics/--no-metrics", default=False, help="Serve Prometheus metrics at /metrics")
+@click.option("--slow-query-ms", type=float, default=None, help="Log SQL statements slower than this threshold")
+@click.option("--explain-sample-rate", default=0.0, help="Fraction of slow queries to log with EXPLAIN ANALYZE")
+@click.option("--max-query-depth", type=int, default=None, help="Reject queries nesting more tables than this")
+@click.option("--max-query-cost", type=float, default=None, help="Reject queries estimated to return more rows")
+@click.option("--max-query-breadth", type=int, default=None, help="Reject queries selecting more fields in one set")
+@click.option("--max-concurrency", type=int, default=None, help="Maximum operations executing at once per worker")
+@click.option("--max-user-concurrency", type=int, default=None, help="Maximum operations executing at once per user")
+@click.option("--rate-limit", type=float, default=None, help="Query cost each user may spend per second")
+@click.option("--rate-limit-burst", type=float, default=None, help="Query cost each user may spend at once")
+@click.option("--admission-timeout", default=5.0, help="Seconds to queue for admission before returning 429")
+@click.option(
+    "--batch-transaction/--no-batch-transaction", default=False, help="Run batched operations in one transaction"
+)
+@click.option("--max-batch-size", default=25, help="Maximum operations in a batch request")
+@click.option("--json-codec", type=click.Choice(["json", "orjson"]), default="json", help="JSON implementation")
+@click.option("--compression/--no-compression", default=False, help="Compress responses with brotli or gzip")
+@click.option("--compression-minimum-size", default=1024, help="Minimum response size in bytes to compress")
+@click.option("--compression-level", type=click.IntRange(1, 9), default=6, help="Compression level from 1 to 9")
+@click.option("--function-cache-size", default=0, help="Bytes of immutable function results to cache per worker")
+@click.option("--function-cache-ttl", default=300.0, help="Seconds to cache immutable function results")
+@click.option("--result-cache-size", default=0, help="Bytes of @cache query results to cache per worker")
+@click.option("--result-cache-channel", default="nebulo_cache", help="Channel to LISTEN on for cache invalidations")
+@click.option(
+    "--join-strategy",
+    type=click.Choice(["subquery", "lateral", "auto"]),
+    default="subquery",
+    help="Read nested relationships with subqueries or LATERAL joins",
+)
+@click.option(
+    "--execution-backend",
+    type=click.Choice(["databases", "asyncpg"]),
+    default="databases",
+    help="Execute SQL with the databases package or directly with asyncpg",
+)
+@click.option("--pgbouncer/--no-pgbouncer", default=False, help="Connect through PgBouncer in transaction pooling mode")
+@click.option("--statement-cache-size", default=100, help="Prepared statements cached per connection")
+@click.option("--role-pool-size", default=0, help="Connections in the pool dedicated to each role, 0 to share one pool")
+@click.option("--max-role-pools", default=8, help="Maximum number of roles with a dedicated pool")
+@click.option(
+    "--single-flight/--no-single-flight", default=False, help="Share one execution among concurrent identical reads"
+)
+@click.option("--deadline-header", default=None, help="Request header with the client's time budget in milliseconds")
+def run(
+    connection,
+    schema,
+    host,
+    port,
+    jwt_identifier,
+    jwt_secret,
+    reload,
+    workers,
+    default_role,
+    server_timing,
+    timing_extensions,
+    metrics,
+    slow_query_ms,
+    explain_sample_rate,
+    max_query_depth,
+    max_query_cost,
+    max_query_breadth,
+    max_concurrency,
+    max_user_concurrency,
+    rate_limit,
+    rate_limit_burst,
+    admission_timeout,
+    batch_transaction,
+    max_batch_size,
+    json_codec,
+    compression,
+    compression_minimum_size,
+    compression_level,
+    function_cache_size,
+    function_cache_ttl,
+    result_cache_size,
+    result_cache_channel,
+    join_strategy,
+    execution_backend,
+    pgbouncer,
+    statement_cache_size,
+    role_pool_size,
+    max_role_pools,
+    single_flight,
+    deadline_header,
+):
     """Run the GraphQL Web Server"""
     if reload and workers > 1:
         print("Reload not supported with workers > 1")
     else:
+        # Workers share metrics through snapshots in a common directory
+        metrics_dir = tempfile.mkdtemp(prefix="nebulo-metrics-") if metrics and workers > 1 else None
 
         with EnvManager(
             NEBULO_CONNECTION=connection,
@@ -36,9 +134,47 @@ def run(connection, schema, host, port, jwt_identifier, jwt_secret, reload, work
             NEBULO_JWT_IDENTIFIER=jwt_identifier,
             NEBULO_JWT_SECRET=jwt_secret,
             NEBULO_DEFAULT_ROLE=default_role,
+            NEBULO_SERVER_TIMING=server_timing,
+            NEBULO_TIMING_EXTENSIONS=timing_extensions,
+            NEBULO_METRICS=metrics,
+            NEBULO_METRICS_DIR=metrics_dir,
+            NEBULO_SLOW_QUERY_MS=slow_query_ms,
+            NEBULO_EXPLAIN_SAMPLE_RATE=explain_sample_rate,
+            NEBULO_MAX_QUERY_DEPTH=max_query_depth,
+            NEBULO_MAX_QUERY_COST=max_query_cost,
+            NEBULO_MAX_QUERY_BREADTH=max_query_breadth,
+            NEBULO_MAX_CONCURRENCY=max_concurrency,
+            NEBULO_MAX_USER_CONCURRENCY=max_user_concurrency,
+            NEBULO_RATE_LIMIT=rate_limit,
+            NEBULO_RATE_LIMIT_BURST=rate_limit_burst,
+            NEBULO_ADMISSION_TIMEOUT=admission_timeout,
+            NEBULO_BATCH_TRANSACTION=batch_transaction,
+            NEBULO_MAX_BATCH_SIZE=max_batch_size,
+            NEBULO_JSON_CODEC=json_codec,
+            NEBULO_COMPRESSION=compression,
+            NEBULO_COMPRESSION_MINIMUM_SIZE=compression_minimum_size,
+            NEBULO_COMPRESSION_LEVEL=compression_level,
+            NEBULO_FUNCTION_CACHE_SIZE=function_cache_size,
+            NEBULO_FUNCTION_CACHE_TTL=function_cache_ttl,
+            NEBULO_RESULT_CACHE_SIZE=result_cache_size,
+            NEBULO_RESULT_CACHE_CHANNEL=result_cache_channel,
+            NEBULO_JOIN_STRATEGY=join_strategy,
+            NEBULO_EXECUTION_BACKEND=execution_backend,
+            NEBULO_PGBOUNCER=pgbouncer,
+            NEBULO_STATEMENT_CACHE_SIZE=statement_cache_size,
+            NEBULO_ROLE_POOL_SIZE=role_pool_size,
+            NEBULO_MAX_ROLE_POOLS=max_role_pools,
+            NEBULO_SINGLE_FLIGHT=single_flight,
+            NEBULO_DEADLINE_HEADER=deadline_header,
         ):
 
-            uvicorn.run("nebulo.server.app:APP", host=host, workers=workers, port=port, log_level="info", reload=reload)
+            try:
+                uvicorn.run(
+                    "nebulo.server.app:APP", host=host, workers=workers, port=port, log_level="info", reload=reload
+                )
+            finally:
+                if metrics_dir is not None:
+                    shutil.rmtree(metrics_dir, ignore_errors=True)
 
 
 @main.command()
@@ -55,3 +191,89 @@ def dump_schema(connection, schema, out_file):
     schema = sqla_models_to_graphql_schema(sqla_models, sql_functions)
     schema_str = print_schema(schema)
     click.echo(schema_str, file=out_file)
+
+
+@main.command()
+@click.option("-c", "--connection", help="Database connection string")
+@click.option("-s", "--schema", default="public", help="SQL schema name")
+@click.option("-q", "--query-file", type=click.File("r"), required=True, help="GraphQL query file path")
+@click.option("-v", "--variables-file", type=click.File("r"), default=None, help="JSON query variables file path")
+@click.option("--operation-name", default=None, help="Operation to explain if the file contains several")
+@click.option("--default-role", type=str, default=None, help="PostgreSQL role to explain the query as")
+@click.option("--analyze/--no-analyze", default=False, help="Execute the query to report actual run times")
+@click.option(
+    "--join-strategy",
+    type=click.Choice(["subquery", "lateral", "auto"]),
+    default="subquery",
+    help="Read nested relationships with subqueries or LATERAL joins",
+)
+def explain(connection, schema, query_file, variables_file, operation_name, default_role, analyze, join_strategy):
+    """Print the SQL and query plan for a GraphQL query"""
+    from graphql import GraphQLError, parse, validate
+    from nebulo.gql.complexity import query_cost
+    from nebulo.gql.explain import join_and_filter_columns, missing_indexes, sequential_scans
+    from nebulo.gql.parse_info import parse_document
+    from nebulo.gql.resolve.resolvers.claims import build_claims
+    from nebulo.gql.resolve.transpile.query_builder import sql_builder, sql_finalize
+    from nebulo.gql.sqla_to_gql import sqla_models_to_graphql_schema
+    from nebulo.sql.reflection.manager import reflect_sqla_models
+    from nebulo.sql.reflection.statistics import reflect_row_estimates
+    from nebulo.sql.statement_helpers import Explain
+    from sqlalchemy.dialects import postgresql
+
+    engine = create_engine(connection)
+    sqla_models, sql_functions = reflect_sqla_models(engine, schema=schema)
+    gql_schema = sqla_models_to_graphql_schema(sqla_models, sql_functions)
+
+    try:
+        document = parse(query_file.read())
+        errors = validate(gql_schema, document)
+        if errors:
+            raise errors[0]
+        variables = json.load(variables_file) if variables_file else None
+        operation, trees = parse_document(gql_schema, document, variables, operation_name)
+    except GraphQLError as exc:
+        raise click.ClickException(str(exc))
+
+    if operation.operation.value != "query":
+        raise click.ClickException("Only query operations can be explained")
+
+    plan_options = "ANALYZE, BUFFERS" if analyze else ""
+    row_estimates = reflect_row_estimates(engine, schema=schema)
+
+    with engine.connect() as conn:
+        # Roll back so ANALYZE can never leave side effects
+        transaction = conn.begin()
+        try:
+            if default_role is not None:
+                conn.execute(build_claims({}, default_role))
+
+            for tree in trees:
+                query = sql_finalize(tree.name, sql_builder(tree, join_strategy=join_strategy))
+                click.echo(f"-- {tree.alias} (estimated cost {query_cost(tree, row_estimates):.0f})")
+                try:
+                    sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+                    click.echo(f"{sql};\n")
+                except (NotImplementedError, ValueError, TypeError):
+                    # Some bound types can not be rendered as literals
+                    sql = query.compile(dialect=postgresql.dialect())
+                    click.echo(f"{sql};\n-- Parameters: {sql.params}\n")
+
+                plan_rows = conn.execute(Explain(query, options=plan_options)).fetchall()
+                click.echo("\n".join(row[0] for row in plan_rows) + "\n")
+
+                json_plan = conn.execute(Explain(query, options="FORMAT JSON")).scalar()
+                warnings = [
+                    f"Sequential scan on {scan.relation}" + (f" with filter {scan.filter}" if scan.filter else "")
+                    for scan in sequential_scans(json_plan)
+                ] + [
+                    f"No index on {usage.column.table.name}.{usage.column.name} used as a {usage.usage} column"
+                    for usage in missing_indexes(engine, join_and_filter_columns(tree))
+                ]
+                if warnings:
+                    click.echo("Warnings:")
+                    for warning in warnings:
+                        click.echo(f"  - {warning}")
+                    click.echo("")
+        finally:
+            transaction.rollback()
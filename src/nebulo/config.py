@@ -1,5 +1,6 @@
+import re
 from inspect import isclass
-from typing import Type, Union
+from typing import List, NamedTuple, Optional, Type, Union
 
 from nebulo.env import EnvManager
 from nebulo.sql.inspect import get_comment, get_table_name
@@ -15,6 +16,25 @@ from typing_extensions import Literal
 ENV = EnvManager.get_environ()
 
 
+def env_flag(key: str) -> bool:
+    """Read a boolean flag from the environment"""
+    return ENV.get(key, "").lower() in ("1", "true")
+
+
+class CacheControl(NamedTuple):
+    """Cache-Control hint parsed from an @cache_control comment directive"""
+
+    max_age: int
+    private: bool = False
+
+
+class Search(NamedTuple):
+    """Full-text search settings parsed from an @search comment directive"""
+
+    columns: List[str]
+    config: str = "english"
+
+
 class Config:
 
     CONNECTION = ENV.get("NEBULO_CONNECTION")
@@ -22,6 +42,38 @@ class Config:
     JWT_IDENTIFIER = ENV.get("NEBULO_JWT_IDENTIFIER")
     JWT_SECRET = ENV.get("NEBULO_JWT_SECRET")
     DEFAULT_ROLE = ENV.get("NEBULO_DEFAULT_ROLE")
+    SERVER_TIMING = env_flag("NEBULO_SERVER_TIMING")
+    TIMING_EXTENSIONS = env_flag("NEBULO_TIMING_EXTENSIONS")
+    METRICS = env_flag("NEBULO_METRICS")
+    METRICS_DIR = ENV.get("NEBULO_METRICS_DIR")
+    SLOW_QUERY_MS = float(ENV["NEBULO_SLOW_QUERY_MS"]) if ENV.get("NEBULO_SLOW_QUERY_MS") else None
+    EXPLAIN_SAMPLE_RATE = float(ENV.get("NEBULO_EXPLAIN_SAMPLE_RATE") or 0)
+    MAX_QUERY_DEPTH = int(ENV["NEBULO_MAX_QUERY_DEPTH"]) if ENV.get("NEBULO_MAX_QUERY_DEPTH") else None
+    MAX_QUERY_COST = float(ENV["NEBULO_MAX_QUERY_COST"]) if ENV.get("NEBULO_MAX_QUERY_COST") else None
+    MAX_QUERY_BREADTH = int(ENV["NEBULO_MAX_QUERY_BREADTH"]) if ENV.get("NEBULO_MAX_QUERY_BREADTH") else None
+    MAX_CONCURRENCY = int(ENV["NEBULO_MAX_CONCURRENCY"]) if ENV.get("NEBULO_MAX_CONCURRENCY") else None
+    MAX_USER_CONCURRENCY = int(ENV["NEBULO_MAX_USER_CONCURRENCY"]) if ENV.get("NEBULO_MAX_USER_CONCURRENCY") else None
+    RATE_LIMIT = float(ENV["NEBULO_RATE_LIMIT"]) if ENV.get("NEBULO_RATE_LIMIT") else None
+    RATE_LIMIT_BURST = float(ENV["NEBULO_RATE_LIMIT_BURST"]) if ENV.get("NEBULO_RATE_LIMIT_BURST") else None
+    ADMISSION_TIMEOUT = float(ENV.get("NEBULO_ADMISSION_TIMEOUT") or 5)
+    BATCH_TRANSACTION = env_flag("NEBULO_BATCH_TRANSACTION")
+    MAX_BATCH_SIZE = int(ENV.get("NEBULO_MAX_BATCH_SIZE") or 25)
+    JSON_CODEC = ENV.get("NEBULO_JSON_CODEC") or "json"
+    COMPRESSION = env_flag("NEBULO_COMPRESSION")
+    COMPRESSION_MINIMUM_SIZE = int(ENV.get("NEBULO_COMPRESSION_MINIMUM_SIZE") or 1024)
+    COMPRESSION_LEVEL = int(ENV.get("NEBULO_COMPRESSION_LEVEL") or 6)
+    FUNCTION_CACHE_SIZE = int(ENV.get("NEBULO_FUNCTION_CACHE_SIZE") or 0)
+    FUNCTION_CACHE_TTL = float(ENV.get("NEBULO_FUNCTION_CACHE_TTL") or 300)
+    RESULT_CACHE_SIZE = int(ENV.get("NEBULO_RESULT_CACHE_SIZE") or 0)
+    RESULT_CACHE_CHANNEL = ENV.get("NEBULO_RESULT_CACHE_CHANNEL") or "nebulo_cache"
+    JOIN_STRATEGY = ENV.get("NEBULO_JOIN_STRATEGY") or "subquery"
+    EXECUTION_BACKEND = ENV.get("NEBULO_EXECUTION_BACKEND") or "databases"
+    PGBOUNCER = env_flag("NEBULO_PGBOUNCER")
+    STATEMENT_CACHE_SIZE = int(ENV.get("NEBULO_STATEMENT_CACHE_SIZE") or 100)
+    ROLE_POOL_SIZE = int(ENV.get("NEBULO_ROLE_POOL_SIZE") or 0)
+    MAX_ROLE_POOLS = int(ENV.get("NEBULO_MAX_ROLE_POOLS") or 8)
+    SINGLE_FLIGHT = env_flag("NEBULO_SINGLE_FLIGHT")
+    DEADLINE_HEADER = ENV.get("NEBULO_DEADLINE_HEADER")
 
     @staticmethod
     def function_name_mapper(sql_function: SQLFunction) -> str:
@@ -98,6 +150,55 @@ class Config:
                     return True
         return False
 
+    @staticmethod
+    def cache_control(entity: TableProtocol) -> Optional[CacheControl]:
+        """Cache-Control hint for GET requests reading the entity e.g. @cache_control max_age=60, private"""
+        comment: str = get_comment(entity)
+        lines = comment.split("\n")
+        for line in lines:
+            if "@cache_control" in line:
+                options_dirty = line[line.index("@cache_control") + len("@cache_control") :].split(",")
+                options_clean = {x.strip() for x in options_dirty}
+                max_age = next((x[len("max_age=") :] for x in options_clean if x.startswith("max_age=")), None)
+                if max_age is None:
+                    raise ValueError(f"@cache_control requires max_age. Got '{line.strip()}'")
+                return CacheControl(max_age=int(max_age), private="private" in options_clean)
+        return None
+
+    @staticmethod
+    def cache_ttl(entity: TableProtocol) -> Optional[float]:
+        """Seconds query results reading the entity may be cached e.g. @cache ttl=3600"""
+        comment: str = get_comment(entity)
+        lines = comment.split("\n")
+        for line in lines:
+            # Must not match @cache_control
+            match = re.search(r"@cache\b(?!_)", line)
+            if match is not None:
+                options_dirty = line[match.end() :].split(",")
+                options_clean = {x.strip() for x in options_dirty}
+                ttl = next((x[len("ttl=") :] for x in options_clean if x.startswith("ttl=")), None)
+                if ttl is None:
+                    raise ValueError(f"@cache requires ttl. Got '{line.strip()}'")
+                return float(ttl)
+        return None
+
+    @staticmethod
+    def search(entity: TableProtocol) -> Optional[Search]:
+        """Full-text search over text columns e.g. @search title, body, config=english"""
+        comment: str = get_comment(entity)
+        lines = comment.split("\n")
+        for line in lines:
+            if "@search" in line:
+                options_dirty = line[line.index("@search") + len("@search") :].split(",")
+                options_clean = [x.strip() for x in options_dirty if x.strip()]
+                config = next((x[len("config=") :] for x in options_clean if x.startswith("config=")), "english")
+                # Rendered into SQL so must be a plain, optionally schema qualified, name
+                if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?", config):
+                    raise ValueError(f"@search config must be a text search configuration name. Got '{config}'")
+                columns = [x for x in options_clean if not x.startswith("config=")]
+                return Search(columns=columns, config=config)
+        return None
+
     @classmethod
     def exclude_read(cls, entity: Union[TableProtocol, Column]) -> bool:
         """Should the entity be excluded from reads? e.g. entity(nodeId ...) and allEntities(...)"""
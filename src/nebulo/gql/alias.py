@@ -107,6 +107,10 @@ class EdgeType(ObjectType):
     pass
 
 
+class AggregatesType(ObjectType):
+    pass
+
+
 class TableType(ObjectType):
     pass
 
@@ -0,0 +1,129 @@
+"""
+Static cost analysis of GraphQL operations, applied before any SQL is built
+
+Each table or connection selected by a query becomes a block in the generated
+SQL. Depth counts nested blocks, breadth counts the fields in a single selection
+set and cost approximates the number of rows the blocks produce.
+"""
+from __future__ import annotations
+
+import typing
+
+from graphql.error import GraphQLError
+from nebulo.gql.alias import AggregatesType, ConnectionType, TableType
+from nebulo.gql.parse_info import ASTNode
+from nebulo.gql.resolve.transpile.query_builder import to_limit
+from nebulo.sql.inspect import get_table_name
+
+__all__ = ["ComplexityLimits", "query_cost", "query_depth", "query_breadth"]
+
+# Cost of each row counted when totalCount is selected
+TOTAL_COUNT_ROW_COST = 0.001
+
+
+def query_cost(tree: ASTNode, row_estimates: typing.Optional[typing.Dict[str, float]] = None) -> float:
+    """Estimated number of rows produced by the SQL for *tree*
+
+    Connections multiply the cost of each node by the number of rows requested,
+    bounded by the table's planner row estimate when known
+    """
+    row_estimates = row_estimates or {}
+    return_type = tree.return_type
+
+    if isinstance(return_type, ConnectionType):
+        table_rows = row_estimates.get(get_table_name(return_type.sqla_model))
+        limit = to_limit(tree)
+        rows = min(limit, table_rows) if table_rows is not None else limit
+        node_cost = 1 + sum(query_cost(subfield, row_estimates) for subfield in _edge_node_fields(tree))
+        cost = 1 + rows * node_cost
+        # totalCount and aggregates read every row matching the condition
+        scans = [x for x in tree.fields if x.name == "totalCount" or isinstance(x.return_type, AggregatesType)]
+        if table_rows is not None:
+            cost += len(scans) * table_rows * TOTAL_COUNT_ROW_COST
+        return cost
+
+    child_cost = sum(query_cost(subfield, row_estimates) for subfield in tree.fields)
+    if tree.parent is None and "nodeIds" in tree.args:
+        # Node lookups read one row per ID
+        return 1 + len(tree.args["nodeIds"]) * (1 + child_cost)
+    if isinstance(return_type, TableType) or tree.parent is None:
+        return 1 + child_cost
+    return child_cost
+
+
+def query_depth(tree: ASTNode) -> int:
+    """Number of nested table and connection blocks along the deepest path of *tree*"""
+    child_depth = max([query_depth(subfield) for subfield in tree.fields], default=0)
+    if isinstance(tree.return_type, (TableType, ConnectionType)):
+        # Connections contain their nodes, which are not counted separately
+        if isinstance(tree.return_type, TableType) and tree.parent is not None and tree.parent.name == "edges":
+            return child_depth
+        return 1 + child_depth
+    return child_depth
+
+
+def query_breadth(tree: ASTNode) -> int:
+    """Largest number of fields selected in any selection set of *tree*"""
+    return max([len(tree.fields)] + [query_breadth(subfield) for subfield in tree.fields])
+
+
+def _edge_node_fields(tree: ASTNode) -> typing.List[ASTNode]:
+    """Connection fields other than edges.node fields are not repeated per row"""
+    fields = []
+    for cfield in tree.fields:
+        if cfield.name == "edges":
+            for edge_field in cfield.fields:
+                if edge_field.name == "node":
+                    fields.extend(edge_field.fields)
+    return fields
+
+
+class ComplexityLimits:
+    """Rejects operations that exceed a maximum depth, breadth or estimated cost
+
+    **Parameters**
+
+    * **max_depth**: _int_ = Maximum number of nested table and connection selections
+    * **max_cost**: _float_ = Maximum estimated number of rows across all root fields
+    * **max_breadth**: _int_ = Maximum number of fields in a single selection set
+    * **row_estimates**: _Dict[str, float]_ = Planner row estimates by table name, see reflect_row_estimates
+    """
+
+    def __init__(
+        self,
+        max_depth: typing.Optional[int] = None,
+        max_cost: typing.Optional[float] = None,
+        max_breadth: typing.Optional[int] = None,
+        row_estimates: typing.Optional[typing.Dict[str, float]] = None,
+    ):
+        self.max_depth = max_depth
+        self.max_cost = max_cost
+        self.max_breadth = max_breadth
+        self.row_estimates = row_estimates or {}
+
+    def cost(self, trees: typing.List[ASTNode]) -> float:
+        return sum(query_cost(tree, self.row_estimates) for tree in trees)
+
+    def validate(self, trees: typing.List[ASTNode], cost: typing.Optional[float] = None) -> typing.List[GraphQLError]:
+        """Errors for each limit exceeded by an operation's root fields
+
+        Pass the operation's *cost*, if already computed, to avoid estimating it again
+        """
+        errors = []
+
+        if self.max_breadth is not None:
+            breadth = max([len(trees)] + [query_breadth(tree) for tree in trees])
+            if breadth > self.max_breadth:
+                errors.append(GraphQLError(f"Query breadth {breadth} exceeds the maximum of {self.max_breadth}"))
+
+        if self.max_depth is not None:
+            depth = max([query_depth(tree) for tree in trees], default=0)
+            if depth > self.max_depth:
+                errors.append(GraphQLError(f"Query depth {depth} exceeds the maximum of {self.max_depth}"))
+
+        if self.max_cost is not None:
+            cost = self.cost(trees) if cost is None else cost
+            if cost > self.max_cost:
+                errors.append(GraphQLError(f"Query cost {cost:.0f} exceeds the maximum of {self.max_cost:.0f}"))
+
+        return errors
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import typing
+from functools import lru_cache
+
+from nebulo.config import Config
+from nebulo.gql.alias import AggregatesType, Argument, EnumType, EnumValue, Field, Float, Int, List, NonNull, ObjectType
+from nebulo.gql.convert.column import convert_type
+from nebulo.gql.resolve.resolvers.default import default_resolver
+from nebulo.sql.inspect import get_columns
+from nebulo.sql.table_base import TableProtocol
+from sqlalchemy import Column, types
+
+"""
+aggregates(groupBy: [AccountGroupBy!]): [AccountAggregates!]!
+
+type AccountAggregates {
+    keys: AccountAggregateKeys
+    count: Int!
+    sum: AccountNumericAggregates
+    avg: AccountNumericAggregates
+    min: AccountNumericAggregates
+    max: AccountNumericAggregates
+}
+"""
+
+__all__ = ["aggregates_field_factory", "is_numeric"]
+
+
+def is_numeric(column: Column) -> bool:
+    return isinstance(column.type, (types.Integer, types.Numeric))
+
+
+def readable_columns(sqla_model: TableProtocol) -> typing.List[Column]:
+    return [x for x in get_columns(sqla_model) if not Config.exclude_read(x)]
+
+
+@lru_cache()
+def aggregates_field_factory(sqla_model: TableProtocol) -> Field:
+    relevant_type_name = Config.table_type_name_mapper(sqla_model)
+    return Field(
+        NonNull(List(NonNull(aggregates_factory(sqla_model)))),
+        args={"groupBy": Argument(List(NonNull(group_by_factory(sqla_model))))},
+        resolve=default_resolver,
+        description=f"Aggregates over the set of {relevant_type_name}, ignoring pagination. "
+        "One result is returned per distinct value of the groupBy columns",
+    )
+
+
+@lru_cache()
+def group_by_factory(sqla_model: TableProtocol) -> EnumType:
+    """AccountGroupBy"""
+    name = Config.table_type_name_mapper(sqla_model) + "GroupBy"
+    values = {column.name.upper(): EnumValue(value=column.name) for column in readable_columns(sqla_model)}
+    return EnumType(name=name, values=values, description="")
+
+
+@lru_cache()
+def aggregates_factory(sqla_model: TableProtocol) -> AggregatesType:
+    """AccountAggregates"""
+    name = Config.table_type_name_mapper(sqla_model) + "Aggregates"
+
+    def build_attrs():
+        attrs = {
+            "keys": Field(aggregate_keys_factory(sqla_model), resolve=default_resolver),
+            "count": Field(NonNull(Int), resolve=default_resolver),
+        }
+        numeric_type = numeric_aggregates_factory(sqla_model)
+        if numeric_type is not None:
+            for aggregate in ("sum", "avg", "min", "max"):
+                attrs[aggregate] = Field(numeric_type, resolve=default_resolver)
+        return attrs
+
+    return AggregatesType(name=name, fields=build_attrs, description="", sqla_model=sqla_model)
+
+
+@lru_cache()
+def aggregate_keys_factory(sqla_model: TableProtocol) -> ObjectType:
+    """AccountAggregateKeys, the values of the groupBy columns"""
+    name = Config.table_type_name_mapper(sqla_model) + "AggregateKeys"
+
+    def build_attrs():
+        return {
+            Config.column_name_mapper(column): Field(convert_type(column.type), resolve=default_resolver)
+            for column in readable_columns(sqla_model)
+        }
+
+    return ObjectType(name=name, fields=build_attrs, description="", sqla_model=sqla_model)
+
+
+@lru_cache()
+def numeric_aggregates_factory(sqla_model: TableProtocol) -> typing.Optional[ObjectType]:
+    """AccountNumericAggregates, or None if the table has no numeric columns"""
+    name = Config.table_type_name_mapper(sqla_model) + "NumericAggregates"
+    numeric_columns = [x for x in readable_columns(sqla_model) if is_numeric(x)]
+    if not numeric_columns:
+        return None
+
+    def build_attrs():
+        # Floats because sums of integers exceed 32 bits
+        return {Config.column_name_mapper(column): Field(Float, resolve=default_resolver) for column in numeric_columns}
+
+    return ObjectType(name=name, fields=build_attrs, description="", sqla_model=sqla_model)
@@ -3,12 +3,25 @@ from __future__ import annotations
 from functools import lru_cache
 
 from nebulo.config import Config
-from nebulo.gql.alias import Argument, ConnectionType, EdgeType, Field, InputObjectType, Int, List, NonNull
+from nebulo.gql.alias import (
+    Argument,
+    Boolean,
+    ConnectionType,
+    EdgeType,
+    Field,
+    InputObjectType,
+    Int,
+    List,
+    NonNull,
+    String,
+)
+from nebulo.gql.convert.aggregate import aggregates_field_factory
 from nebulo.gql.convert.column import convert_column_to_input
 from nebulo.gql.relay.cursor import Cursor
 from nebulo.gql.relay.page_info import PageInfo
 from nebulo.gql.resolve.resolvers.default import default_resolver
 from nebulo.sql.inspect import get_columns
+from nebulo.sql.search import is_searchable
 from nebulo.sql.table_base import TableProtocol
 
 __all__ = ["connection_field_factory"]
@@ -26,6 +39,11 @@ def connection_field_factory(sqla_model: TableProtocol, resolver, not_null=False
         "after": Argument(Cursor),
         "condition": Argument(condition),
     }
+    if is_searchable(sqla_model):
+        args["search"] = Argument(
+            String, description="Full-text search query in web search syntax e.g. '\"exact phrase\" or -excluded'"
+        )
+        args["rankSearch"] = Argument(Boolean, description="Order results by relevance to the search query")
     return Field(
         NonNull(connection) if not_null else connection,
         args=args,
@@ -68,6 +86,7 @@ def connection_factory(sqla_model: TableProtocol) -> ConnectionType:
             "edges": Field(NonNull(List(NonNull(edge))), resolve=default_resolver),
             "pageInfo": Field(NonNull(PageInfo), resolve=default_resolver),
             "totalCount": Field(NonNull(Int), resolve=default_resolver),
+            "aggregates": aggregates_field_factory(sqla_model),
         }
 
     return_type = ConnectionType(name=name, fields=build_attrs, description="", sqla_model=sqla_model)
@@ -55,8 +55,9 @@ def immutable_function_entrypoint_factory(
     }
 
     return_type = convert_type(sql_function.return_sqla_type)
-    return_type.sql_function = sql_function
     return_field = Field(return_type, args=gql_args, resolve=resolver, description="")
+    # Scalar return types are shared between functions so the function is attached to the field
+    return_field.sql_function = sql_function
 
     return {function_name: return_field}
 
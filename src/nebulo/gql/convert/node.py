@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import typing
+
+from nebulo.gql.alias import Argument, Field, List, NonNull
+from nebulo.gql.convert.table import table_factory
+from nebulo.gql.relay.node_interface import ID, NodeInterface
+from nebulo.sql.inspect import get_table_name
+from nebulo.sql.table_base import TableProtocol
+
+"""
+node(nodeId: ID!): NodeInterface
+nodes(nodeIds: [ID!]!): [NodeInterface]!
+"""
+
+
+def node_entrypoint_factory(sqla_models: typing.List[TableProtocol], resolver) -> typing.Dict[str, Field]:
+    """node and nodes, reading rows of any of *sqla_models* by their globally unique IDs"""
+    # Table types are attached to the fields so the resolver can map a nodeId's table_name to its type
+    node_types = {get_table_name(sqla_model): table_factory(sqla_model) for sqla_model in sqla_models}
+
+    node = Field(
+        NodeInterface,
+        args={"nodeId": Argument(NonNull(ID))},
+        resolve=resolver,
+        description="Reads a single node of any type using its globally unique ID",
+    )
+    node.node_types = node_types
+
+    nodes = Field(
+        NonNull(List(NodeInterface)),
+        args={"nodeIds": Argument(NonNull(List(NonNull(ID))))},
+        resolve=resolver,
+        description="Reads nodes of any type using their globally unique IDs. Results are in the order of nodeIds "
+        "and are null where no node matches",
+    )
+    nodes.node_types = node_types
+
+    return {"node": node, "nodes": nodes}
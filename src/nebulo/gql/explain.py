@@ -0,0 +1,91 @@
+"""
+Helpers for inspecting the query plans of generated SQL
+"""
+from __future__ import annotations
+
+import typing
+
+from nebulo.gql.alias import ConnectionType, TableType
+from nebulo.gql.parse_info import ASTNode
+from nebulo.gql.resolve.transpile.query_builder import field_name_to_column, field_name_to_relationship
+from sqlalchemy import Column
+from sqlalchemy import inspect as sql_inspect
+from sqlalchemy.engine import Engine
+
+__all__ = ["join_and_filter_columns", "missing_indexes", "sequential_scans"]
+
+
+class ColumnUsage(typing.NamedTuple):
+    column: Column
+    usage: str
+
+
+class SequentialScan(typing.NamedTuple):
+    relation: str
+    filter: typing.Optional[str]
+
+
+def join_and_filter_columns(tree: ASTNode) -> typing.List[ColumnUsage]:
+    """Columns the generated SQL joins or filters on that would benefit from an index"""
+    usages: typing.List[ColumnUsage] = []
+
+    if isinstance(tree.return_type, (TableType, ConnectionType)):
+        parent = tree.parent
+        if parent is not None and isinstance(parent.return_type, TableType):
+            relationship = field_name_to_relationship(parent.return_type.sqla_model, tree.name)
+            for _, remote_col in relationship.local_remote_pairs:
+                usages.append(ColumnUsage(remote_col, "join"))
+
+        for field_name in (tree.args.get("condition") or {}).keys():
+            usages.append(ColumnUsage(field_name_to_column(tree.return_type.sqla_model, field_name), "filter"))
+
+    for subfield in tree.fields:
+        usages.extend(join_and_filter_columns(subfield))
+    return usages
+
+
+def missing_indexes(engine: Engine, usages: typing.List[ColumnUsage]) -> typing.List[ColumnUsage]:
+    """Subset of *usages* whose column does not lead any index on its table"""
+    inspector = sql_inspect(engine)
+    indexed: typing.Dict[typing.Tuple[typing.Optional[str], str], typing.Set[str]] = {}
+    views: typing.Dict[typing.Optional[str], typing.Set[str]] = {}
+
+    missing = []
+    for usage in usages:
+        table = usage.column.table
+        key = (table.schema, table.name)
+
+        if table.schema not in views:
+            views[table.schema] = set(inspector.get_view_names(schema=table.schema))
+        if table.name in views[table.schema]:
+            # Views can not be indexed
+            continue
+
+        if key not in indexed:
+            leading_columns = {
+                index["column_names"][0]
+                for index in inspector.get_indexes(table.name, schema=table.schema)
+                if index["column_names"]
+            }
+            primary_key = inspector.get_pk_constraint(table.name, schema=table.schema)["constrained_columns"]
+            leading_columns.update(primary_key[:1])
+            indexed[key] = leading_columns
+
+        if usage.column.name not in indexed[key] and usage not in missing:
+            missing.append(usage)
+    return missing
+
+
+def sequential_scans(plan: typing.Any) -> typing.List[SequentialScan]:
+    """Sequential scan nodes in an EXPLAIN (FORMAT JSON) plan"""
+    scans: typing.List[SequentialScan] = []
+
+    def visit(node: typing.Dict[str, typing.Any]) -> None:
+        if node.get("Node Type") == "Seq Scan":
+            scans.append(SequentialScan(node.get("Relation Name", "unknown"), node.get("Filter")))
+        for child in node.get("Plans", []):
+            visit(child)
+
+    for statement in plan:
+        visit(statement["Plan"])
+    return scans
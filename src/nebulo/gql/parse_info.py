@@ -1,11 +1,22 @@
 import typing
 
-from graphql.execution.execute import get_field_def
+from graphql.error import GraphQLError
+from graphql.execution.execute import ExecutionContext, get_field_def
 from graphql.execution.values import get_argument_values
-from graphql.language import FieldNode, FragmentDefinitionNode, FragmentSpreadNode, InlineFragmentNode
-from nebulo.gql.alias import Field, List, NonNull, ObjectType, ResolveInfo, Schema
+from graphql.language import (
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    NameNode,
+    OperationDefinitionNode,
+    SelectionSetNode,
+)
+from nebulo.gql.alias import Field, List, NonNull, ObjectType, ResolveInfo, Schema, TableType
+from nebulo.gql.relay.node_interface import NodeInterface
 
-__all__ = ["parse_resolve_info"]
+__all__ = ["parse_resolve_info", "parse_document", "parse_node_lookup", "is_node_lookup"]
 
 
 def field_to_type(field):
@@ -42,6 +53,7 @@ class ASTNode:
         field_type = field_to_type(field_def)
 
         self.alias = (field_node.alias.value if field_node.alias else None) or field_node.name.value
+        self.field_def = field_def
         self.return_type = field_type
         self.parent: typing.Optional[ASTNode] = parent
         self.parent_type = parent_type
@@ -137,3 +149,130 @@ def parse_resolve_info(info: ResolveInfo) -> ASTNode:
         fragments=fragments,
     )
     return parsed_info
+
+
+def is_node_lookup(field_def: Field) -> bool:
+    """Is the field a node(nodeId:) or nodes(nodeIds:) lookup, see nebulo.gql.convert.node"""
+    return hasattr(field_def, "node_types")
+
+
+def parse_node_lookup(
+    field_node: FieldNode,
+    field_def: Field,
+    schema: Schema,
+    variable_values,
+    fragments: typing.Dict[str, FragmentDefinitionNode],
+) -> typing.List[ASTNode]:
+    """Converts a node or nodes field into an ASTNode for each table referenced by its IDs
+
+    Each ASTNode reads its table's rows with the IDs in args["nodeIds"] and selects
+    the fields that apply to the table's type. IDs of unknown tables are skipped
+    """
+    args = get_argument_values(type_def=field_def, node=field_node, variable_values=variable_values)
+    node_ids = args["nodeIds"] if "nodeIds" in args else [args["nodeId"]]
+
+    node_ids_by_table: typing.Dict[str, typing.List[typing.Any]] = {}
+    for node_id in node_ids:
+        node_ids_by_table.setdefault(node_id.table_name, []).append(node_id)
+
+    trees = []
+    for table_name, table_node_ids in node_ids_by_table.items():
+        node_type: typing.Optional[TableType] = field_def.node_types.get(table_name)  # type: ignore
+        if node_type is None:
+            continue
+        # Present the lookup as a field returning the table's type
+        parent_type = ObjectType(name="NodeLookup", fields={"node": Field(node_type)})
+        lookup_node = FieldNode(
+            name=NameNode(value="node"),
+            alias=field_node.alias,
+            arguments=[],
+            directives=[],
+            selection_set=_type_selection_set(field_node.selection_set, node_type.name, fragments),
+        )
+        tree = ASTNode(
+            lookup_node,
+            parent_type.fields["node"],
+            schema,
+            parent=None,
+            variable_values=variable_values,
+            parent_type=parent_type,
+            fragments=fragments,
+        )
+        tree.args["nodeIds"] = table_node_ids
+        trees.append(tree)
+    return trees
+
+
+def _type_selection_set(
+    selection_set: SelectionSetNode, type_name: str, fragments: typing.Dict[str, FragmentDefinitionNode]
+) -> SelectionSetNode:
+    """Selections of an interface's selection set that apply to the type *type_name*"""
+    selections = []
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            selections.append(selection)
+            continue
+        if isinstance(selection, FragmentSpreadNode):
+            fragment = fragments[selection.name.value]
+            type_condition, inner_selection_set = fragment.type_condition, fragment.selection_set
+        else:
+            type_condition, inner_selection_set = selection.type_condition, selection.selection_set
+        if type_condition is None or type_condition.name.value in (type_name, NodeInterface.name):
+            selections.extend(_type_selection_set(inner_selection_set, type_name, fragments).selections)
+    return SelectionSetNode(selections=selections)
+
+
+def parse_document(
+    schema: Schema,
+    document: DocumentNode,
+    variable_values: typing.Optional[typing.Dict[str, typing.Any]] = None,
+    operation_name: typing.Optional[str] = None,
+) -> typing.Tuple[OperationDefinitionNode, typing.List[ASTNode]]:
+    """Converts each root field of a validated document's operation into an ASTNode
+
+    Equivalent to calling parse_resolve_info from each root field's resolver,
+    without executing the operation
+
+    Raises a GraphQLError if the operation can not be found or the variables are invalid
+    """
+    exe_context = ExecutionContext.build(
+        schema, document, raw_variable_values=variable_values, operation_name=operation_name
+    )
+    if isinstance(exe_context, list):
+        raise exe_context[0]
+
+    operation = exe_context.operation
+    root_type = {
+        "query": schema.query_type,
+        "mutation": schema.mutation_type,
+        "subscription": schema.subscription_type,
+    }[operation.operation.value]
+    if root_type is None:
+        raise GraphQLError(f"Schema is not configured for {operation.operation.value} operations")
+
+    root_fields = exe_context.collect_fields(root_type, operation.selection_set, {}, set())
+
+    trees = []
+    for field_nodes in root_fields.values():
+        field_node = field_nodes[0]
+        if field_node.name.value.startswith("__"):
+            # Reserved "introspection" field handled by framework
+            continue
+        field_def = root_type.fields[field_node.name.value]
+        if is_node_lookup(field_def):
+            trees.extend(
+                parse_node_lookup(field_node, field_def, schema, exe_context.variable_values, exe_context.fragments)
+            )
+            continue
+        trees.append(
+            ASTNode(
+                field_node,
+                field_def,
+                schema,
+                parent=None,
+                variable_values=exe_context.variable_values,
+                parent_type=root_type,
+                fragments=exe_context.fragments,
+            )
+        )
+    return operation, trees
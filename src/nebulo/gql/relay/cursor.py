@@ -39,7 +39,11 @@ def serialize(value: typing.Union[CursorStructure, typing.Dict]):
     return node_id.serialize()
 
 
-def to_cursor_sql(sqla_model, query_elem: Alias):
+# Key of the search rank in the values of cursors from ranked searches
+RANK_KEY = "_rank"
+
+
+def to_cursor_sql(sqla_model, query_elem: Alias, rank_column: typing.Optional[str] = None):
     table_name = get_table_name(sqla_model)
 
     pkey_cols = get_primary_key_columns(sqla_model)
@@ -50,6 +54,10 @@ def to_cursor_sql(sqla_model, query_elem: Alias):
         col_name = str(col.name)
         vals.extend([literal_string(col_name), query_elem.c[col_name]])
 
+    if rank_column is not None:
+        # Ranked results are ordered by rank before primary key
+        vals.extend([literal_string(RANK_KEY), query_elem.c[rank_column]])
+
     return func.jsonb_build_object(
         literal_string("table_name"),
         literal_string(table_name),
@@ -69,6 +69,6 @@ NodeInterface = InterfaceType(
     "NodeInterface",
     description="An object with a nodeId",
     fields={"nodeId": Field(NonNull(ID), description="The global id of the object.", resolve=None)},
-    # Maybe not necessary
-    resolve_type=lambda *args, **kwargs: None,
+    # Rows returned by node lookups carry their type name
+    resolve_type=lambda value, *_: value.get("__typename"),
 )
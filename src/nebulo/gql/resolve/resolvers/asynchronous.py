@@ -1,127 +1,374 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import typing
+from contextlib import asynccontextmanager
+from time import perf_counter
 
 from flupy import flu
 from nebulo.config import Config
-from nebulo.gql.alias import FunctionPayloadType, MutationPayloadType, ObjectType, ResolveInfo, ScalarType
-from nebulo.gql.parse_info import parse_resolve_info
+from nebulo.gql.alias import FunctionPayloadType, MutationPayloadType, ObjectType, ResolveInfo, ScalarType, TableType
+from nebulo.gql.parse_info import ASTNode, is_node_lookup, parse_node_lookup, parse_resolve_info
 from nebulo.gql.relay.node_interface import NodeIdStructure, to_node_id_sql
-from nebulo.gql.resolve.resolvers.claims import build_claims
+from nebulo.gql.resolve.resolvers.claims import build_claims, has_claims
 from nebulo.gql.resolve.transpile.mutation_builder import build_mutation
-from nebulo.gql.resolve.transpile.query_builder import sql_builder, sql_finalize
+from nebulo.gql.resolve.transpile.query_builder import (
+    NODE_LOOKUP_ID,
+    sql_builder,
+    sql_finalize,
+    sql_finalize_node_lookup,
+)
+from nebulo.server.cancellation import remaining_ms
+from nebulo.sql.inspect import get_qualified_table_name
 from nebulo.sql.table_base import TableProtocol
 from sqlalchemy import literal_column, select
+from sqlalchemy.sql import ClauseElement
+
+
+def count_rows(tree: ASTNode, value: typing.Any) -> int:
+    """Number of table rows in *value*, the JSON result of *tree*, including the rows of nested fields"""
+    if isinstance(value, list):
+        return sum(count_rows(tree, x) for x in value)
+    if not isinstance(value, dict):
+        return 0
+    rows = 1 if isinstance(tree.return_type, TableType) else 0
+    return rows + sum(count_rows(subfield, value.get(subfield.alias)) for subfield in tree.fields)
 
 
 async def async_resolver(_, info: ResolveInfo, **kwargs) -> typing.Any:
     """Awaitable GraphQL Entrypoint resolver
 
     Expects:
-        info.context['database'] to contain a databases.Database
+        info.context['database'] to contain a nebulo.server.backend.ExecutionBackend e.g. a databases.Database
+        info.context['timings'] to contain a nebulo.server.timing.RequestTimer
+        info.context['metrics'] to contain a nebulo.server.metrics.NebuloMetrics
+        info.context['slow_query_log'] to contain a nebulo.server.slow_query.SlowQueryLog
+        info.context['json_codec'] to contain a nebulo.server.codec.JSONCodec
+        info.context['function_cache'] to contain a nebulo.server.function_cache.FunctionResultCache
+        info.context['result_cache'] to contain a nebulo.server.result_cache.QueryResultCache
+        info.context['join_strategy'] to contain one of query_builder.JOIN_STRATEGIES
+        info.context['single_flight'] to contain a nebulo.server.single_flight.SingleFlight
+
+    Optionally:
+        info.context['transaction_lock'] to serialize transactions of resolvers sharing a connection
+        info.context['claims_set'] to skip setting claims already set on an enclosing transaction
+        info.context['pending_invalidations'] to defer result cache invalidations until an enclosing transaction commits
+        info.context['role_pinned'] to skip setting the role on connections dedicated to the request's role
+        info.context['deadline'] to contain the perf_counter() time by which statements must complete
     """
     context = info.context
     database = context["database"]
     default_role = context["default_role"]
     jwt_claims = context["jwt_claims"]
+    timings = context["timings"]
+    metrics = context["metrics"]
+    slow_query_log = context["slow_query_log"]
+    json_codec = context["json_codec"]
+    function_cache = context["function_cache"]
+    result_cache = context["result_cache"]
+    join_strategy = context["join_strategy"]
+    single_flight = context["single_flight"]
+    # Results read within an enclosing transaction may include its uncommitted writes
+    pending_invalidations = context.get("pending_invalidations")
+    field_key = info.path.key
+
+    # Phases are reported per root field e.g. "allAccounts.query"
+    def phase(name: str):
+        return timings.phase(f"{field_key}.{name}")
+
+    # Backends able to compile statements ahead of execution, e.g. AsyncpgBackend, report it as a phase
+    compile_query = getattr(database, "compile", None)
+
+    async def execute_timed(method, query, is_read_only: bool):
+        statement = query
+        if compile_query is not None:
+            with phase("compile"):
+                statement = compile_query(query)
+        start = perf_counter()
+        result = await method(query=statement)
+        elapsed = perf_counter() - start
+        timings.record(f"{field_key}.query", elapsed)
+        metrics.observe_query(field_key, elapsed)
+        if slow_query_log.is_slow(elapsed):
+            await slow_query_log.observe(database, info, query, elapsed, explain=is_read_only)
+        return result
+
+    async def fetch_one(query, is_read_only: bool = False):
+        """Execute a statement returning a single row"""
+        row = await execute_timed(database.fetch_one, query, is_read_only)
+        metrics.observe_rows(field_key, 0 if row is None else 1)
+        return row
+
+    async def fetch_json(query, is_read_only: bool = False) -> str:
+        """Execute a statement built by sql_finalize, returning its single json column"""
+        return await execute_timed(database.fetch_val, query, is_read_only)
+
+    def load_json(text: str):
+        """Decode a JSON result returned by the database"""
+        metrics.observe_result_bytes(field_key, len(text))
+        with phase("json_loads"):
+            return json_codec.loads(text)
+
+    def load_rows(text: str, query_tree: ASTNode, key: str):
+        """Decode the JSON result of *query_tree* returned by the database under *key*, counting its table rows"""
+        value = load_json(text)
+        metrics.observe_rows(field_key, count_rows(query_tree, value.get(key)))
+        return value
+
+    @asynccontextmanager
+    async def transaction(read_only: bool) -> typing.AsyncIterator[None]:
+        """Scope the resolver's statements to a transaction with the request's claims set"""
+        claims_stmt = None
+        # Connections dedicated to the request's role have it set for their session
+        set_role = not context.get("role_pinned", False)
+        # Statements may run until the client's deadline
+        deadline = context.get("deadline")
+        statement_timeout = remaining_ms(deadline) if deadline is not None else None
+        if has_claims(jwt_claims, default_role, set_role, statement_timeout) and not context.get("claims_set"):
+            claims_stmt = build_claims(jwt_claims, default_role, set_role, statement_timeout)
+        # An anonymous read is a single statement that commits on its own, sparing the BEGIN and COMMIT round trips
+        autocommit = read_only and claims_stmt is None and pending_invalidations is None
+
+        # Connection checkout and BEGIN
+        acquire_start = perf_counter()
+        async with serialized_transaction(
+            database, context.get("transaction_lock"), autocommit=autocommit, read_only=read_only, setup=claims_stmt
+        ) as claims_applied:
+            timings.record(f"{field_key}.pool_acquire", perf_counter() - acquire_start)
+            if claims_stmt is not None and not claims_applied:
+                with phase("claims"):
+                    await database.execute(claims_stmt)
+            yield
+
+    async def coalesce(execute: typing.Callable[[], typing.Awaitable[typing.Any]]) -> typing.Any:
+        """Share the result of *execute* with concurrent identical reads"""
+        # Resolvers sharing a connection or transaction run alone. Reads with a deadline run alone
+        # as the shared execution would be bounded by the deadline of the first caller
+        if (
+            not single_flight.enabled
+            or pending_invalidations is not None
+            or "transaction_lock" in context
+            or context.get("deadline") is not None
+        ):
+            return await execute()
+        start = perf_counter()
+        is_coalesced, value = await single_flight.run(single_flight.key(info, jwt_claims, default_role), execute)
+        metrics.observe_cache("single_flight", is_coalesced)
+        if is_coalesced:
+            timings.record(f"{field_key}.single_flight", perf_counter() - start)
+        return value
+
+    field_def = info.parent_type.fields[info.field_name]
+    if is_node_lookup(field_def):
+        # node(nodeId:) and nodes(nodeIds:) read all rows of each table in one statement
+        with phase("parse_resolve_info"):
+            node_trees = parse_node_lookup(
+                info.field_nodes[0], field_def, info.schema, info.variable_values, info.fragments
+            )
+
+        async def execute_node_lookup() -> typing.Any:
+            node_rows: typing.List[typing.List[typing.Dict[str, typing.Any]]] = []
+            if node_trees:
+                async with transaction(read_only=True):
+                    with phase("sql_builder"):
+                        query = sql_finalize_node_lookup(node_trees, join_strategy=join_strategy)
+                    node_rows = load_json(await fetch_json(query, is_read_only=True))
+                    metrics.observe_rows(field_key, sum(count_rows(x, rows) for x, rows in zip(node_trees, node_rows)))
+
+            rows_by_node_id = {}
+            for tree, rows in zip(node_trees, node_rows):
+                for row in rows:
+                    node_id = NodeIdStructure.from_dict(row.pop(NODE_LOOKUP_ID))
+                    rows_by_node_id[node_lookup_key(node_id)] = {**row, "__typename": tree.return_type.name}
+
+            nodes = [rows_by_node_id.get(node_lookup_key(x)) for x in kwargs.get("nodeIds", [kwargs.get("nodeId")])]
+            return nodes if "nodeIds" in kwargs else nodes[0]
+
+        node_result = await coalesce(execute_node_lookup)
+        context["result"] = {field_key: node_result}
+        return node_result
+
+    with phase("parse_resolve_info"):
+        tree = parse_resolve_info(info)
+
+    # Immutable function results only depend on their arguments and can skip the database
+    sql_function = getattr(tree.field_def, "sql_function", None)
+    cache_key = None
+    if sql_function is not None and function_cache.enabled:
+        cache_key = function_cache.key(sql_function, tree.args, jwt_claims.get("role", default_role))
+        is_cached, cached_result = function_cache.get(cache_key)
+        metrics.observe_cache("function", is_cached)
+        if is_cached:
+            context["result"] = cached_result
+            return cached_result
+
+    # Reads of tables opted in with @cache can skip the database
+    result_key = None
+    cache_policy = None
+    is_read = not isinstance(tree.return_type, MutationPayloadType)
+    if is_read and result_cache.enabled and pending_invalidations is None:
+        cache_policy = result_cache.policy(tree)
+    if cache_policy is not None:
+        result_key = result_cache.key(info, jwt_claims, default_role)
+        is_cached, cached_result = result_cache.get(result_key)
+        metrics.observe_cache("result", is_cached)
+        if is_cached:
+            context["result"] = cached_result
+            return cached_result
+        # Taken before executing so changes made while the query runs prevent caching a stale result
+        table_versions = result_cache.versions(cache_policy[0])
+
+    is_query = not isinstance(tree.return_type, (FunctionPayloadType, MutationPayloadType))
 
-    tree = parse_resolve_info(info)
-
-    async with database.transaction():
-        # Set claims for transaction
-        if jwt_claims or default_role:
-            claims_stmt = build_claims(jwt_claims, default_role)
-            await database.execute(claims_stmt)
-
-        result: typing.Dict[str, typing.Any]
-
-        if isinstance(tree.return_type, FunctionPayloadType):
-            sql_function = tree.return_type.sql_function
-            function_args = [val for key, val in tree.args["input"].items() if key != "clientMutationId"]
-            func_call = sql_function.to_executable(function_args)
-
-            # Function returning table row
-            if isinstance(sql_function.return_sqla_type, TableProtocol):
-                # Unpack the table row to columns
-                return_sqla_model = sql_function.return_sqla_type
-                core_table = return_sqla_model.__table__
-                func_alias = func_call.alias("named_alias")
-                stmt = select([literal_column(c.name).label(c.name) for c in core_table.c]).select_from(func_alias)  # type: ignore
-                stmt_alias = stmt.alias()
-                node_id_stmt = select([to_node_id_sql(return_sqla_model, stmt_alias).label("nodeId")]).select_from(stmt_alias)  # type: ignore
-                stmt_result = await database.fetch_one(query=node_id_stmt)
+    async def execute_tree() -> typing.Any:
+        async with transaction(read_only=is_query):
+            result: typing.Dict[str, typing.Any]
+
+            if isinstance(tree.return_type, FunctionPayloadType):
+                sql_function = tree.return_type.sql_function
+                function_args = [val for key, val in tree.args["input"].items() if key != "clientMutationId"]
+                func_call = sql_function.to_executable(function_args)
+
+                # Function returning table row
+                if isinstance(sql_function.return_sqla_type, TableProtocol):
+                    # Unpack the table row to columns
+                    return_sqla_model = sql_function.return_sqla_type
+                    core_table = return_sqla_model.__table__
+                    func_alias = func_call.alias("named_alias")
+                    stmt = select([literal_column(c.name).label(c.name) for c in core_table.c]).select_from(func_alias)  # type: ignore
+                    stmt_alias = stmt.alias()
+                    node_id_stmt = select([to_node_id_sql(return_sqla_model, stmt_alias).label("nodeId")]).select_from(stmt_alias)  # type: ignore
+                    stmt_result = await fetch_one(node_id_stmt)
+                    row = json.loads(stmt_result["nodeId"])
+                    node_id = NodeIdStructure.from_dict(row)
+
+                    # Add nodeId to AST and query
+                    query_tree = next(iter([x for x in tree.fields if x.name == "result"]), None)
+                    if query_tree is not None:
+                        query_tree.args["nodeId"] = node_id
+                        with phase("sql_builder"):
+                            base_query = sql_builder(query_tree, join_strategy=join_strategy)
+                            query = sql_finalize(query_tree.alias, base_query)
+                        coro_rvf_result: str = await fetch_json(query)
+                        stmt_result = load_rows(coro_rvf_result, query_tree, query_tree.alias)
+                    else:
+                        stmt_result = {}
+                else:
+                    stmt = select([func_call.label("result")])
+                    stmt_result = await fetch_one(stmt)
+
+                maybe_mutation_id = tree.args["input"].get("clientMutationId")
+                mutation_id_alias = next(
+                    iter([x.alias for x in tree.fields if x.name == "clientMutationId"]),
+                    "clientMutationId",
+                )
+                result = {tree.alias: {**stmt_result, **{mutation_id_alias: maybe_mutation_id}}}
+
+            elif isinstance(tree.return_type, MutationPayloadType):
+                with phase("sql_builder"):
+                    stmt = build_mutation(tree)
+                stmt_result = await fetch_one(stmt)
                 row = json.loads(stmt_result["nodeId"])
                 node_id = NodeIdStructure.from_dict(row)
 
-                # Add nodeId to AST and query
-                query_tree = next(iter([x for x in tree.fields if x.name == "result"]), None)
-                if query_tree is not None:
+                maybe_mutation_id = tree.args["input"].get("clientMutationId")
+                mutation_id_alias = next(
+                    iter([x.alias for x in tree.fields if x.name == "clientMutationId"]),
+                    "clientMutationId",
+                )
+                node_id_alias = next(iter([x.alias for x in tree.fields if x.name == "nodeId"]), "nodeId")
+                output_row_name: str = Config.table_name_mapper(tree.return_type.sqla_model)
+                query_tree = next(iter([x for x in tree.fields if x.name == output_row_name]), None)
+                sql_result = {}
+                if query_tree:
+                    # Set the nodeid of the newly created record as an arg
                     query_tree.args["nodeId"] = node_id
-                    base_query = sql_builder(query_tree)
-                    query = sql_finalize(query_tree.alias, base_query)
-                    coro_rvf_result: str = (await database.fetch_one(query=query))["json"]
-                    stmt_result = json.loads(coro_rvf_result)
+                    with phase("sql_builder"):
+                        base_query = sql_builder(query_tree, join_strategy=join_strategy)
+                        query = sql_finalize(query_tree.alias, base_query)
+                    coro_result: str = await fetch_json(query)
+                    sql_result = load_rows(coro_result, query_tree, query_tree.alias)
+                result = {
+                    tree.alias: {**sql_result, mutation_id_alias: maybe_mutation_id},
+                    mutation_id_alias: maybe_mutation_id,
+                    node_id_alias: node_id,
+                }
+
+            elif isinstance(tree.return_type, (ObjectType, ScalarType)):
+                with phase("sql_builder"):
+                    base_query = sql_builder(tree, join_strategy=join_strategy)
+                    query = sql_finalize(tree.name, base_query)
+
+                str_result: str = await fetch_json(query, is_read_only=True)
+
+                query_json_result = load_rows(str_result, tree, tree.name)
+
+                if isinstance(tree.return_type, ScalarType):
+                    # If its a scalar, unwrap the top level name
+                    result = flu(query_json_result.values()).first(None)
                 else:
-                    stmt_result = {}
-            else:
-                stmt = select([func_call.label("result")])
-                stmt_result = await database.fetch_one(query=stmt)
+                    result = query_json_result
 
-            maybe_mutation_id = tree.args["input"].get("clientMutationId")
-            mutation_id_alias = next(
-                iter([x.alias for x in tree.fields if x.name == "clientMutationId"]),
-                "clientMutationId",
-            )
-            result = {tree.alias: {**stmt_result, **{mutation_id_alias: maybe_mutation_id}}}
-
-        elif isinstance(tree.return_type, MutationPayloadType):
-            stmt = build_mutation(tree)
-            stmt_result = await database.fetch_one(query=stmt)
-            row = json.loads(stmt_result["nodeId"])
-            node_id = NodeIdStructure.from_dict(row)
-
-            maybe_mutation_id = tree.args["input"].get("clientMutationId")
-            mutation_id_alias = next(
-                iter([x.alias for x in tree.fields if x.name == "clientMutationId"]),
-                "clientMutationId",
-            )
-            node_id_alias = next(iter([x.alias for x in tree.fields if x.name == "nodeId"]), "nodeId")
-            output_row_name: str = Config.table_name_mapper(tree.return_type.sqla_model)
-            query_tree = next(iter([x for x in tree.fields if x.name == output_row_name]), None)
-            sql_result = {}
-            if query_tree:
-                # Set the nodeid of the newly created record as an arg
-                query_tree.args["nodeId"] = node_id
-                base_query = sql_builder(query_tree)
-                query = sql_finalize(query_tree.alias, base_query)
-                coro_result: str = (await database.fetch_one(query=query))["json"]
-                sql_result = json.loads(coro_result)
-            result = {
-                tree.alias: {**sql_result, mutation_id_alias: maybe_mutation_id},
-                mutation_id_alias: maybe_mutation_id,
-                node_id_alias: node_id,
-            }
-
-        elif isinstance(tree.return_type, (ObjectType, ScalarType)):
-            base_query = sql_builder(tree)
-            query = sql_finalize(tree.name, base_query)
-
-            query_coro = database.fetch_one(query=query)
-            coro_result = await query_coro
-            str_result: str = coro_result["json"]  # type: ignore
-
-            query_json_result = json.loads(str_result)
-
-            if isinstance(tree.return_type, ScalarType):
-                # If its a scalar, unwrap the top level name
-                result = flu(query_json_result.values()).first(None)
             else:
-                result = query_json_result
+                raise Exception("sql builder could not handle return type")
+        return result
+
+    result = await (coalesce(execute_tree) if is_query else execute_tree())
+
+    if cache_key is not None:
+        function_cache.set(cache_key, result)
 
+    if result_key is not None and cache_policy is not None:
+        tables, ttl = cache_policy
+        result_cache.set(result_key, result, tables, table_versions, ttl)
+
+    if not is_read:
+        # Functions may write to any table
+        modified_tables = (
+            None
+            if isinstance(tree.return_type, FunctionPayloadType)
+            else [get_qualified_table_name(tree.return_type.sqla_model)]
+        )
+        if pending_invalidations is not None:
+            pending_invalidations.append(modified_tables)
         else:
-            raise Exception("sql builder could not handle return type")
+            result_cache.invalidate(modified_tables)
 
     # Stash result on context to enable dumb resolvers to not fail
     context["result"] = result
     return result
+
+
+def node_lookup_key(node_id: NodeIdStructure) -> typing.Tuple[str, str]:
+    return node_id.table_name, json.dumps(node_id.values, sort_keys=True, default=str)
+
+
+@asynccontextmanager
+async def serialized_transaction(
+    database,
+    lock: typing.Optional[asyncio.Lock],
+    autocommit: bool = False,
+    read_only: bool = False,
+    setup: typing.Optional[ClauseElement] = None,
+) -> typing.AsyncIterator[bool]:
+    """Open a transaction, first acquiring *lock* if resolvers share a connection
+
+    With *autocommit* no transaction is opened and each statement commits on its own. Backends
+    supporting transaction options, e.g. AsyncpgBackend, begin a READ ONLY transaction if *read_only*
+    and execute *setup* in the same round trip as BEGIN. Yields whether *setup* was executed
+    """
+    if lock is not None:
+        await lock.acquire()
+    try:
+        if autocommit:
+            yield False
+        elif getattr(database, "supports_transaction_options", False):
+            async with database.transaction(read_only=read_only, setup=setup):
+                yield setup is not None
+        else:
+            async with database.transaction():
+                yield False
+    finally:
+        if lock is not None:
+            lock.release()
@@ -4,9 +4,33 @@ from sqlalchemy import Text, func, literal, select
 from sqlalchemy.sql.selectable import Select
 
 
-def build_claims(jwt_claims: typing.Dict[str, typing.Any], default_role: typing.Optional[str]) -> Select:
+def get_role(jwt_claims: typing.Dict[str, typing.Any], default_role: typing.Optional[str]) -> typing.Optional[str]:
+    """The SQL role a request runs as, its JWT role claim or *default_role*"""
+    role = jwt_claims.get("role", default_role)
+    return str(role) if role is not None else None
+
+
+def has_claims(
+    jwt_claims: typing.Dict[str, typing.Any],
+    default_role: typing.Optional[str],
+    set_role: bool = True,
+    statement_timeout: typing.Optional[int] = None,
+) -> bool:
+    """Whether build_claims has any setting to emit"""
+    return bool(jwt_claims) or (set_role and default_role is not None) or statement_timeout is not None
+
+
+def build_claims(
+    jwt_claims: typing.Dict[str, typing.Any],
+    default_role: typing.Optional[str],
+    set_role: bool = True,
+    statement_timeout: typing.Optional[int] = None,
+) -> Select:
     """Emit statement to set 'jwt.claims.<key>' for each claim in claims dict
     and a 'role'
+
+    The role is not set if *set_role* is False, e.g. when the connection's session already has it.
+    A *statement_timeout* in milliseconds bounds each statement of the transaction
     """
     # Setting local variables an not be done in prepared statement
     # since JWT claims are signed, literal binds should be ok
@@ -21,22 +45,18 @@ def build_claims(jwt_claims: typing.Dict[str, typing.Any], default_role: typing.
         )
         for claim_key, claim_value in jwt_claims.items()
     ]
-    # Set all role claim if exists from jwt
-    if role_key in jwt_claims:
+    # Set the role claim if exists from jwt, or the default role from config if provided
+    role = get_role(jwt_claims, default_role)
+    if set_role and role is not None:
         claims.append(
             func.set_config(
                 func.cast(role_key, Text()),
-                func.cast(str(jwt_claims[role_key]), Text()),
+                func.cast(role, Text()),
                 True,
             )
         )
-    # Set default role from config if provided
-    elif default_role is not None:
+    if statement_timeout is not None:
         claims.append(
-            func.set_config(
-                func.cast(role_key, Text()),
-                func.cast(str(default_role), Text()),
-                True,
-            )
+            func.set_config(func.cast("statement_timeout", Text()), func.cast(str(statement_timeout), Text()), True)
         )
     return select(claims)
@@ -2,38 +2,97 @@
 # mypy: ignore-errors
 from __future__ import annotations
 
+import hashlib
 import typing
-from functools import lru_cache
+from functools import lru_cache, reduce
 
 from flupy import flu
 from nebulo.config import Config
-from nebulo.gql.alias import CompositeType, ConnectionType, EnumType, ScalarType, TableType
+from nebulo.gql.alias import AggregatesType, CompositeType, ConnectionType, EnumType, ScalarType, TableType
 from nebulo.gql.parse_info import ASTNode
-from nebulo.gql.relay.cursor import to_cursor_sql
+from nebulo.gql.relay.cursor import RANK_KEY, to_cursor_sql
 from nebulo.gql.relay.node_interface import ID, to_node_id_sql
 from nebulo.sql.inspect import get_columns, get_primary_key_columns, get_relationships, get_table_name
-from nebulo.sql.sanitize import secure_random_string
+from nebulo.sql.search import to_search_clause, to_search_rank
 from nebulo.sql.table_base import TableProtocol
-from sqlalchemy import Column, Integer, and_, asc, cast, desc, func, literal, literal_column, select, tuple_
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import (
+    Column,
+    Integer,
+    and_,
+    asc,
+    cast,
+    desc,
+    func,
+    literal,
+    literal_column,
+    or_,
+    select,
+    true,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import JSONB, REAL, aggregate_order_by
 from sqlalchemy.orm import RelationshipProperty
 from sqlalchemy.sql import Alias, Select
 from sqlalchemy.sql.elements import BinaryExpression, Label
+from sqlalchemy.sql.selectable import Lateral
 
 
-def sql_builder(tree: ASTNode, parent_name: typing.Optional[str] = None) -> Alias:
+# Key of the nodeId added to each row read by a node lookup
+NODE_LOOKUP_ID = "__nodeId"
+
+# Column of the relevance of each row in ranked searches
+SEARCH_RANK = "_search_rank"
+
+# How nested relationships are read. "subquery" selects a correlated scalar subquery for each
+# relationship, "lateral" joins each relationship with LEFT JOIN LATERAL and "auto" joins
+# connections nested under blocks of many rows laterally, and reads the rest with subqueries
+JOIN_STRATEGIES = ("subquery", "lateral", "auto")
+
+
+def to_block_name(field: ASTNode) -> str:
+    """Name of the block reading *field*, unique within its statement
+
+    Names are derived from the field's position in the query so the same query always builds
+    the same SQL text, letting connections reuse their prepared statements
+    """
+    path = []
+    node = field
+    while node is not None:
+        parent = node.parent
+        position = next((ix for ix, x in enumerate(parent.fields) if x is node), 0) if parent is not None else 0
+        path.append(f"{node.alias}.{position}")
+        node = parent
+    digest = hashlib.sha1("/".join(reversed(path)).encode()).hexdigest()
+    return "b" + digest[:10]
+
+
+def sql_builder(
+    tree: ASTNode,
+    parent_name: typing.Optional[str] = None,
+    join_strategy: str = "subquery",
+    parent_ref: typing.Optional[Alias] = None,
+) -> Alias:
+    """Build the block reading *tree*
+
+    Nested under a parent block named *parent_name*, the block is correlated to the parent
+    through the block's name, or through the columns of *parent_ref* when it is given
+    """
+    if join_strategy not in JOIN_STRATEGIES:
+        raise ValueError(f"Unknown join strategy {join_strategy}. Expected one of {', '.join(JOIN_STRATEGIES)}")
+
     return_type = tree.return_type
 
     if isinstance(return_type, TableType):
-        return row_block(field=tree, parent_name=parent_name)
+        return row_block(field=tree, parent_name=parent_name, join_strategy=join_strategy, parent_ref=parent_ref)
 
     if isinstance(return_type, ConnectionType):
-        return connection_block(field=tree, parent_name=parent_name)
+        return connection_block(field=tree, parent_name=parent_name, join_strategy=join_strategy, parent_ref=parent_ref)
 
     # SQL Function handler for immutable functions
-    if hasattr(return_type, "sql_function"):
+    sql_function = getattr(tree.field_def, "sql_function", None)
+    if sql_function is not None:
         # Immutable function
-        sql_func_callable = return_type.sql_function.to_executable(tree.args.values())
+        sql_func_callable = sql_function.to_executable(tree.args.values())
         return select([sql_func_callable.label("ret_json")]).alias()
 
     raise Exception("sql builder could not match return type")
@@ -72,6 +131,19 @@ def to_join_clause(field: ASTNode, parent_block_name: str) -> typing.List[Binary
     return join_clause
 
 
+def to_lateral_join_clause(field: ASTNode, parent_ref: Alias) -> typing.List[BinaryExpression]:
+    """Join clause referencing the columns of the parent block's rows, for blocks joined laterally"""
+    parent_field = field.parent
+    assert parent_field is not None
+    relation_from_parent = field_name_to_relationship(parent_field.return_type.sqla_model, field.name)
+    local_table = field.return_type.sqla_model.__table__
+
+    return [
+        parent_ref.c[parent_col.name] == local_table.c[local_col.name]
+        for parent_col, local_col in relation_from_parent.local_remote_pairs
+    ]
+
+
 def to_pkey_clause(field: ASTNode, pkey_eq: typing.List[str]) -> typing.List[BinaryExpression]:
     local_table = field.return_type.sqla_model
     local_table_name = get_table_name(field.return_type.sqla_model)
@@ -86,8 +158,9 @@ def to_pkey_clause(field: ASTNode, pkey_eq: typing.List[str]) -> typing.List[Bin
 def to_limit(field: ASTNode) -> int:
     args = field.args
     default = 20
-    first = int(args.get("first", default))
-    last = int(args.get("last", default))
+    # first and last may be explicitly null
+    first = int(args["first"]) if args.get("first") is not None else default
+    last = int(args["last"]) if args.get("last") is not None else default
     limit = min(first, last, default)
     return limit
 
@@ -109,14 +182,81 @@ def to_conditions_clause(field: ASTNode) -> typing.List[BinaryExpression]:
     return res
 
 
-def build_relationship(field: ASTNode, block_name: str) -> Label:
-    return sql_builder(field, block_name).as_scalar().label(field.alias)
+def use_lateral(field: ASTNode, join_strategy: str, many_parents: bool) -> bool:
+    """Should the relationship *field* be joined laterally, rather than read with a scalar subquery
+
+    *many_parents* is whether the parent block reads more than one row
+    """
+    if join_strategy == "auto":
+        # A connection's pagination pipeline runs for every parent row. Joined laterally the
+        # planner sees the join and can reorder it. Single rows are cheap index lookups either way
+        return many_parents and isinstance(field.return_type, ConnectionType)
+    return join_strategy == "lateral"
+
+
+def build_relationship(
+    field: ASTNode, parent_ref: Alias, join_strategy: str = "subquery", many_parents: bool = False
+) -> typing.Tuple[Label, typing.Optional[Lateral]]:
+    """Select the relationship *field* of the parent block's rows
+
+    Returns the selected column and, if the relationship is joined laterally, the block to join
+    """
+    if use_lateral(field, join_strategy, many_parents):
+        block = sql_builder(field, parent_ref.name, join_strategy, parent_ref=parent_ref).lateral(
+            to_block_name(field) + "_lateral"
+        )
+        return block.c.ret_json.label(field.alias), block
+    return sql_builder(field, parent_ref.name, join_strategy).as_scalar().label(field.alias), None
+
+
+def join_laterals(from_clause, laterals: typing.List[Lateral]):
+    """LEFT JOIN each of *laterals* to *from_clause*"""
+    for lateral in laterals:
+        from_clause = from_clause.outerjoin(lateral, true())
+    return from_clause
 
 
 def literal_string(text):
     return literal_column(f"'{text}'")
 
 
+# PostgreSQL functions accept at most 100 arguments
+MAX_JSONB_OBJECT_PAIRS = 50
+
+
+def to_jsonb_object(pairs: typing.List[typing.Tuple[typing.Any, typing.Any]]):
+    """jsonb_build_object of key, value *pairs*, concatenating objects when there are too many for one call"""
+    if not pairs:
+        return func.jsonb_build_object()
+    chunks = [pairs[ix : ix + MAX_JSONB_OBJECT_PAIRS] for ix in range(0, len(pairs), MAX_JSONB_OBJECT_PAIRS)]
+    objects = [func.jsonb_build_object(*flu(chunk).flatten().collect()) for chunk in chunks]
+    return reduce(lambda left, right: left.op("||", return_type=JSONB)(right), objects)
+
+
+def to_core_columns(sqla_model: TableProtocol, fields: typing.List[ASTNode]) -> typing.List[Column]:
+    """Columns of *sqla_model* needed to select *fields*
+
+    The primary key, for nodeIds, cursors and ordering, the columns selected and the columns
+    joining to selected relationships. Unselected columns are never read, so large values are not detoasted
+    """
+    column_names = {col.name for col in get_primary_key_columns(sqla_model)}
+    for subfield in fields:
+        return_type = subfield.return_type
+        if return_type == ID:
+            continue
+        if isinstance(return_type, (ScalarType, CompositeType, EnumType)):
+            column_names.add(field_name_to_column(sqla_model, subfield.name).name)
+        elif isinstance(return_type, (TableType, ConnectionType)):
+            relationship = field_name_to_relationship(sqla_model, subfield.name)
+            column_names.update(local_col.name for local_col, _ in relationship.local_remote_pairs)
+        elif isinstance(return_type, AggregatesType):
+            column_names.update(subfield.args.get("groupBy") or [])
+            # Keys are only read from the groupBy columns
+            for aggregate in (x for x in subfield.fields if x.name != "keys"):
+                column_names.update(field_name_to_column(sqla_model, x.name).name for x in aggregate.fields)
+    return [col for col in sqla_model.__table__.c if col.name in column_names]
+
+
 def sql_finalize(return_name: str, expr: Alias) -> Select:
     final = select([func.jsonb_build_object(literal_string(return_name), expr.c.ret_json).label("json")]).select_from(
         expr
@@ -124,49 +264,85 @@ def sql_finalize(return_name: str, expr: Alias) -> Select:
     return final
 
 
-def row_block(field: ASTNode, parent_name: typing.Optional[str] = None) -> Alias:
+def sql_finalize_node_lookup(trees: typing.List[ASTNode], join_strategy: str = "subquery") -> Select:
+    """Read the rows of several node lookup trees in one statement, returning a JSON array of row arrays"""
+    blocks = [sql_builder(tree, join_strategy=join_strategy) for tree in trees]
+    return select([func.jsonb_build_array(*[select([x.c.ret_json]).as_scalar() for x in blocks]).label("json")])
+
+
+def row_block(
+    field: ASTNode,
+    parent_name: typing.Optional[str] = None,
+    join_strategy: str = "subquery",
+    parent_ref: typing.Optional[Alias] = None,
+) -> Alias:
     return_type = field.return_type
     sqla_model = return_type.sqla_model
     core_model = sqla_model.__table__
 
-    block_name = secure_random_string()
-    if parent_name is None:
+    block_name = to_block_name(field)
+    node_ids = field.args.get("nodeIds") if parent_name is None else None
+    if node_ids is not None:
+        # Batched node lookup reads every row in one block
+        pkey_cols = get_primary_key_columns(sqla_model)
+        pkey_values = [tuple(node_id.values[str(col.name)] for col in pkey_cols) for node_id in node_ids]
+        pkey_clause = [tuple_(*pkey_cols).in_(pkey_values)]
+        join_clause = [True]
+    elif parent_name is None:
         # If there is no parent, nodeId is mandatory
         pkey_cols = get_primary_key_columns(sqla_model)
         node_id = field.args["nodeId"]
         pkey_clause = [col == node_id.values[str(col.name)] for col in pkey_cols]
         join_clause = [True]
+    elif parent_ref is not None:
+        join_clause = to_lateral_join_clause(field, parent_ref)
+        pkey_clause = [True]
     else:
         # If there is a parent no arguments are accepted
         join_clause = to_join_clause(field, parent_name)
         pkey_clause = [True]
 
-    core_model_ref = (select(core_model.c).where(and_(*pkey_clause, *join_clause))).alias(block_name)
+    core_columns = to_core_columns(sqla_model, field.fields)
+    core_model_select = select(core_columns).where(and_(*pkey_clause, *join_clause))
+    if parent_ref is not None:
+        core_model_select = core_model_select.correlate(parent_ref)
+    core_model_ref = core_model_select.alias(block_name)
 
     select_clause = []
+    laterals = []
     for subfield in field.fields:
 
         if subfield.return_type == ID:
-            elem = select([to_node_id_sql(sqla_model, core_model_ref)]).label(subfield.alias)
+            # A scalar subquery is not correlated to the block, reading every row of node lookups and lateral joins
+            elem = to_node_id_sql(sqla_model, core_model_ref).label(subfield.alias)
             select_clause.append(elem)
         elif isinstance(subfield.return_type, (ScalarType, CompositeType, EnumType)):
             col_name = field_name_to_column(sqla_model, subfield.name).name
             elem = core_model_ref.c[col_name].label(subfield.alias)
             select_clause.append(elem)
         else:
-            elem = build_relationship(subfield, block_name)
+            elem, lateral = build_relationship(
+                subfield, core_model_ref, join_strategy, many_parents=node_ids is not None
+            )
             select_clause.append(elem)
+            if lateral is not None:
+                laterals.append(lateral)
+
+    if node_ids is not None:
+        # Identifies each row so results can be returned in the order requested
+        select_clause.append(to_node_id_sql(sqla_model, core_model_ref).label(NODE_LOOKUP_ID))
 
     block = (
-        select(
-            [
-                func.jsonb_build_object(
-                    *flu(select_clause).map(lambda x: (literal_string(x.key), x)).flatten().collect()
-                ).label("ret_json")
-            ]
-        ).select_from(core_model_ref)
+        select([to_jsonb_object([(literal_string(x.key), x) for x in select_clause]).label("ret_json")]).select_from(
+            join_laterals(core_model_ref, laterals)
+        )
     ).alias()
 
+    if node_ids is not None:
+        block = select(
+            [func.coalesce(func.jsonb_agg(block.c.ret_json), func.cast(literal("[]"), JSONB())).label("ret_json")]
+        ).alias()
+
     return block
 
 
@@ -175,6 +351,14 @@ def check_has_total(field: ASTNode) -> bool:
     return any(x.name in "totalCount" for x in field.fields)
 
 
+def get_subfield(field: ASTNode, path: typing.List[str]) -> typing.Optional[ASTNode]:
+    """The first subfield at *path* of names, or None if it is not selected"""
+    for subfield in field.fields:
+        if subfield.name == path[0]:
+            return subfield if len(path) == 1 else get_subfield(subfield, path[1:])
+    return None
+
+
 def get_edge_node_fields(field):
     """Returns connection.edge.node fields"""
     for cfield in field.fields:
@@ -191,13 +375,20 @@ TRUE = literal_column("true")
 FALSE = literal_column("false")
 
 
-def connection_block(field: ASTNode, parent_name: typing.Optional[str]) -> Alias:
+def connection_block(
+    field: ASTNode,
+    parent_name: typing.Optional[str],
+    join_strategy: str = "subquery",
+    parent_ref: typing.Optional[Alias] = None,
+) -> Alias:
     return_type = field.return_type
     sqla_model = return_type.sqla_model
 
-    block_name = secure_random_string()
+    block_name = to_block_name(field)
     if parent_name is None:
         join_conditions = [True]
+    elif parent_ref is not None:
+        join_conditions = to_lateral_join_clause(field, parent_ref)
     else:
         join_conditions = to_join_clause(field, parent_name)
 
@@ -210,20 +401,25 @@ def connection_block(field: ASTNode, parent_name: typing.Optional[str]) -> Alias
 
     totalCount_alias = field.get_subfield_alias(["totalCount"])
 
-    edges_alias = field.get_subfield_alias(["edges"])
-    node_alias = field.get_subfield_alias(["edges", "node"])
-    cursor_alias = field.get_subfield_alias(["edges", "cursor"])
-
-    pageInfo_alias = field.get_subfield_alias(["pageInfo"])
-    hasNextPage_alias = field.get_subfield_alias(["pageInfo", "hasNextPage"])
-    hasPreviousPage_alias = field.get_subfield_alias(["pageInfo", "hasPreviousPage"])
-    startCursor_alias = field.get_subfield_alias(["pageInfo", "startCursor"])
-    endCursor_alias = field.get_subfield_alias(["pageInfo", "endCursor"])
+    # Only the parts of the pipeline the selection needs are built
+    edges_field = get_subfield(field, ["edges"])
+    page_info_field = get_subfield(field, ["pageInfo"])
+    page_info_names = {x.name for x in getattr(page_info_field, "fields", [])}
+    # hasPreviousPage is known from the arguments, so only these read the page's rows
+    needs_page = edges_field is not None or bool(page_info_names & {"hasNextPage", "startCursor", "endCursor"})
+    needs_has_next_page = get_subfield(field, ["pageInfo", "hasNextPage"]) is not None
 
     # Apply Filters
     core_model = sqla_model.__table__
-    core_model_ref = (
-        select(core_model.c)
+    search = field.args.get("search")
+    search_conditions = [to_search_clause(sqla_model, core_model, search)] if search is not None else []
+    # Ranked searches order by relevance, then primary key
+    is_ranked = search is not None and bool(field.args.get("rankSearch"))
+    rank_selects = [to_search_rank(sqla_model, core_model, search).label(SEARCH_RANK)] if is_ranked else []
+    aggregate_fields = [x for x in field.fields if isinstance(x.return_type, AggregatesType)]
+    core_columns = to_core_columns(sqla_model, [*get_edge_node_fields(field), *aggregate_fields])
+    core_model_select = (
+        select([*core_columns, *rank_selects])
         .select_from(core_model)
         .where(
             and_(
@@ -231,26 +427,14 @@ def connection_block(field: ASTNode, parent_name: typing.Optional[str]) -> Alias
                 *join_conditions,
                 # Conditions
                 *filter_conditions,
+                # Full-text search
+                *search_conditions,
             )
         )
-    ).alias(block_name)
-
-    new_edge_node_selects = []
-    new_relation_selects = []
-
-    for subfield in get_edge_node_fields(field):
-        # Does anything other than NodeID go here?
-        if subfield.return_type == ID:
-            # elem = select([to_node_id_sql(sqla_model, core_model_ref)]).label(subfield.alias)
-            elem = to_node_id_sql(sqla_model, core_model_ref).label(subfield.alias)
-            new_edge_node_selects.append(elem)
-        elif isinstance(subfield.return_type, (ScalarType, CompositeType, EnumType)):
-            col_name = field_name_to_column(sqla_model, subfield.name).name
-            elem = core_model_ref.c[col_name].label(subfield.alias)
-            new_edge_node_selects.append(elem)
-        else:
-            elem = build_relationship(subfield, block_name)
-            new_relation_selects.append(elem)
+    )
+    if parent_ref is not None:
+        core_model_select = core_model_select.correlate(parent_ref)
+    core_model_ref = core_model_select.alias(block_name)
 
     # Setup Pagination
     args = field.args
@@ -284,83 +468,229 @@ def connection_block(field: ASTNode, parent_name: typing.Optional[str]) -> Alias
         pagination_clause = tuple_(*[core_model_ref.c[col.name] for col in pkey_cols]).op(
             ">" if after_cursor is not None else "<"
         )(tuple_(*[cursor_values[col.name] for col in pkey_cols]))
+
+        if is_ranked:
+            if RANK_KEY not in cursor_values:
+                raise ValueError("Cursor is not from a ranked search")
+            # Compared as real, the type of ts_rank, so ties with the cursor's row are detected
+            cursor_rank = cast(cursor_values[RANK_KEY], REAL())
+            rank_column = core_model_ref.c[SEARCH_RANK]
+            pagination_clause = or_(
+                rank_column < cursor_rank if after_cursor is not None else rank_column > cursor_rank,
+                and_(rank_column == cursor_rank, pagination_clause),
+            )
     else:
         pagination_clause = True
 
-    order_clause = [asc(core_model_ref.c[col.name]) for col in get_primary_key_columns(sqla_model)]
-    reverse_order_clause = [desc(core_model_ref.c[col.name]) for col in get_primary_key_columns(sqla_model)]
+    def to_order_clauses(ref: Alias) -> typing.Tuple[typing.List, typing.List]:
+        order_clause = [asc(ref.c[col.name]) for col in get_primary_key_columns(sqla_model)]
+        reverse_order_clause = [desc(ref.c[col.name]) for col in get_primary_key_columns(sqla_model)]
+        if is_ranked:
+            order_clause = [desc(ref.c[SEARCH_RANK]), *order_clause]
+            reverse_order_clause = [asc(ref.c[SEARCH_RANK]), *reverse_order_clause]
+        return order_clause, reverse_order_clause
+
+    order_clause, reverse_order_clause = to_order_clauses(core_model_ref)
+    page_order_clause = reverse_order_clause if is_page_before else order_clause
+
+    # Rows of the page, before their relationships are read
+    page_ref = core_model_ref
+    if any(
+        use_lateral(subfield, join_strategy, many_parents=True)
+        for subfield in get_edge_node_fields(field)
+        if isinstance(subfield.return_type, (TableType, ConnectionType))
+    ):
+        # Relationships are joined to the page's rows only, rather than to every row before the limit
+        page_ref = (
+            select(core_model_ref.c)
+            .where(pagination_clause)
+            .order_by(*page_order_clause, *order_clause)
+            .limit(cast(limit + 1 if needs_has_next_page else limit, Integer()))
+        ).alias(block_name + "_page")
+        pagination_clause = True
+        order_clause, reverse_order_clause = to_order_clauses(page_ref)
+        page_order_clause = reverse_order_clause if is_page_before else order_clause
 
-    total_block = (
-        select([func.count(ONE).label("total_count")]).select_from(core_model_ref.alias()).where(has_total)
-    ).alias(block_name + "_total")
+    new_edge_node_selects = []
+    new_relation_selects = []
+    laterals = []
 
-    node_id_sql = to_node_id_sql(sqla_model, core_model_ref)
-    cursor_sql = to_cursor_sql(sqla_model, core_model_ref)
+    for subfield in get_edge_node_fields(field):
+        # Does anything other than NodeID go here?
+        if subfield.return_type == ID:
+            elem = to_node_id_sql(sqla_model, page_ref).label(subfield.alias)
+            new_edge_node_selects.append(elem)
+        elif isinstance(subfield.return_type, (ScalarType, CompositeType, EnumType)):
+            col_name = field_name_to_column(sqla_model, subfield.name).name
+            elem = page_ref.c[col_name].label(subfield.alias)
+            new_edge_node_selects.append(elem)
+        else:
+            elem, lateral = build_relationship(subfield, page_ref, join_strategy, many_parents=True)
+            new_relation_selects.append(elem)
+            if lateral is not None:
+                laterals.append(lateral)
 
-    # Select the right stuff
-    p1_block = (
-        select(
-            [
-                *new_edge_node_selects,
-                *new_relation_selects,
-                # For internal Use
-                node_id_sql.label("_nodeId"),
-                cursor_sql.label("_cursor"),
-                # For internal Use
-                func.row_number().over().label("_row_num"),
-            ]
+    pairs: typing.List[typing.Tuple[typing.Any, typing.Any]] = []
+    from_blocks = []
+
+    if has_total:
+        total_block = (select([func.count(ONE).label("total_count")]).select_from(core_model_ref.alias())).alias(
+            block_name + "_total"
+        )
+        from_blocks.append(total_block)
+        pairs.append((literal_string(totalCount_alias), total_block.c.total_count))
+
+    if needs_page:
+        page_block = page_summary_block(
+            field,
+            block_name,
+            page_ref,
+            selects=[*new_edge_node_selects, *new_relation_selects],
+            from_clause=join_laterals(page_ref, laterals),
+            pagination_clause=pagination_clause,
+            order_clause=page_order_clause,
+            limit=limit,
+            rank_column=SEARCH_RANK if is_ranked else None,
         )
-        .select_from(core_model_ref)
+        from_blocks.append(page_block)
+
+        if edges_field is not None:
+            pairs.append(
+                (
+                    literal_string(edges_field.alias),
+                    func.coalesce(page_block.c.edges, func.cast(literal("[]"), JSONB())),
+                )
+            )
+
+    if page_info_field is not None:
+        page_info_pairs = []
+        for subfield in page_info_field.fields:
+            if subfield.name == "hasNextPage":
+                value = page_block.c.has_next_page
+            elif subfield.name == "hasPreviousPage":
+                value = TRUE if is_page_after else FALSE
+            elif subfield.name == "startCursor":
+                value = page_block.c.cursors[ONE]
+            elif subfield.name == "endCursor":
+                value = page_block.c.cursors[func.array_upper(page_block.c.cursors, ONE)]
+            else:
+                continue
+            page_info_pairs.append((literal_string(subfield.alias), value))
+        pairs.append((literal_string(page_info_field.alias), to_jsonb_object(page_info_pairs)))
+
+    # Aggregates ignore pagination, like totalCount
+    for subfield in field.fields:
+        if isinstance(subfield.return_type, AggregatesType):
+            pairs.append((literal_string(subfield.alias), aggregates_block(subfield, core_model_ref)))
+
+    final = select([to_jsonb_object(pairs).label("ret_json")])
+    for from_block in from_blocks:
+        final = final.select_from(from_block)
+    return final.alias()
+
+
+def page_summary_block(
+    field: ASTNode,
+    block_name: str,
+    page_ref: Alias,
+    selects: typing.List[Label],
+    from_clause,
+    pagination_clause,
+    order_clause: typing.List,
+    limit: int,
+    rank_column: typing.Optional[str],
+) -> Alias:
+    """One row summarizing a connection's page, with only the columns its selection needs
+
+    edges, the page's edges as a JSON array
+    cursors, an array of the page's cursors, if startCursor or endCursor are selected
+    has_next_page, if hasNextPage is selected. An extra row is read to detect it
+    """
+    sqla_model = field.return_type.sqla_model
+    is_page_before = "before" in field.args
+    edges_field = get_subfield(field, ["edges"])
+    page_info_names = {x.name for x in getattr(get_subfield(field, ["pageInfo"]), "fields", [])}
+    needs_has_next_page = "hasNextPage" in page_info_names
+    needs_cursors = bool(page_info_names & {"startCursor", "endCursor"})
+    edge_names = {x.name for x in getattr(edges_field, "fields", [])}
+    needs_cursor = needs_cursors or "cursor" in edge_names
+
+    cursor_selects = []
+    if needs_cursor:
+        cursor_selects.append(to_cursor_sql(sqla_model, page_ref, rank_column=rank_column).label("_cursor"))
+
+    p1_block = (
+        select([*selects, *cursor_selects, func.row_number().over(order_by=order_clause).label("_row_num")])
+        .select_from(from_clause)
         .where(pagination_clause)
-        .order_by(*(reverse_order_clause if is_page_before else order_clause), *order_clause)
-        .limit(cast(limit + 1, Integer()))
+        .order_by(*order_clause)
+        .limit(cast(limit + 1 if needs_has_next_page else limit, Integer()))
     ).alias(block_name + "_p1")
 
-    # Drop maybe extra row
-    p2_block = (
-        select([*p1_block.c, (func.max(p1_block.c._row_num).over() > limit).label("_has_next_page")])
-        .select_from(p1_block)
-        .limit(limit)
-    ).alias(block_name + "_p2")
-
-    ordering = desc(literal_column("_row_num")) if is_page_before else asc(literal_column("_row_num"))
-
-    p3_block = (select(p2_block.c).select_from(p2_block).order_by(ordering)).alias(block_name + "_p3")
-
-    final = (
-        select(
-            [
-                func.jsonb_build_object(
-                    literal_string(totalCount_alias),
-                    func.coalesce(func.min(total_block.c.total_count), ZERO) if has_total else None,
-                    literal_string(pageInfo_alias),
-                    func.jsonb_build_object(
-                        literal_string(hasNextPage_alias),
-                        func.coalesce(func.array_agg(p3_block.c._has_next_page)[ONE], FALSE),
-                        literal_string(hasPreviousPage_alias),
-                        TRUE if is_page_after else FALSE,
-                        literal_string(startCursor_alias),
-                        func.array_agg(p3_block.c._nodeId)[ONE],
-                        literal_string(endCursor_alias),
-                        func.array_agg(p3_block.c._nodeId)[func.array_upper(func.array_agg(p3_block.c._nodeId), ONE)],
-                    ),
-                    literal_string(edges_alias),
-                    func.coalesce(
-                        func.jsonb_agg(
-                            func.jsonb_build_object(
-                                literal_string(cursor_alias),
-                                p3_block.c._nodeId,
-                                literal_string(node_alias),
-                                func.cast(func.row_to_json(literal_column(p3_block.name)), JSONB()),
-                            )
-                        ),
-                        func.cast(literal("[]"), JSONB()),
-                    ),
-                ).label("ret_json")
+    # Rows are numbered in page order. Output is in ascending order so is reversed for "before"
+    output_order = desc(p1_block.c._row_num) if is_page_before else asc(p1_block.c._row_num)
+
+    def page_agg(agg, value):
+        elem = agg(aggregate_order_by(value, output_order))
+        # The extra row only signals a next page
+        return elem.filter(p1_block.c._row_num <= limit) if needs_has_next_page else elem
+
+    summary_selects = []
+    if edges_field is not None:
+        edge_pairs = []
+        for subfield in edges_field.fields:
+            if subfield.name == "cursor":
+                edge_pairs.append((literal_string(subfield.alias), p1_block.c._cursor))
+            elif subfield.name == "node":
+                # Only the requested fields, excluding the internal columns
+                node_json = to_jsonb_object([(literal_string(x.alias), p1_block.c[x.alias]) for x in subfield.fields])
+                edge_pairs.append((literal_string(subfield.alias), node_json))
+        summary_selects.append(page_agg(func.jsonb_agg, to_jsonb_object(edge_pairs)).label("edges"))
+    if needs_cursors:
+        summary_selects.append(page_agg(func.array_agg, p1_block.c._cursor).label("cursors"))
+    if needs_has_next_page:
+        summary_selects.append((func.count(ONE) > limit).label("has_next_page"))
+
+    return select(summary_selects).select_from(p1_block).alias(block_name + "_page_summary")
+
+
+def aggregates_block(field: ASTNode, core_model_ref: Alias):
+    """JSON array with an object of aggregates for each group of the connection's filtered rows"""
+    sqla_model = field.return_type.sqla_model
+    source = core_model_ref.alias()
+    group_by = list(dict.fromkeys(field.args.get("groupBy") or []))
+    group_columns = [source.c[column_name] for column_name in group_by]
+
+    def column_of(subfield: ASTNode) -> Column:
+        return source.c[field_name_to_column(sqla_model, subfield.name).name]
+
+    aggregate_selects = []
+    for subfield in field.fields:
+        if subfield.name == "keys":
+            # Columns that are not grouped have no single value
+            keys = [
+                (
+                    literal_string(x.alias),
+                    column_of(x) if field_name_to_column(sqla_model, x.name).name in group_by else None,
+                )
+                for x in subfield.fields
             ]
-        )
-        .select_from(p3_block)
-        .select_from(total_block if has_total else select([1]).alias())
+            elem = func.jsonb_build_object(*flu(keys).flatten().collect())
+        elif subfield.name == "count":
+            elem = func.count(ONE)
+        else:
+            # sum, avg, min or max
+            aggregate = getattr(func, subfield.name)
+            values = [(literal_string(x.alias), aggregate(column_of(x))) for x in subfield.fields]
+            elem = func.jsonb_build_object(*flu(values).flatten().collect())
+        aggregate_selects.extend([literal_string(subfield.alias), elem])
+
+    groups_block = (
+        select([func.jsonb_build_object(*aggregate_selects).label("ret_json"), *group_columns])
+        .select_from(source)
+        .group_by(*group_columns)
     ).alias()
 
-    return final
+    ret_json = groups_block.c.ret_json
+    ordered_ret_json = aggregate_order_by(ret_json, *[groups_block.c[x] for x in group_by]) if group_by else ret_json
+    return select([func.coalesce(func.jsonb_agg(ordered_ret_json), func.cast(literal("[]"), JSONB()))]).as_scalar()
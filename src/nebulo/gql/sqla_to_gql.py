@@ -12,6 +12,7 @@ from nebulo.gql.convert.function import (
     is_jwt_function,
     mutable_function_entrypoint_factory,
 )
+from nebulo.gql.convert.node import node_entrypoint_factory
 from nebulo.gql.convert.table import table_field_factory
 from nebulo.gql.convert.update import update_entrypoint_factory
 from nebulo.gql.resolve.resolvers.asynchronous import async_resolver as resolver
@@ -68,6 +69,14 @@ def sqla_models_to_graphql_schema(
         if not Config.exclude_delete(sqla_model):
             # e.g. deleteAccount(input: DeleteAccountInput)
             mutation_fields.update(delete_entrypoint_factory(sqla_model, resolver=resolver))
+
+    # e.g. node(nodeId: NodeID) and nodes(nodeIds: [NodeID!]!)
+    node_sqla_models = [x for x in sqla_models if not Config.exclude_read_one(x)]
+    if node_sqla_models:
+        for name, field in node_entrypoint_factory(node_sqla_models, resolver=resolver).items():
+            # Tables named node take precedence
+            query_fields.setdefault(name, field)
+
     # Functions
     for sql_function in sql_functions:
         if is_jwt_function(sql_function, jwt_identifier):
@@ -0,0 +1,201 @@
+"""
+Admission control for GraphQL operations
+
+Operations are admitted once a global concurrency slot, a concurrency slot for
+the requesting JWT subject or role and enough rate limit tokens for the
+operation's estimated cost are available. Operations that can not be admitted
+within the queue timeout are rejected with HTTP 429.
+"""
+from __future__ import annotations
+
+import asyncio
+import typing
+from contextlib import AsyncExitStack, asynccontextmanager
+from time import monotonic
+
+from cachetools import TTLCache
+from starlette.exceptions import HTTPException
+from typing_extensions import Protocol, runtime_checkable
+
+__all__ = ["AdmissionController", "TooManyRequests", "TokenBucketBackend", "MemoryTokenBuckets", "admission_key"]
+
+
+class TooManyRequests(HTTPException):
+    """An operation was not admitted within the queue timeout"""
+
+    def __init__(self, detail: str, retry_after: typing.Optional[float] = None):
+        super().__init__(429, detail)
+        self.retry_after = retry_after
+
+
+@runtime_checkable
+class TokenBucketBackend(Protocol):
+    """Storage for token bucket rate limits
+
+    Implement this protocol to share rate limits between processes, e.g. in Redis
+    """
+
+    async def take(self, key: str, tokens: float, rate: float, burst: float) -> float:
+        """Remove *tokens* from the bucket for *key* if it holds enough
+
+        Buckets start full with *burst* tokens and refill at *rate* tokens per second.
+        Returns 0 if the tokens were taken, otherwise the number of seconds until enough
+        tokens will be available
+        """
+
+    async def refund(self, key: str, tokens: float, burst: float) -> None:
+        """Return *tokens* to the bucket for *key*, taken for an operation that was then rejected"""
+
+
+class MemoryTokenBuckets:
+    """Token buckets held in process memory. Each worker process enforces its own limits
+
+    **Parameters**
+
+    * **maxsize**: _int_ = Maximum number of buckets kept. The least recently used are dropped first
+    * **ttl**: _float_ = Seconds after which an unused bucket is dropped, at least burst / rate so it is full
+    """
+
+    def __init__(self, maxsize: int = 100000, ttl: float = 3600.0) -> None:
+        # key -> (tokens, last refill time)
+        self.buckets: typing.MutableMapping[str, typing.Tuple[float, float]] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def take(self, key: str, tokens: float, rate: float, burst: float) -> float:
+        now = monotonic()
+        available, updated_at = self.buckets.get(key, (burst, now))
+        available = min(burst, available + (now - updated_at) * rate)
+        if available >= tokens:
+            self.buckets[key] = (available - tokens, now)
+            return 0.0
+        self.buckets[key] = (available, now)
+        return (tokens - available) / rate
+
+    async def refund(self, key: str, tokens: float, burst: float) -> None:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            # Dropped buckets are full
+            return
+        available, updated_at = bucket
+        self.buckets[key] = (min(burst, available + tokens), updated_at)
+
+
+def admission_key(jwt_claims: typing.Dict[str, typing.Any], default_role: typing.Optional[str]) -> str:
+    """Identify the requester by JWT subject, falling back to the SQL role the request runs as"""
+    if "sub" in jwt_claims:
+        return f"sub:{jwt_claims['sub']}"
+    role = jwt_claims.get("role", default_role)
+    if role is not None:
+        return f"role:{role}"
+    return "anonymous"
+
+
+class AdmissionController:
+    """Limits concurrent and per-second database work globally and per requester
+
+    **Parameters**
+
+    * **max_concurrency**: _int_ = Maximum operations executing at once across all requesters
+    * **max_concurrency_per_key**: _int_ = Maximum operations executing at once for a single requester
+    * **rate**: _float_ = Query cost each requester may spend per second, see nebulo.gql.complexity
+    * **burst**: _float_ = Query cost a requester may spend at once. Defaults to *rate*
+    * **queue_timeout**: _float_ = Seconds an operation may wait for admission before it is rejected
+    * **buckets**: _TokenBucketBackend_ = Token bucket storage. Defaults to in-process buckets
+    """
+
+    def __init__(
+        self,
+        max_concurrency: typing.Optional[int] = None,
+        max_concurrency_per_key: typing.Optional[int] = None,
+        rate: typing.Optional[float] = None,
+        burst: typing.Optional[float] = None,
+        queue_timeout: float = 5.0,
+        buckets: typing.Optional[TokenBucketBackend] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_key = max_concurrency_per_key
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.queue_timeout = queue_timeout
+        # Buckets left unused long enough to refill are full and can be dropped
+        self.buckets = buckets or MemoryTokenBuckets(ttl=self.burst / self.rate if self.rate else 3600.0)
+        # Semaphores are created lazily so they bind to the serving event loop
+        self._global: typing.Optional[asyncio.Semaphore] = None
+        # key -> (semaphore, number of operations holding or waiting on it)
+        self._per_key: typing.Dict[str, typing.Tuple[asyncio.Semaphore, int]] = {}
+
+    @asynccontextmanager
+    async def admit(self, key: str, cost: float = 1.0) -> typing.AsyncIterator[None]:
+        """Wait for admission of an operation costing *cost* on behalf of *key*
+
+        Raises TooManyRequests if the operation is not admitted within the queue timeout
+        """
+        deadline = monotonic() + self.queue_timeout
+
+        tokens = await self._take_tokens(key, cost, deadline)
+
+        if self.max_concurrency is not None and self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+
+        async with AsyncExitStack() as stack:
+            try:
+                await stack.enter_async_context(self._key_slot(key, deadline))
+                await self._acquire(self._global, deadline, "Too many concurrent requests")
+            except TooManyRequests:
+                # Operations rejected while waiting for a slot do not spend the requester's rate limit
+                if tokens:
+                    await self.buckets.refund(key, tokens, self.burst)
+                raise
+            try:
+                yield
+            finally:
+                if self._global is not None:
+                    self._global.release()
+
+    async def _take_tokens(self, key: str, cost: float, deadline: float) -> float:
+        """Wait for the rate limit tokens for an operation, returning the number taken"""
+        if self.rate is None:
+            return 0.0
+        # Operations costing more than the burst drain the bucket rather than never being admitted
+        tokens = min(max(cost, 1.0), self.burst)
+        while True:
+            wait = await self.buckets.take(key, tokens, self.rate, self.burst)
+            if wait <= 0:
+                return tokens
+            if monotonic() + wait > deadline:
+                raise TooManyRequests("Rate limit exceeded", retry_after=wait)
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def _key_slot(self, key: str, deadline: float) -> typing.AsyncIterator[None]:
+        if self.max_concurrency_per_key is None:
+            yield
+            return
+
+        semaphore, users = self._per_key.get(key, (None, 0))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency_per_key)
+        self._per_key[key] = (semaphore, users + 1)
+        try:
+            await self._acquire(semaphore, deadline, "Too many concurrent requests for this user")
+            try:
+                yield
+            finally:
+                semaphore.release()
+        finally:
+            semaphore, users = self._per_key[key]
+            if users == 1:
+                del self._per_key[key]
+            else:
+                self._per_key[key] = (semaphore, users - 1)
+
+    @staticmethod
+    async def _acquire(semaphore: typing.Optional[asyncio.Semaphore], deadline: float, detail: str) -> None:
+        if semaphore is None:
+            return
+        if not semaphore.locked():
+            await semaphore.acquire()
+            return
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=max(deadline - monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise TooManyRequests(detail)
@@ -7,4 +7,36 @@ APP = create_app(
     jwt_identifier=Config.JWT_IDENTIFIER,
     jwt_secret=Config.JWT_SECRET,
     default_role=Config.DEFAULT_ROLE,
+    server_timing=Config.SERVER_TIMING,
+    timing_extensions=Config.TIMING_EXTENSIONS,
+    metrics=Config.METRICS,
+    metrics_dir=Config.METRICS_DIR,
+    slow_query_ms=Config.SLOW_QUERY_MS,
+    explain_sample_rate=Config.EXPLAIN_SAMPLE_RATE,
+    max_query_depth=Config.MAX_QUERY_DEPTH,
+    max_query_cost=Config.MAX_QUERY_COST,
+    max_query_breadth=Config.MAX_QUERY_BREADTH,
+    max_concurrency=Config.MAX_CONCURRENCY,
+    max_concurrency_per_user=Config.MAX_USER_CONCURRENCY,
+    rate_limit=Config.RATE_LIMIT,
+    rate_limit_burst=Config.RATE_LIMIT_BURST,
+    admission_timeout=Config.ADMISSION_TIMEOUT,
+    batch_transaction=Config.BATCH_TRANSACTION,
+    max_batch_size=Config.MAX_BATCH_SIZE,
+    json_codec=Config.JSON_CODEC,
+    compression=Config.COMPRESSION,
+    compression_minimum_size=Config.COMPRESSION_MINIMUM_SIZE,
+    compression_level=Config.COMPRESSION_LEVEL,
+    function_cache_size=Config.FUNCTION_CACHE_SIZE,
+    function_cache_ttl=Config.FUNCTION_CACHE_TTL,
+    result_cache_size=Config.RESULT_CACHE_SIZE,
+    result_cache_channel=Config.RESULT_CACHE_CHANNEL,
+    join_strategy=Config.JOIN_STRATEGY,
+    execution_backend=Config.EXECUTION_BACKEND,
+    pgbouncer=Config.PGBOUNCER,
+    statement_cache_size=Config.STATEMENT_CACHE_SIZE,
+    role_pool_size=Config.ROLE_POOL_SIZE,
+    max_role_pools=Config.MAX_ROLE_POOLS,
+    single_flight=Config.SINGLE_FLIGHT,
+    deadline_header=Config.DEADLINE_HEADER,
 )
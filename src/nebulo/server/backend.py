@@ -0,0 +1,366 @@
+"""
+Execution backends run nebulo's SQL statements against PostgreSQL
+
+Any object with the methods of ExecutionBackend can serve GraphQL requests. databases.Database
+is the default. AsyncpgBackend uses asyncpg directly, compiling statements to SQL text with
+positional parameters once and reading result columns without converting rows to mappings
+"""
+from __future__ import annotations
+
+import asyncio
+import typing
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import asyncpg
+from databases import Database
+from sqlalchemy.dialects.postgresql import pypostgresql
+from sqlalchemy.engine.interfaces import Dialect
+from sqlalchemy.sql import ClauseElement
+from typing_extensions import Protocol
+
+__all__ = [
+    "ExecutionBackend",
+    "AsyncpgBackend",
+    "RoleAffineBackend",
+    "CompiledQuery",
+    "get_execution_backend",
+    "role_scope",
+    "EXECUTION_BACKENDS",
+]
+
+EXECUTION_BACKENDS = ("databases", "asyncpg")
+
+Query = typing.Union[ClauseElement, str, "CompiledQuery"]
+
+
+class ExecutionBackend(Protocol):
+    """Methods nebulo uses to execute statements, a subset of databases.Database
+
+    Connections are task-local. Statements executed by a task, and by tasks it creates
+    while holding a connection, use the same connection. Transactions nest as savepoints
+    """
+
+    async def connect(self) -> None:
+        ...
+
+    async def disconnect(self) -> None:
+        ...
+
+    def connection(self) -> typing.AsyncContextManager:
+        ...
+
+    def transaction(self) -> typing.AsyncContextManager:
+        ...
+
+    async def execute(self, query: Query) -> typing.Any:
+        ...
+
+    async def fetch_one(self, query: Query) -> typing.Optional[typing.Mapping]:
+        ...
+
+    async def fetch_all(self, query: Query) -> typing.List[typing.Mapping]:
+        ...
+
+    async def fetch_val(self, query: Query) -> typing.Any:
+        ...
+
+
+class CompiledQuery(typing.NamedTuple):
+    """SQL text with positional $n parameters and their values"""
+
+    sql: str
+    args: typing.List[typing.Any]
+
+
+def get_dialect() -> Dialect:
+    """The dialect databases compiles statements with, so both backends send identical SQL"""
+    dialect = pypostgresql.dialect(paramstyle="pyformat")
+    dialect.implicit_returning = True
+    dialect.supports_native_enum = True
+    dialect.supports_smallserial = True
+    dialect._backslash_escapes = False  # pylint: disable=protected-access
+    dialect.supports_sane_multi_rowcount = True
+    dialect._has_native_hstore = True  # pylint: disable=protected-access
+    dialect.supports_native_decimal = True
+    return dialect
+
+
+class AsyncpgBackend:
+    """Execute statements on an asyncpg connection pool
+
+    **Parameters**
+
+    * **url**: _str_ = PostgreSQL connection string
+    * **min_size**: _int_ = Connections opened when the pool is created
+    * **max_size**: _int_ = Maximum connections in the pool
+    * **pool_options**: Further keyword arguments for asyncpg.create_pool
+    """
+
+    # transaction() accepts read_only and a setup statement
+    supports_transaction_options = True
+
+    def __init__(self, url: str, min_size: int = 10, max_size: int = 10, **pool_options: typing.Any):
+        self.url = url
+        self.pool_options = {"min_size": min_size, "max_size": max_size, **pool_options}
+        self.dialect = get_dialect()
+        self.pool: typing.Optional[asyncpg.pool.Pool] = None
+        self._connection_context: ContextVar = ContextVar("nebulo_connection")
+
+    async def connect(self) -> None:
+        assert self.pool is None, "Already connected"
+        self.pool = await asyncpg.create_pool(self.url, **self.pool_options)
+
+    async def disconnect(self) -> None:
+        assert self.pool is not None, "Not connected"
+        await self.pool.close()
+        self.pool = None
+
+    async def get_pool(self) -> asyncpg.pool.Pool:
+        """The pool to acquire the current task's connection from"""
+        assert self.pool is not None, "Not connected"
+        return self.pool
+
+    def compile(self, query: Query) -> CompiledQuery:
+        """SQL text and positional arguments for *query*"""
+        if isinstance(query, CompiledQuery):
+            return query
+        if isinstance(query, str):
+            return CompiledQuery(query, [])
+        compiled = query.compile(dialect=self.dialect)
+        params = sorted(compiled.params.items())
+        positions = {key: f"${ix}" for ix, (key, _) in enumerate(params, start=1)}
+        processors = compiled._bind_processors  # pylint: disable=protected-access
+        args = [processors[key](value) if key in processors else value for key, value in params]
+        return CompiledQuery(compiled.string % positions, args)
+
+    def compile_literal(self, query: typing.Union[ClauseElement, str]) -> str:
+        """SQL text for *query* with its parameters rendered inline"""
+        if isinstance(query, str):
+            return query
+        return str(query.compile(dialect=self.dialect, compile_kwargs={"literal_binds": True}))
+
+    def connection(self) -> "AsyncpgConnection":
+        """The current task's connection, acquired from the pool when first entered"""
+        try:
+            return self._connection_context.get()
+        except LookupError:
+            connection = AsyncpgConnection(self)
+            self._connection_context.set(connection)
+            return connection
+
+    def transaction(
+        self, read_only: bool = False, setup: typing.Optional[typing.Union[ClauseElement, str]] = None
+    ) -> "AsyncpgTransaction":
+        """A transaction, READ ONLY if *read_only*, executing *setup* in the same round trip as BEGIN
+
+        *setup* is rendered with literal parameters, e.g. the request's claims
+        """
+        return AsyncpgTransaction(self.connection(), read_only=read_only, setup=setup)
+
+    async def execute(self, query: Query) -> typing.Any:
+        sql, args = self.compile(query)
+        async with self.connection() as connection:
+            return await connection.run(connection.raw.execute, sql, *args)
+
+    async def fetch_one(self, query: Query) -> typing.Optional[asyncpg.Record]:
+        sql, args = self.compile(query)
+        async with self.connection() as connection:
+            return await connection.run(connection.raw.fetchrow, sql, *args)
+
+    async def fetch_all(self, query: Query) -> typing.List[asyncpg.Record]:
+        sql, args = self.compile(query)
+        async with self.connection() as connection:
+            return await connection.run(connection.raw.fetch, sql, *args)
+
+    async def fetch_val(self, query: Query) -> typing.Any:
+        """The first column of the first row"""
+        sql, args = self.compile(query)
+        async with self.connection() as connection:
+            return await connection.run(connection.raw.fetchval, sql, *args)
+
+
+class RoleAffineBackend(AsyncpgBackend):
+    """Execute statements on pools of connections dedicated to a role
+
+    Each role gets a pool of up to *role_pool_size* connections whose session role is set when
+    they connect, so requests do not set the role in each transaction and the plans of a role's
+    row level security policies stay cached on its connections. Up to *max_role_pools* roles
+    get a pool. Requests for other roles, or without a role, use the shared pool and set the role
+    in each transaction
+
+    Wrap each request in use_role(role) to route its statements
+
+    **Parameters**
+
+    * **url**: _str_ = PostgreSQL connection string
+    * **role_pool_size**: _int_ = Maximum connections in each role's pool
+    * **max_role_pools**: _int_ = Maximum number of roles with a dedicated pool
+    * **pool_options**: Further keyword arguments for asyncpg.create_pool, see AsyncpgBackend
+    """
+
+    def __init__(self, url: str, role_pool_size: int = 2, max_role_pools: int = 8, **pool_options: typing.Any):
+        super().__init__(url, **pool_options)
+        self.role_pool_size = role_pool_size
+        self.max_role_pools = max_role_pools
+        # Pools are created when a role's first connection is acquired
+        self.role_pools: typing.Dict[str, typing.Optional[asyncpg.pool.Pool]] = {}
+        self._role_context: ContextVar[typing.Optional[str]] = ContextVar("nebulo_role", default=None)
+        self._pool_lock = asyncio.Lock()
+
+    @contextmanager
+    def use_role(self, role: typing.Optional[str]) -> typing.Iterator[bool]:
+        """Route the current task's statements to *role*'s pool, yielding whether its connections have the role set"""
+        if role is not None and role not in self.role_pools and len(self.role_pools) < self.max_role_pools:
+            self.role_pools[role] = None
+        pinned = role is not None and role in self.role_pools
+        token = self._role_context.set(role if pinned else None)
+        try:
+            yield pinned
+        finally:
+            self._role_context.reset(token)
+
+    async def get_pool(self) -> asyncpg.pool.Pool:
+        role = self._role_context.get()
+        if role is None:
+            return await super().get_pool()
+        pool = self.role_pools.get(role)
+        if pool is None:
+            async with self._pool_lock:
+                pool = self.role_pools.get(role)
+                if pool is None:
+                    server_settings = {**self.pool_options.get("server_settings", {}), "role": role}
+                    options = {**self.pool_options, "server_settings": server_settings}
+                    # Connections are opened on demand
+                    options.update(min_size=0, max_size=self.role_pool_size)
+                    pool = await asyncpg.create_pool(self.url, **options)
+                    self.role_pools[role] = pool
+        return pool
+
+    async def disconnect(self) -> None:
+        pools = [pool for pool in self.role_pools.values() if pool is not None]
+        self.role_pools = {}
+        await asyncio.gather(*[pool.close() for pool in pools])
+        await super().disconnect()
+
+
+class AsyncpgConnection:
+    """A pooled connection shared by the tasks of a context, released when no longer in use"""
+
+    def __init__(self, backend: AsyncpgBackend):
+        self.backend = backend
+        self.raw: typing.Any = None
+        self.pool: typing.Optional[asyncpg.pool.Pool] = None
+        self._users = 0
+        self._lock = asyncio.Lock()
+        # asyncpg connections execute one statement at a time
+        self._query_lock = asyncio.Lock()
+        # Open transaction and savepoints, outermost first
+        self.transactions: typing.List["AsyncpgTransaction"] = []
+
+    async def __aenter__(self) -> "AsyncpgConnection":
+        async with self._lock:
+            self._users += 1
+            if self._users == 1:
+                self.pool = await self.backend.get_pool()
+                self.raw = await self.pool.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        async with self._lock:
+            self._users -= 1
+            if self._users == 0:
+                raw, self.raw = self.raw, None
+                await self.pool.release(raw)
+
+    async def run(self, method: typing.Callable[..., typing.Awaitable], *args: typing.Any) -> typing.Any:
+        async with self._query_lock:
+            return await method(*args)
+
+
+class AsyncpgTransaction:
+    """A transaction, or a savepoint if the connection is already in a transaction
+
+    Statements are sent with the simple query protocol, so BEGIN and the setup statement
+    share a round trip and no prepared statements are created
+    """
+
+    def __init__(
+        self,
+        connection: AsyncpgConnection,
+        read_only: bool = False,
+        setup: typing.Optional[typing.Union[ClauseElement, str]] = None,
+    ):
+        self.connection = connection
+        self.read_only = read_only
+        self.setup = setup
+        self.savepoint: typing.Optional[str] = None
+
+    async def __aenter__(self) -> "AsyncpgTransaction":
+        await self.connection.__aenter__()
+        try:
+            transactions = self.connection.transactions
+            if transactions:
+                # Savepoints share the access mode of the enclosing transaction
+                self.savepoint = f"nebulo_savepoint_{len(transactions)}"
+                statements = [f"SAVEPOINT {self.savepoint}"]
+            else:
+                statements = ["BEGIN READ ONLY" if self.read_only else "BEGIN"]
+            if self.setup is not None:
+                statements.append(self.connection.backend.compile_literal(self.setup))
+            await self.connection.run(self.connection.raw.execute, ";\n".join(statements))
+            transactions.append(self)
+        except BaseException:
+            await self.connection.__aexit__(None, None, None)
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        try:
+            self.connection.transactions.pop()
+            if self.savepoint is None:
+                statement = "COMMIT" if exc_type is None else "ROLLBACK"
+            elif exc_type is None:
+                statement = f"RELEASE SAVEPOINT {self.savepoint}"
+            else:
+                statement = f"ROLLBACK TO SAVEPOINT {self.savepoint}"
+            await self.connection.run(self.connection.raw.execute, statement)
+        finally:
+            await self.connection.__aexit__(exc_type, exc_value, traceback)
+
+
+def get_execution_backend(
+    name: str, connection: str, role_pool_size: int = 0, max_role_pools: int = 8, **pool_options: typing.Any
+) -> ExecutionBackend:
+    """Create the execution backend *name*, one of EXECUTION_BACKENDS
+
+    A *role_pool_size* above 0 dedicates a pool to each of up to *max_role_pools* roles, see
+    RoleAffineBackend. Only the asyncpg backend supports role pools
+
+    *pool_options* are passed to asyncpg.create_pool e.g. statement_cache_size
+    """
+    if role_pool_size > 0:
+        if name != "asyncpg":
+            raise ValueError("Role pools require the asyncpg execution backend")
+        return RoleAffineBackend(
+            connection, role_pool_size=role_pool_size, max_role_pools=max_role_pools, **pool_options
+        )
+    if name == "databases":
+        return Database(connection, **pool_options)
+    if name == "asyncpg":
+        return AsyncpgBackend(connection, **pool_options)
+    raise ValueError(f"Unknown execution backend {name}. Expected one of {', '.join(EXECUTION_BACKENDS)}")
+
+
+@contextmanager
+def role_scope(database: ExecutionBackend, role: typing.Optional[str]) -> typing.Iterator[bool]:
+    """Route the current task's statements to *role*'s connections if *database* dedicates pools to roles
+
+    Yields whether the connections have the role set for their session
+    """
+    use_role = getattr(database, "use_role", None)
+    if use_role is None:
+        yield False
+        return
+    with use_role(role) as pinned:
+        yield pinned
@@ -0,0 +1,80 @@
+"""
+Cancellation of abandoned requests
+
+Work for a client that disconnected is cancelled, which interrupts the statement executing
+on its connection, and clients may bound how long their request runs with a deadline header
+"""
+from __future__ import annotations
+
+import asyncio
+import typing
+from time import perf_counter
+
+from starlette.exceptions import HTTPException
+from starlette.requests import ClientDisconnect, Request
+
+__all__ = ["cancel_on_disconnect", "get_deadline", "remaining_ms", "DeadlineExceeded"]
+
+T = typing.TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before its statements could execute"""
+
+    def __init__(self):
+        super().__init__("Deadline exceeded")
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    """Return once the client disconnects. The request body must already have been read"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, awaitable: typing.Awaitable[T]) -> T:
+    """Await *awaitable*, cancelling it and raising ClientDisconnect if the client disconnects first"""
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task.done():
+        return task.result()
+    # Cancelling the task cancels the statement it is executing
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):  # pylint: disable=broad-except
+        pass
+    raise ClientDisconnect()
+
+
+def get_deadline(request: Request, header: typing.Optional[str], start: float) -> typing.Optional[float]:
+    """perf_counter() time by which a request received at *start* must complete
+
+    The *header* carries the client's budget in milliseconds, e.g. "X-Timeout-Ms: 2500"
+    """
+    if header is None:
+        return None
+    value = request.headers.get(header)
+    if value is None:
+        return None
+    try:
+        budget_ms = float(value)
+    except ValueError:
+        raise HTTPException(400, f"Header {header} must be a number of milliseconds")
+    return start + budget_ms / 1000
+
+
+def remaining_ms(deadline: float) -> int:
+    """Whole milliseconds left before *deadline*, raising DeadlineExceeded if none remain"""
+    remaining = int((deadline - perf_counter()) * 1000)
+    if remaining < 1:
+        raise DeadlineExceeded()
+    return remaining
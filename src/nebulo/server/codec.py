@@ -0,0 +1,67 @@
+"""
+JSON encoding for GraphQL requests, responses and SQL results
+
+orjson is used when requested and installed, e.g. `pip install nebulo[orjson]`
+"""
+from __future__ import annotations
+
+import json
+import logging
+import typing
+
+__all__ = ["JSONCodec", "OrjsonCodec", "get_json_codec", "JSON_CODEC"]
+
+logger = logging.getLogger(__name__)
+
+
+class JSONCodec:
+    """Encodes and decodes JSON with the standard library"""
+
+    name = "json"
+
+    def loads(self, data: typing.Union[str, bytes]) -> typing.Any:
+        return json.loads(data)
+
+    def dumps(self, obj: typing.Any) -> bytes:
+        # Matches starlette.responses.JSONResponse
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class OrjsonCodec(JSONCodec):
+    """Encodes and decodes JSON with orjson
+
+    Falls back to the standard library for values orjson does not support, e.g. integers over 64 bits
+    """
+
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson  # pylint: disable=import-outside-toplevel
+
+        self.orjson = orjson
+
+    def loads(self, data: typing.Union[str, bytes]) -> typing.Any:
+        return self.orjson.loads(data)
+
+    def dumps(self, obj: typing.Any) -> bytes:
+        try:
+            return self.orjson.dumps(obj)
+        except TypeError:
+            # orjson.JSONEncodeError subclasses TypeError
+            return super().dumps(obj)
+
+
+JSON_CODEC = JSONCodec()
+
+
+def get_json_codec(name: str = "json") -> JSONCodec:
+    """Return the codec named *name*, falling back to the standard library if it is not installed"""
+    if name == "json":
+        return JSON_CODEC
+    if name == "orjson":
+        try:
+            return OrjsonCodec()
+        except ImportError:
+            logger.warning("orjson is not installed, falling back to the standard library json module")
+            return JSON_CODEC
+    raise ValueError(f"Unknown JSON codec {name}. Expected one of 'json', 'orjson'")
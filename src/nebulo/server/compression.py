@@ -0,0 +1,109 @@
+"""
+Response compression negotiated from the Accept-Encoding request header
+
+brotli is used when the client accepts it and the brotli package is installed,
+e.g. `pip install nebulo[brotli]`, otherwise gzip.
+"""
+from __future__ import annotations
+
+import gzip
+import typing
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+__all__ = ["CompressionMiddleware", "negotiate_encoding"]
+
+
+def negotiate_encoding(accept_encoding: str, available: typing.Sequence[str]) -> typing.Optional[str]:
+    """Choose the client's most preferred encoding from *available*, in order of server preference on ties"""
+    preferences: typing.Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            preferences[coding.strip().lower()] = quality
+
+    candidates = [
+        (preferences.get(coding, preferences.get("*", 0.0)), -ix, coding) for ix, coding in enumerate(available)
+    ]
+    quality, _, coding = max(candidates, default=(0.0, 0, None))
+    return coding if quality > 0 else None
+
+
+class CompressionMiddleware:
+    """Compress response bodies of at least *minimum_size* bytes with gzip or brotli
+
+    **Parameters**
+
+    * **minimum_size**: _int_ = Responses smaller than this many bytes are sent uncompressed
+    * **level**: _int_ = Compression level from 1 (fastest) to 9 (smallest). Also used as the brotli quality
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, level: int = 6) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = min(max(level, 1), 9)
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        initial_message: Message = {}
+        started = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal initial_message, started
+            if message["type"] == "http.response.start":
+                # Headers depend on the body so are held until it arrives
+                initial_message = message
+                return
+
+            if message["type"] != "http.response.body" or started:
+                await send(message)
+                return
+
+            started = True
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=initial_message["headers"])
+            # Streamed, small and already encoded responses are sent as is
+            if message.get("more_body", False) or len(body) < self.minimum_size or "content-encoding" in headers:
+                await send(initial_message)
+                await send(message)
+                return
+
+            message["body"] = self.compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(message["body"]))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag is not None and not etag.startswith("W/"):
+                # The compressed body is a different byte sequence for the same content
+                headers["ETag"] = "W/" + etag
+            await send(initial_message)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.level)
+        return gzip.compress(body, compresslevel=self.level)
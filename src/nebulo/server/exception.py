@@ -1,3 +1,5 @@
+import math
+
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
 from starlette.responses import JSONResponse
@@ -5,4 +7,8 @@ from starlette.responses import JSONResponse
 
 async def http_exception(request: Request, exc: HTTPException):
     """Starlette exception handler converting starlette.exceptions.HTTPException into GraphQL responses"""
-    return JSONResponse({"data": None, "errors": [exc.detail]}, status_code=exc.status_code)
+    headers = {}
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is not None:
+        headers["Retry-After"] = str(math.ceil(retry_after))
+    return JSONResponse({"data": None, "errors": [exc.detail]}, status_code=exc.status_code, headers=headers)
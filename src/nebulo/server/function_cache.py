@@ -0,0 +1,64 @@
+"""
+In-process cache for the results of immutable SQL functions
+
+An immutable function always returns the same result for the same arguments, so
+results are cached by function and argument values. The SQL role is part of the
+key so a role without permission to execute a function can not read another
+role's cached result.
+"""
+from __future__ import annotations
+
+import json
+import typing
+
+from cachetools import TTLCache
+from nebulo.sql.reflection.function import SQLFunction
+
+__all__ = ["FunctionResultCache", "NULL_FUNCTION_CACHE"]
+
+CacheKey = typing.Tuple[str, str, str, typing.Optional[str]]
+
+
+class FunctionResultCache:
+    """An LRU cache with a time to live, bounded by the approximate size of the cached results
+
+    **Parameters**
+
+    * **max_bytes**: _int_ = Approximate total size of cached results, measured as JSON. 0 disables the cache
+    * **ttl**: _float_ = Seconds a result may be served from the cache
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: float = 300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # Values are (size, result) pairs
+        self.results: typing.Optional[TTLCache] = (
+            TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda value: value[0]) if max_bytes > 0 else None
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.results is not None
+
+    @staticmethod
+    def key(sql_function: SQLFunction, args: typing.Dict[str, typing.Any], role: typing.Optional[str]) -> CacheKey:
+        return (sql_function.schema, sql_function.name, json.dumps(args, sort_keys=True, default=str), role)
+
+    def get(self, key: CacheKey) -> typing.Tuple[bool, typing.Any]:
+        """Whether *key* is cached and its result"""
+        if self.results is None:
+            return False, None
+        value = self.results.get(key)
+        return (False, None) if value is None else (True, value[1])
+
+    def set(self, key: CacheKey, result: typing.Any) -> None:
+        if self.results is None:
+            return
+        size = len(key[2]) + len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            # Larger than the whole cache
+            return
+        self.results[key] = (size, result)
+
+
+NULL_FUNCTION_CACHE = FunctionResultCache(max_bytes=0)
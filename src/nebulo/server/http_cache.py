@@ -0,0 +1,134 @@
+"""
+HTTP caching for GraphQL queries served over GET
+
+Responses carry an ETag derived from the response body and a Cache-Control header
+built from the @cache_control comment directives of the tables each root field reads.
+Queries may be sent as a sha256 hash of a previously registered query document
+using the automatic persisted queries protocol.
+"""
+from __future__ import annotations
+
+import hashlib
+import typing
+from functools import lru_cache
+
+from cachetools import LRUCache
+from graphql.error import GraphQLError
+from graphql.language import (
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    SelectionSetNode,
+)
+from graphql.utilities import get_operation_ast
+from nebulo.config import CacheControl, Config
+from nebulo.gql.parse_info import ASTNode
+from nebulo.sql.table_base import TableProtocol
+
+__all__ = [
+    "PersistedQueries",
+    "get_etag",
+    "etag_matches",
+    "root_field_names",
+    "cache_control_hint",
+    "get_cache_control",
+]
+
+NO_CACHE = "no-cache"
+
+
+class PersistedQueries:
+    """An in-memory store of query documents by sha256 hash
+
+    **Parameters**
+
+    * **maxsize**: _int_ = Number of documents to keep. The least recently used are evicted first
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.documents: LRUCache = LRUCache(maxsize=maxsize)
+
+    def get(self, sha256_hash: str) -> typing.Optional[str]:
+        return self.documents.get(sha256_hash)
+
+    def register(self, sha256_hash: str, query: str) -> None:
+        """Store *query* under its hash, raising a GraphQLError if *sha256_hash* does not match"""
+        if hashlib.sha256(query.encode("utf-8")).hexdigest() != sha256_hash:
+            raise GraphQLError("provided sha does not match query")
+        self.documents[sha256_hash] = query
+
+
+def get_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: typing.Optional[str], etag: str) -> bool:
+    """Does an If-None-Match header match *etag* using the weak comparison function"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {x.strip() for x in if_none_match.split(",")}
+    return etag in candidates or "W/" + etag in candidates
+
+
+def root_field_names(document: DocumentNode) -> typing.List[str]:
+    """Names of the root fields selected by a document's operation, including those in fragments"""
+    operation = get_operation_ast(document)
+    if operation is None:
+        return []
+    fragments = {x.name.value: x for x in document.definitions if isinstance(x, FragmentDefinitionNode)}
+
+    def from_selection_set(selection_set: SelectionSetNode) -> typing.Iterator[str]:
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                yield selection.name.value
+            elif isinstance(selection, FragmentSpreadNode):
+                yield from from_selection_set(fragments[selection.name.value].selection_set)
+            elif isinstance(selection, InlineFragmentNode):
+                yield from from_selection_set(selection.selection_set)
+
+    return list(from_selection_set(operation.selection_set))
+
+
+@lru_cache()
+def _table_cache_control(sqla_model: TableProtocol) -> typing.Optional[CacheControl]:
+    return Config.cache_control(sqla_model)
+
+
+def cache_control_hint(tree: ASTNode) -> typing.Optional[CacheControl]:
+    """Cache-Control hint for a root field, combining the hints of every table it reads
+
+    None if the field reads no tables or any table read has no @cache_control hint
+    """
+    hints = []
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.fields)
+        sqla_model = getattr(node.return_type, "sqla_model", None)
+        if sqla_model is None:
+            continue
+        hint = _table_cache_control(sqla_model)
+        if hint is None:
+            return None
+        hints.append(hint)
+    if not hints:
+        return None
+    return CacheControl(max_age=min(x.max_age for x in hints), private=any(x.private for x in hints))
+
+
+def get_cache_control(trees: typing.List[ASTNode], private: bool) -> str:
+    """Cache-Control header value for a query with root fields *trees*, see parse_document
+
+    The shortest max-age of any table read applies. Queries reading a table without a hint
+    must be revalidated with the ETag on every use
+    """
+    field_hints = [cache_control_hint(tree) for tree in trees]
+    if not field_hints or any(hint is None for hint in field_hints):
+        return NO_CACHE
+    max_age = min(hint.max_age for hint in field_hints)  # type: ignore
+    scope = "private" if private or any(hint.private for hint in field_hints) else "public"  # type: ignore
+    return f"{scope}, max-age={max_age}"
@@ -0,0 +1,86 @@
+"""
+Caching of introspection queries
+
+The schema does not change while the server runs, so the result of an introspection
+query depends only on its text and variables. Results are computed once per schema
+version and served from memory with an ETag, and the schema's SDL is printed at startup
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import typing
+from inspect import isawaitable
+
+from cachetools import LRUCache
+from graphql import ExecutionResult, execute, validate
+from graphql.language import DocumentNode, OperationType
+from graphql.utilities import get_operation_ast, print_schema
+from nebulo.gql.alias import Schema
+from nebulo.server.http_cache import root_field_names
+
+__all__ = ["IntrospectionCache", "is_introspection"]
+
+
+def is_introspection(document: DocumentNode) -> bool:
+    """Does *document* hold a query selecting only introspection fields, e.g. __schema and __type"""
+    operation = get_operation_ast(document)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return False
+    field_names = root_field_names(document)
+    return bool(field_names) and all(name.startswith("__") for name in field_names)
+
+
+class IntrospectionCache:
+    """Results of introspection queries against one schema
+
+    **Parameters**
+
+    * **gql_schema**: _Schema_ = The schema being served
+    * **maxsize**: _int_ = Number of distinct introspection queries to keep. The least recently used are evicted first
+    """
+
+    def __init__(self, gql_schema: Schema, maxsize: int = 32):
+        self.gql_schema = gql_schema
+        self.sdl = print_schema(gql_schema)
+        self.version = hashlib.sha256(self.sdl.encode("utf-8")).hexdigest()[:16]
+        self.results: LRUCache = LRUCache(maxsize=maxsize)
+
+    @property
+    def etag(self) -> str:
+        """ETag of the schema's SDL"""
+        return f'"{self.version}"'
+
+    def key(self, query: str, variables: typing.Optional[typing.Dict[str, typing.Any]]) -> typing.Optional[str]:
+        """Cache key of *query* with *variables*, or None if the query can not select introspection fields"""
+        # Skips hashing the many queries that can not be introspection
+        if "__" not in query:
+            return None
+        variables_text = json.dumps(variables or {}, sort_keys=True, default=str)
+        return hashlib.sha256((query + "\0" + variables_text).encode("utf-8")).hexdigest()[:32]
+
+    def get_etag(self, key: str) -> str:
+        """ETag of the result of the introspection query with *key*, which changes with the schema version"""
+        return f'"{self.version}-{key}"'
+
+    def get(self, key: str) -> typing.Optional[typing.Tuple[DocumentNode, ExecutionResult]]:
+        """The parsed document and result of a previously executed introspection query"""
+        return self.results.get(key)
+
+    async def execute(
+        self, document: DocumentNode, key: str, variables: typing.Optional[typing.Dict[str, typing.Any]]
+    ) -> ExecutionResult:
+        """Validate and execute the introspection query *document*, caching its result under *key*
+
+        Only results without errors are cached
+        """
+        validation_errors = validate(self.gql_schema, document)
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+        # Introspection fields resolve from the schema alone and never read from the database
+        result = execute(self.gql_schema, document, variable_values=variables)
+        if isawaitable(result):
+            result = await result  # type: ignore
+        if not result.errors and self.results.maxsize:
+            self.results[key] = (document, result)
+        return result
@@ -0,0 +1,360 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format
+
+When serving with multiple workers, each worker periodically writes a snapshot
+of its metrics to a shared directory and the worker answering a scrape merges
+every snapshot found there.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import json
+import os
+import typing
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from time import perf_counter, time
+
+__all__ = ["NebuloMetrics", "NullMetrics", "NULL_METRICS", "database_pool_collector"]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Snapshots not written for this many flush intervals are from workers that exited without stopping
+STALE_FLUSH_INTERVALS = 3
+
+Labels = typing.Tuple[str, ...]
+
+
+class Metric:
+    """A named family of samples keyed by label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples: typing.Dict[Labels, typing.Any] = {}
+
+    def copy_empty(self) -> Metric:
+        """A copy of the metric without samples"""
+        empty = copy.copy(self)
+        empty.samples = {}
+        return empty
+
+    def merge(self, labels: Labels, value: typing.Any) -> None:
+        """Combine a sample from another process into this metric"""
+        self.samples[labels] = self.samples.get(labels, 0) + value
+
+    def render_samples(self) -> typing.Iterator[str]:
+        for labels, value in sorted(self.samples.items()):
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self.samples[labels] = self.samples.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        self.samples[labels] = self.samples.get(labels, 0) + amount
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self.samples[labels] = value
+
+
+class Histogram(Metric):
+    """Samples are stored as [*bucket_counts, sum, count] with non-cumulative bucket counts"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: typing.Sequence[str] = (),
+        buckets: typing.Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        sample = self.samples.get(labels)
+        if sample is None:
+            sample = self.samples[labels] = [0] * (len(self.buckets) + 2)
+        for ix, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                sample[ix] += 1
+                break
+        sample[-2] += value
+        sample[-1] += 1
+
+    def merge(self, labels: Labels, value: typing.Any) -> None:
+        sample = self.samples.get(labels)
+        if sample is None:
+            self.samples[labels] = list(value)
+        else:
+            self.samples[labels] = [left + right for left, right in zip(sample, value)]
+
+    def render_samples(self) -> typing.Iterator[str]:
+        for labels, sample in sorted(self.samples.items()):
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, sample):
+                cumulative += bucket_count
+                bucket_labels = format_labels(self.labelnames + ("le",), labels + (format_value(upper_bound),))
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            inf_labels = format_labels(self.labelnames + ("le",), labels + ("+Inf",))
+            yield f"{self.name}_bucket{inf_labels} {sample[-1]}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(sample[-2])}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {sample[-1]}"
+
+
+def format_labels(labelnames: Labels, labels: Labels) -> str:
+    if not labelnames:
+        return ""
+    pairs = [f'{name}="{escape_label(str(value))}"' for name, value in zip(labelnames, labels)]
+    return "{" + ",".join(pairs) + "}"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class MetricsRegistry:
+    """A collection of metrics that can be snapshotted, merged and rendered
+
+    **Parameters**
+
+    * **multiprocess_dir**: _str_ = Directory shared by all worker processes for metrics snapshots
+    """
+
+    def __init__(self, multiprocess_dir: typing.Optional[str] = None):
+        self.metrics: typing.List[Metric] = []
+        self.collectors: typing.List[typing.Callable[[], None]] = []
+        self.multiprocess_dir = Path(multiprocess_dir) if multiprocess_dir else None
+        self.flush_interval = 5.0
+        self._flush_task: typing.Optional[asyncio.Task] = None
+
+    def register(self, metric: Metric) -> typing.Any:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: typing.Callable[[], None]) -> None:
+        """Register a callable that refreshes gauges immediately before a snapshot is taken"""
+        self.collectors.append(collector)
+
+    def snapshot(self, include_gauges: bool = True) -> typing.Dict[str, typing.List]:
+        for collector in self.collectors:
+            collector()
+        return {
+            metric.name: [[list(labels), value] for labels, value in metric.samples.items()]
+            for metric in self.metrics
+            if include_gauges or metric.kind != "gauge"
+        }
+
+    @property
+    def snapshot_path(self) -> Path:
+        assert self.multiprocess_dir is not None
+        return self.multiprocess_dir / f"metrics-{os.getpid()}.json"
+
+    def write_snapshot(self, include_gauges: bool = True) -> None:
+        """Persist this process' metrics for the other workers to read"""
+        if self.multiprocess_dir is None:
+            return
+        self.multiprocess_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.snapshot(include_gauges=include_gauges)))
+        os.replace(tmp_path, self.snapshot_path)
+
+    def collect(self) -> typing.List[Metric]:
+        """Metrics for this process, or merged across all processes in multiprocess mode"""
+        if self.multiprocess_dir is None:
+            for collector in self.collectors:
+                collector()
+            return self.metrics
+
+        self.write_snapshot()
+        merged = [metric.copy_empty() for metric in self.metrics]
+        by_name = {metric.name: metric for metric in merged}
+        now = time()
+        for snapshot_path in self.multiprocess_dir.glob("metrics-*.json"):
+            try:
+                is_live = self.is_live(snapshot_path, now)
+                snapshot = json.loads(snapshot_path.read_text())
+            except (OSError, ValueError):
+                # Partially written or removed by another worker
+                continue
+            for name, samples in snapshot.items():
+                metric = by_name.get(name)
+                # Gauges describe live state, which workers that crashed or were killed no longer have
+                if metric is None or (metric.kind == "gauge" and not is_live):
+                    continue
+                for labels, value in samples:
+                    metric.merge(tuple(labels), value)
+        return merged
+
+    def is_live(self, snapshot_path: Path, now: float) -> bool:
+        """Was the snapshot written recently by a process that is still running"""
+        if now - snapshot_path.stat().st_mtime > STALE_FLUSH_INTERVALS * self.flush_interval:
+            return False
+        return is_process_alive(int(snapshot_path.stem[len("metrics-") :]))
+
+    def render(self) -> str:
+        """Render metrics in the Prometheus text exposition format"""
+        lines: typing.List[str] = []
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render_samples())
+        return "\n".join(lines) + "\n"
+
+    async def start(self, flush_interval: float = 5.0) -> None:
+        """Periodically write snapshots when running in multiprocess mode"""
+        if self.multiprocess_dir is None:
+            return
+        self.flush_interval = flush_interval
+
+        async def flush_forever():
+            while True:
+                await asyncio.sleep(flush_interval)
+                self.write_snapshot()
+
+        self._flush_task = asyncio.ensure_future(flush_forever())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        # Gauges describe live state so are dropped once the worker exits
+        self.write_snapshot(include_gauges=False)
+
+
+def is_process_alive(pid: int) -> bool:
+    """Is a process with *pid* running"""
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+class NebuloMetrics(MetricsRegistry):
+    """Metrics reported by the GraphQL route and resolvers"""
+
+    def __init__(self, multiprocess_dir: typing.Optional[str] = None):
+        super().__init__(multiprocess_dir=multiprocess_dir)
+        self.requests = self.register(Counter("nebulo_requests_total", "GraphQL requests served", ["operation"]))
+        self.request_seconds = self.register(
+            Histogram("nebulo_request_duration_seconds", "GraphQL request latency", ["operation"])
+        )
+        self.errors = self.register(Counter("nebulo_errors_total", "GraphQL errors returned", ["type"]))
+        self.in_flight = self.register(Gauge("nebulo_requests_in_flight", "GraphQL requests currently being served"))
+        self.db_seconds = self.register(
+            Histogram("nebulo_db_query_duration_seconds", "SQL statement execution time", ["field"])
+        )
+        self.db_rows = self.register(Counter("nebulo_db_rows_total", "Table rows read by SQL statements", ["field"]))
+        self.db_bytes = self.register(
+            Histogram("nebulo_db_response_bytes", "Size of JSON results returned by SQL", ["field"], BYTES_BUCKETS)
+        )
+        self.pool = self.register(Gauge("nebulo_db_pool_connections", "Database pool connections", ["state"]))
+        self.cache = self.register(Counter("nebulo_cache_requests_total", "Cache lookups", ["cache", "result"]))
+
+    @contextmanager
+    def track_request(self) -> typing.Iterator[typing.Dict[str, str]]:
+        """Track in-flight count and latency of a request
+
+        The yielded dict's "operation" key labels the request's latency
+        """
+        labels = {"operation": "unknown"}
+        start = perf_counter()
+        self.in_flight.inc()
+        try:
+            yield labels
+        finally:
+            self.in_flight.dec()
+            operation = (labels["operation"],)
+            self.requests.inc(operation)
+            self.request_seconds.observe(perf_counter() - start, operation)
+
+    def observe_errors(self, errors: typing.Iterable[Exception]) -> None:
+        for error in errors:
+            original_error = getattr(error, "original_error", None)
+            self.errors.inc((type(original_error or error).__name__,))
+
+    def observe_query(self, field: str, seconds: float) -> None:
+        self.db_seconds.observe(seconds, (field,))
+
+    def observe_rows(self, field: str, rows: int) -> None:
+        self.db_rows.inc((field,), rows)
+
+    def observe_result_bytes(self, field: str, size: int) -> None:
+        self.db_bytes.observe(size, (field,))
+
+    def observe_cache(self, cache: str, hit: bool) -> None:
+        self.cache.inc((cache, "hit" if hit else "miss"))
+
+
+class NullMetrics(NebuloMetrics):
+    """A NebuloMetrics that records nothing, used when metrics are disabled"""
+
+    _null_context = nullcontext({"operation": "unknown"})
+
+    def track_request(self):  # type: ignore
+        return self._null_context
+
+    def observe_errors(self, errors: typing.Iterable[Exception]) -> None:
+        pass
+
+    def observe_query(self, field: str, seconds: float) -> None:
+        pass
+
+    def observe_rows(self, field: str, rows: int) -> None:
+        pass
+
+    def observe_result_bytes(self, field: str, size: int) -> None:
+        pass
+
+    def observe_cache(self, cache: str, hit: bool) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def database_pool_collector(database, metrics: NebuloMetrics) -> typing.Callable[[], None]:
+    """Return a collector reporting connection pool saturation for a databases.Database or AsyncpgBackend"""
+
+    def collect() -> None:
+        # The asyncpg pool is not part of the public databases API
+        pool = getattr(database, "pool", None) or getattr(getattr(database, "_backend", None), "_pool", None)
+        # Pool introspection requires asyncpg >= 0.25
+        if pool is None or not hasattr(pool, "get_idle_size"):
+            return
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        metrics.pool.set(pool.get_max_size(), ("max",))
+        metrics.pool.set(size, ("open",))
+        metrics.pool.set(size - idle, ("in_use",))
+
+    return collect
@@ -0,0 +1,209 @@
+"""
+In-process cache for the results of queries reading tables opted in with the @cache comment directive
+
+Results are keyed by the normalized operation, the root field, the request's variables
+and its JWT claims and role, so row level security policies can not leak rows between
+users. An entry is invalidated when any table the query read changes, either through a
+mutation served by this worker or a notification sent by a trigger on the table, e.g.
+
+    pg_notify('nebulo_cache', TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import typing
+from functools import lru_cache
+from time import monotonic
+
+import asyncpg
+from cachetools import LRUCache
+from nebulo.config import Config
+from nebulo.gql.alias import ResolveInfo
+from nebulo.gql.parse_info import ASTNode
+from nebulo.server.slow_query import document_hash
+from nebulo.sql.inspect import get_qualified_table_name
+from nebulo.sql.table_base import TableProtocol
+
+__all__ = ["QueryResultCache", "InvalidationListener", "NULL_RESULT_CACHE"]
+
+logger = logging.getLogger("nebulo.result_cache")
+
+CacheKey = typing.Tuple[str, str, str, str, typing.Optional[str]]
+# Global epoch and the version of each table read, as of the start of the query
+Versions = typing.Tuple[int, typing.Tuple[int, ...]]
+
+
+@lru_cache()
+def _table_ttl(sqla_model: TableProtocol) -> typing.Optional[float]:
+    return Config.cache_ttl(sqla_model)
+
+
+class QueryResultCache:
+    """An LRU cache of query results bounded by their approximate size, invalidated by table
+
+    **Parameters**
+
+    * **max_bytes**: _int_ = Approximate total size of cached results, measured as JSON. 0 disables the cache
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        # Values are (size, expires at, tables, versions, result)
+        self.results: typing.Optional[LRUCache] = (
+            LRUCache(maxsize=max_bytes, getsizeof=lambda value: value[0]) if max_bytes > 0 else None
+        )
+        self._epoch = 0
+        self._versions: typing.Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.results is not None
+
+    @staticmethod
+    def policy(tree: ASTNode) -> typing.Optional[typing.Tuple[typing.Tuple[str, ...], float]]:
+        """Tables read by a query and the seconds its result may be cached
+
+        None if the query reads no tables or any table read is not opted in with @cache
+        """
+        ttls: typing.Dict[str, float] = {}
+        nodes = [tree]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.fields)
+            sqla_model = getattr(node.return_type, "sqla_model", None)
+            if sqla_model is None:
+                continue
+            ttl = _table_ttl(sqla_model)
+            if ttl is None:
+                return None
+            ttls[get_qualified_table_name(sqla_model)] = ttl
+        if not ttls:
+            return None
+        return tuple(sorted(ttls)), min(ttls.values())
+
+    @staticmethod
+    def key(
+        info: ResolveInfo, jwt_claims: typing.Dict[str, typing.Any], default_role: typing.Optional[str]
+    ) -> CacheKey:
+        return (
+            document_hash(info),
+            str(info.path.key),
+            json.dumps(info.variable_values, sort_keys=True, default=str),
+            json.dumps(jwt_claims, sort_keys=True, default=str),
+            default_role,
+        )
+
+    def versions(self, tables: typing.Tuple[str, ...]) -> Versions:
+        """Snapshot of the tables' versions, taken before the query executes"""
+        return self._epoch, tuple(self._versions.setdefault(table, 0) for table in tables)
+
+    def get(self, key: CacheKey) -> typing.Tuple[bool, typing.Any]:
+        """Whether *key* is cached and its result"""
+        if self.results is None:
+            return False, None
+        value = self.results.get(key)
+        if value is None:
+            return False, None
+        _, expires_at, tables, versions, result = value
+        if monotonic() >= expires_at or self.versions(tables) != versions:
+            del self.results[key]
+            return False, None
+        return True, result
+
+    def set(
+        self, key: CacheKey, result: typing.Any, tables: typing.Tuple[str, ...], versions: Versions, ttl: float
+    ) -> None:
+        """Cache *result* unless a table it read changed since *versions* was taken"""
+        if self.results is None or ttl <= 0 or self.versions(tables) != versions:
+            return
+        size = sum(len(x) for x in key[:4]) + len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            # Larger than the whole cache
+            return
+        self.results[key] = (size, monotonic() + ttl, tables, versions, result)
+
+    def invalidate(self, tables: typing.Optional[typing.Iterable[str]] = None) -> None:
+        """Expire results that read any of *tables*, or every result if *tables* is None
+
+        Unqualified table names match the table in any schema
+        """
+        if self.results is None:
+            return
+        if tables is None:
+            self._epoch += 1
+            return
+        for table in tables:
+            if "." in table:
+                matches = [table]
+            else:
+                matches = [x for x in self._versions if x.rpartition(".")[2] == table]
+            for match in matches:
+                self._versions[match] = self._versions.get(match, 0) + 1
+
+
+NULL_RESULT_CACHE = QueryResultCache(max_bytes=0)
+
+
+class InvalidationListener:
+    """Invalidates a QueryResultCache from notifications on a PostgreSQL channel
+
+    Each notification's payload is a table name. An empty payload invalidates every result.
+    Notifications sent while the listening connection is down are lost, so every result is
+    invalidated when it reconnects
+
+    **Parameters**
+
+    * **connection**: _str_ = PostgreSQL connection string
+    * **result_cache**: _QueryResultCache_ = Cache to invalidate
+    * **channel**: _str_ = Channel to LISTEN on
+    * **reconnect_interval**: _float_ = Seconds between checks of the connection and attempts to reconnect
+    """
+
+    def __init__(
+        self,
+        connection: str,
+        result_cache: QueryResultCache,
+        channel: str = "nebulo_cache",
+        reconnect_interval: float = 5.0,
+    ):
+        self.connection = connection
+        self.result_cache = result_cache
+        self.channel = channel
+        self.reconnect_interval = reconnect_interval
+        self._task: typing.Optional[asyncio.Future] = None
+
+    def on_notification(self, _connection, _pid, _channel, payload: str) -> None:
+        self.result_cache.invalidate([payload.strip()] if payload.strip() else None)
+
+    async def start(self) -> None:
+        if not self.result_cache.enabled:
+            return
+        self._task = asyncio.ensure_future(self.listen_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def listen_forever(self) -> None:
+        while True:
+            try:
+                raw_connection = await asyncpg.connect(self.connection)
+            except (OSError, asyncpg.PostgresError) as exc:
+                logger.warning("Failed to listen for result cache invalidations: %s", exc)
+                await asyncio.sleep(self.reconnect_interval)
+                continue
+            try:
+                await raw_connection.add_listener(self.channel, self.on_notification)
+                # Changes made while not listening are unknown
+                self.result_cache.invalidate()
+                while True:
+                    await asyncio.sleep(self.reconnect_interval)
+                    # An idle connection does not notice the server going away
+                    await raw_connection.fetchval("select 1")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as exc:
+                logger.warning("Lost connection listening for result cache invalidations: %s", exc)
+            finally:
+                raw_connection.terminate()
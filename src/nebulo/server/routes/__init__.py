@@ -1,7 +1,11 @@
 from .graphiql import get_graphiql_route
 from .graphql import get_graphql_route
+from .metrics import get_metrics_route
+from .schema import get_schema_route
 
 __all__ = [
     "get_graphiql_route",
     "get_graphql_route",
+    "get_metrics_route",
+    "get_schema_route",
 ]
@@ -1,12 +1,37 @@
-from typing import Any, Awaitable, Dict, Optional
+import asyncio
+from inspect import isawaitable
+from time import perf_counter
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
 
-from databases import Database
-from graphql import graphql as graphql_exec
+from graphql import ExecutionResult, GraphQLError, execute, parse, validate
+from graphql.language import DocumentNode, OperationType
+from graphql.utilities import get_operation_ast
 from nebulo.gql.alias import Schema
+from nebulo.gql.complexity import ComplexityLimits
+from nebulo.gql.parse_info import parse_document
+from nebulo.gql.resolve.resolvers.claims import build_claims, get_role, has_claims
+from nebulo.server.admission import AdmissionController, TooManyRequests, admission_key
+from nebulo.server.backend import ExecutionBackend, role_scope
+from nebulo.server.cancellation import DeadlineExceeded, cancel_on_disconnect, get_deadline, remaining_ms
+from nebulo.server.codec import JSON_CODEC, JSONCodec
+from nebulo.server.function_cache import NULL_FUNCTION_CACHE, FunctionResultCache
+from nebulo.server.http_cache import (
+    NO_CACHE,
+    PersistedQueries,
+    etag_matches,
+    get_cache_control,
+    get_etag,
+)
+from nebulo.server.introspection import IntrospectionCache, is_introspection
 from nebulo.server.jwt import get_jwt_claims_handler
+from nebulo.server.metrics import NULL_METRICS, NebuloMetrics
+from nebulo.server.result_cache import NULL_RESULT_CACHE, QueryResultCache
+from nebulo.server.single_flight import NULL_SINGLE_FLIGHT, SingleFlight
+from nebulo.server.slow_query import NULL_SLOW_QUERY_LOG, SlowQueryLog
+from nebulo.server.timing import NULL_TIMER, RequestTimer
 from starlette.exceptions import HTTPException
-from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import Response
 from starlette.routing import Route
 
 __all__ = ["get_graphql_route"]
@@ -14,31 +39,109 @@ __all__ = ["get_graphql_route"]
 
 def get_graphql_route(
     gql_schema: Schema,
-    database: Database,
+    database: ExecutionBackend,
     path: str = "/",
     jwt_secret: Optional[str] = None,
     default_role: Optional[str] = None,
     name: Optional[str] = None,
+    server_timing: bool = False,
+    timing_extensions: bool = False,
+    metrics: Optional[NebuloMetrics] = None,
+    slow_query_log: Optional[SlowQueryLog] = None,
+    complexity: Optional[ComplexityLimits] = None,
+    admission: Optional[AdmissionController] = None,
+    batch_transaction: bool = False,
+    max_batch_size: int = 25,
+    json_codec: Optional[JSONCodec] = None,
+    persisted_queries: Optional[PersistedQueries] = None,
+    function_cache: Optional[FunctionResultCache] = None,
+    result_cache: Optional[QueryResultCache] = None,
+    join_strategy: str = "subquery",
+    single_flight: Optional[SingleFlight] = None,
+    introspection: Optional[IntrospectionCache] = None,
+    deadline_header: Optional[str] = None,
 ) -> Route:
     """Create a Starlette Route to serve GraphQL requests
 
     **Parameters**
 
     * **schema**: _Schema_ = A GraphQL-core schema
-    * **database**: _Database_ = Database object for communicating with PostgreSQL
+    * **database**: _ExecutionBackend_ = Database object for communicating with PostgreSQL
     * **path**: _str_ = URL path to serve GraphQL from, e.g. '/'
     * **jwt_secret**: _str_ = secret key used to encrypt JWT contents
     * **default_role**: _str_ = Default SQL role to use when serving unauthenticated requests
     * **name**: _str_ = Name of the GraphQL serving Starlette route
+    * **server_timing**: _bool_ = Report per-phase timings in a Server-Timing response header
+    * **timing_extensions**: _bool_ = Report per-phase timings in the response's extensions.timings
+    * **metrics**: _NebuloMetrics_ = Registry to report request, error and database metrics to
+    * **slow_query_log**: _SlowQueryLog_ = Log for SQL statements exceeding a duration threshold
+    * **complexity**: _ComplexityLimits_ = Depth, breadth and cost limits checked before any SQL is built
+    * **admission**: _AdmissionController_ = Concurrency and rate limits applied before executing operations
+    * **batch_transaction**: _bool_ = Execute batched operations in a single transaction, setting claims once
+    * **max_batch_size**: _int_ = Maximum number of operations accepted in a batch request
+    * **json_codec**: _JSONCodec_ = Codec for request bodies, responses and SQL results, see get_json_codec
+    * **persisted_queries**: _PersistedQueries_ = Store enabling queries to be sent as a sha256 hash
+    * **function_cache**: _FunctionResultCache_ = Cache for the results of immutable SQL functions
+    * **result_cache**: _QueryResultCache_ = Cache for the results of queries reading tables with a @cache directive
+    * **join_strategy**: _str_ = How nested relationships are read, "subquery", "lateral" or "auto"
+    * **single_flight**: _SingleFlight_ = Coalescer sharing one execution among concurrent identical reads
+    * **introspection**: _IntrospectionCache_ = Cache for the results of introspection queries
+    * **deadline_header**: _str_ = Request header with the client's time budget in milliseconds, bounding statement_timeout
+
+    A JSON array of operations in the request body is executed as a batch on a
+    single database connection, responding with an array of results
+
+    Queries may also be sent with GET, passing query, variables and extensions as URL
+    parameters. GET responses have an ETag and a Cache-Control header built from the
+    @cache_control comment directives of the tables read by each root field
+
+    When an *introspection* cache is provided, introspection queries are answered from it
+    with an ETag of the schema version, sent with GET or POST
+
+    If the client disconnects before its response is ready, execution is cancelled, which
+    cancels the statement executing on its connection
     """
 
     get_jwt_claims = get_jwt_claims_handler(jwt_secret)
+    is_timed = server_timing or timing_extensions
+    metrics = metrics or NULL_METRICS
+    slow_query_log = slow_query_log or NULL_SLOW_QUERY_LOG
+    json_codec = json_codec or JSON_CODEC
+    function_cache = function_cache or NULL_FUNCTION_CACHE
+    result_cache = result_cache or NULL_RESULT_CACHE
+    single_flight = single_flight or NULL_SINGLE_FLIGHT
 
-    async def graphql_endpoint(request: Request) -> Awaitable[JSONResponse]:
+    def resolve_query(operation: Dict[str, Any]) -> str:
+        """The operation's query document, looking up or registering persisted queries"""
+        query = operation.get("query")
+        persisted_query = (operation.get("extensions") or {}).get("persistedQuery")
+        if persisted_query is None:
+            if query is None:
+                raise GraphQLError("Must provide query string")
+            return query
+        if persisted_queries is None:
+            if query is None:
+                raise GraphQLError("PersistedQueryNotSupported")
+            return query
+        sha256_hash = persisted_query.get("sha256Hash")
+        if query is None:
+            query = persisted_queries.get(sha256_hash)
+            metrics.observe_cache("persisted_query", query is not None)
+            if query is None:
+                raise GraphQLError("PersistedQueryNotFound")
+            return query
+        persisted_queries.register(sha256_hash, query)
+        return query
 
-        query = await get_query(request)
-        variables = await get_variables(request)
-        jwt_claims = await get_jwt_claims(request)
+    async def run_operation(
+        request: Request, operation: Dict[str, Any], jwt_claims: Dict[str, Any], timings: RequestTimer, **context
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Execute one operation from the request, returning its response and context"""
+        variables = operation.get("variables") or {}
+        try:
+            query = resolve_query(operation)
+        except GraphQLError as error:
+            return {"data": None, "errors": [error.formatted]}, {"operation_name": "unknown", "document": None}
         request_context = {
             "request": request,
             "database": database,
@@ -46,43 +149,327 @@ def get_graphql_route(
             "variables": variables,
             "jwt_claims": jwt_claims,
             "default_role": default_role,
+            "timings": timings,
+            "metrics": metrics,
+            "slow_query_log": slow_query_log,
+            "operation_name": "unknown",
+            "query_cost": None,
+            "json_codec": json_codec,
+            "function_cache": function_cache,
+            "result_cache": result_cache,
+            "join_strategy": join_strategy,
+            "single_flight": single_flight,
+            "document": None,
+            **context,
         }
-        result = await graphql_exec(
-            schema=gql_schema,
-            source=query,
-            context_value=request_context,
-            variable_values=variables,
+        result = await execute_operation(
+            gql_schema=gql_schema,
+            query=query,
+            variables=variables,
+            context=request_context,
+            timings=timings,
+            complexity=complexity,
+            admission=admission,
+            allow_mutations=request.method == "POST",
+            introspection=introspection,
         )
         errors = result.errors
+        if errors:
+            metrics.observe_errors(errors)
         result_dict = {
             "data": result.data,
             "errors": [error.formatted for error in errors or []],
         }
-        return JSONResponse(result_dict)
+        if timing_extensions:
+            result_dict["extensions"] = {"timings": timings.to_dict()}
+        return result_dict, request_context
+
+    async def run_batch(
+        request: Request,
+        operations: List[Dict[str, Any]],
+        jwt_claims: Dict[str, Any],
+        timings: RequestTimer,
+        role_pinned: bool = False,
+        deadline: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Execute each operation in turn on a single pooled connection"""
+        results = []
+        # Resolvers share the connection so their transactions must not interleave
+        context: Dict[str, Any] = {"transaction_lock": asyncio.Lock(), "role_pinned": role_pinned, "deadline": deadline}
+
+        async def run_each():
+            for operation in operations:
+                operation_timings = RequestTimer() if is_timed else NULL_TIMER
+                try:
+                    result_dict, _ = await run_operation(request, operation, jwt_claims, operation_timings, **context)
+                except TooManyRequests as exc:
+                    # A transaction must not commit part of the batch
+                    if batch_transaction:
+                        raise
+                    # Other operations keep their results
+                    error = GraphQLError(exc.detail)
+                    metrics.observe_errors([error])
+                    result_dict = {"data": None, "errors": [error.formatted]}
+                timings.merge(operation_timings)
+                results.append(result_dict)
+
+        # Connections are tracked per task so resolvers reuse the connection checked out here
+        async with database.connection():
+            if batch_transaction:
+                pending_invalidations: List[Optional[List[str]]] = []
+                context["pending_invalidations"] = pending_invalidations
+                async with database.transaction():
+                    statement_timeout = remaining_ms(deadline) if deadline is not None else None
+                    if has_claims(jwt_claims, default_role, not role_pinned, statement_timeout):
+                        with timings.phase("claims"):
+                            await database.execute(
+                                build_claims(jwt_claims, default_role, not role_pinned, statement_timeout)
+                            )
+                        context["claims_set"] = True
+                    await run_each()
+                # Cached results remain valid until the batch's writes are committed
+                for tables in pending_invalidations:
+                    result_cache.invalidate(tables)
+            else:
+                await run_each()
+        return results
+
+    async def graphql_endpoint(request: Request) -> Awaitable[Response]:
+        with metrics.track_request() as request_labels:
+            start = perf_counter()
+            timings = RequestTimer() if is_timed else NULL_TIMER
+
+            with timings.phase("body_parse"):
+                operations, is_batch = await get_operations(request, json_codec)
+            if len(operations) > max_batch_size:
+                raise HTTPException(400, f"Batches are limited to {max_batch_size} operations")
+            with timings.phase("jwt_decode"):
+                jwt_claims = await get_jwt_claims(request)
+            deadline = get_deadline(request, deadline_header, start)
+
+            async def run() -> Any:
+                # Backends with pools dedicated to roles route the request's statements by its role
+                with role_scope(database, get_role(jwt_claims, default_role)) as role_pinned:
+                    if is_batch:
+                        return await run_batch(request, operations, jwt_claims, timings, role_pinned, deadline)
+                    return await run_operation(
+                        request, operations[0], jwt_claims, timings, role_pinned=role_pinned, deadline=deadline
+                    )
+
+            try:
+                run_result = await cancel_on_disconnect(request, run())
+            except ClientDisconnect:
+                request_labels["operation"] = "disconnected"
+                # The client will not read the response
+                return Response(status_code=499)
+            except DeadlineExceeded as exc:
+                raise HTTPException(504, str(exc))
+
+            if is_batch:
+                request_labels["operation"] = "batch"
+                with timings.phase("serialize"):
+                    response = Response(json_codec.dumps(run_result), media_type="application/json")
+            else:
+                result_dict, request_context = run_result
+                request_labels["operation"] = request_context["operation_name"]
+                etag = request_context.get("etag")
+                if etag is not None and not result_dict["errors"]:
+                    # Cached introspection results are only serialized for clients without a current copy
+                    headers = {"ETag": etag, "Cache-Control": NO_CACHE}
+                    # Conditional requests only apply to GET
+                    if request.method == "GET" and etag_matches(request.headers.get("if-none-match"), etag):
+                        response = Response(status_code=304, headers=headers)
+                    else:
+                        with timings.phase("serialize"):
+                            response = Response(
+                                json_codec.dumps(result_dict), media_type="application/json", headers=headers
+                            )
+                else:
+                    with timings.phase("serialize"):
+                        response = Response(json_codec.dumps(result_dict), media_type="application/json")
 
-    graphql_route = Route(path=path, endpoint=graphql_endpoint, methods=["POST"], name=name)
+                if request.method == "GET" and etag is None:
+                    response = cacheable_response(request, response, result_dict, request_context, bool(jwt_claims))
+
+            if server_timing:
+                response.headers["Server-Timing"] = timings.to_server_timing()
+            return response
+
+    def cacheable_response(
+        request: Request, response: Response, result_dict: Dict[str, Any], context: Dict[str, Any], private: bool
+    ) -> Response:
+        """Add caching headers to a GET response, or replace it with 304 if the client's copy is current"""
+        document = context["document"]
+        if result_dict["errors"] or document is None:
+            cache_control = "no-store"
+        else:
+            _, trees = parse_document(gql_schema, document, context["variables"])
+            cache_control = get_cache_control(trees, private=private)
+        etag = get_etag(response.body)
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return response
+
+    graphql_route = Route(path=path, endpoint=graphql_endpoint, methods=["GET", "POST"], name=name)
 
     return graphql_route
 
 
-async def get_query(request: Request) -> Awaitable[str]:
-    """Retrieve the GraphQL query from the Starlette Request"""
+async def execute_operation(
+    gql_schema: Schema,
+    query: str,
+    variables: Optional[Dict[str, Any]],
+    context: Dict[str, Any],
+    timings: RequestTimer = NULL_TIMER,
+    complexity: Optional[ComplexityLimits] = None,
+    admission: Optional[AdmissionController] = None,
+    allow_mutations: bool = True,
+    introspection: Optional[IntrospectionCache] = None,
+) -> ExecutionResult:
+    """Parse, validate and execute a GraphQL operation, timing each step
 
-    content_type = request.headers.get("content-type", "")
-    if content_type == "application/graphql":
-        return await request.body()
-    if content_type == "application/json":
-        return (await request.json())["query"]
-    raise HTTPException(400, "content-type header must be set")
+    When *complexity* limits are provided, operations exceeding them are rejected
+    before execution and the estimated cost is stored in context["query_cost"]
+
+    When an *admission* controller is provided, execution waits for admission and
+    raises nebulo.server.admission.TooManyRequests if it is not granted in time
 
+    When an *introspection* cache is provided, introspection queries are answered from it and
+    the ETag of their result is stored in context["etag"]
+
+    The parsed document is stored in context["document"]
+    """
 
-async def get_variables(request) -> Awaitable[Dict[str, Any]]:
-    """Retrieve the GraphQL variables from the Starlette Request"""
+    introspection_key = introspection.key(query, variables) if introspection is not None else None
+    if introspection is not None and introspection_key is not None:
+        # Repeated introspection queries are answered without being parsed or validated
+        cached = introspection.get(introspection_key)
+        if cached is not None:
+            context["document"], result = cached
+            context["operation_name"] = get_operation_name(context["document"])
+            context["etag"] = introspection.get_etag(introspection_key)
+            context["metrics"].observe_cache("introspection", True)
+            return result
+
+    try:
+        with timings.phase("gql_parse"):
+            document = parse(query)
+    except GraphQLError as error:
+        return ExecutionResult(data=None, errors=[error])
+
+    context["document"] = document
+    context["operation_name"] = get_operation_name(document)
+
+    operation = get_operation_ast(document)
+    if not allow_mutations and operation is not None and operation.operation != OperationType.QUERY:
+        return ExecutionResult(
+            data=None,
+            errors=[GraphQLError(f"Can only perform a {operation.operation.value} operation from a POST request")],
+        )
+
+    if introspection is not None and introspection_key is not None and is_introspection(document):
+        with timings.phase("introspection"):
+            result = await introspection.execute(document, introspection_key, variables)
+        context["metrics"].observe_cache("introspection", False)
+        context["etag"] = introspection.get_etag(introspection_key)
+        return result
+
+    with timings.phase("gql_validate"):
+        validation_errors = validate(gql_schema, document)
+    if validation_errors:
+        return ExecutionResult(data=None, errors=validation_errors)
+
+    if complexity is not None:
+        with timings.phase("gql_complexity"):
+            try:
+                _, trees = parse_document(gql_schema, document, variables)
+            except GraphQLError as error:
+                return ExecutionResult(data=None, errors=[error])
+            context["query_cost"] = complexity.cost(trees)
+            complexity_errors = complexity.validate(trees, context["query_cost"])
+        if complexity_errors:
+            return ExecutionResult(data=None, errors=complexity_errors)
+
+    if admission is None:
+        return await execute_document(gql_schema, document, variables, context, timings)
+
+    key = admission_key(context["jwt_claims"], context["default_role"])
+    admission_start = perf_counter()
+    async with admission.admit(key, cost=context.get("query_cost") or 1.0):
+        timings.record("admission", perf_counter() - admission_start)
+        return await execute_document(gql_schema, document, variables, context, timings)
+
+
+async def execute_document(
+    gql_schema: Schema,
+    document: DocumentNode,
+    variables: Optional[Dict[str, Any]],
+    context: Dict[str, Any],
+    timings: RequestTimer,
+) -> ExecutionResult:
+    with timings.phase("execute"):
+        result = execute(schema=gql_schema, document=document, context_value=context, variable_values=variables)
+        if isawaitable(result):
+            result = await result
+    return result
+
+
+def get_operation_name(document: DocumentNode) -> str:
+    """Name of the document's operation for reporting purposes"""
+    operation = get_operation_ast(document)
+    if operation is None:
+        return "unknown"
+    return operation.name.value if operation.name else "anonymous"
+
+
+async def get_operations(request: Request, json_codec: JSONCodec = JSON_CODEC) -> Tuple[List[Dict[str, Any]], bool]:
+    """Retrieve the GraphQL operations from the Starlette Request
+
+    The body is read and decoded once. A JSON array body is a batch of operations.
+    GET requests pass a single operation's query, variables and extensions as URL parameters.
+    Returns the operations and whether they were batched
+    """
+
+    if request.method == "GET":
+        operation: Dict[str, Any] = {}
+        try:
+            for key in ("query", "variables", "extensions"):
+                value = request.query_params.get(key)
+                if value is None:
+                    continue
+                if key == "query":
+                    operation[key] = value
+                    continue
+                operation[key] = json_codec.loads(value)
+                if not isinstance(operation[key], (dict, type(None))):
+                    raise ValueError(f"{key} must be a JSON object")
+        except ValueError:
+            raise HTTPException(400, "URL parameters variables and extensions must be valid JSON objects")
+        if not is_operation(operation):
+            raise HTTPException(400, "GET requests must provide a query or persisted query URL parameter")
+        return [operation], False
 
     content_type = request.headers.get("content-type", "")
     if content_type == "application/graphql":
-        raise NotImplementedError("Getting variables from graphql content type not known")
-
+        return [{"query": (await request.body()).decode("utf-8")}], False
     if content_type == "application/json":
-        return (await request.json()).get("variables", {})
+        try:
+            body = json_codec.loads(await request.body())
+        except ValueError:
+            raise HTTPException(400, "Request body is not valid JSON")
+        is_batch = isinstance(body, list)
+        operations = body if is_batch else [body]
+        if not operations or not all(is_operation(operation) for operation in operations):
+            raise HTTPException(400, "Request body must be an operation or a non-empty array of operations")
+        return operations, is_batch
     raise HTTPException(400, "content-type header must be set")
+
+
+def is_operation(operation: Any) -> bool:
+    """Does a decoded request contain a query or a persisted query reference"""
+    if not isinstance(operation, dict):
+        return False
+    extensions = operation.get("extensions")
+    return "query" in operation or (isinstance(extensions, dict) and "persistedQuery" in extensions)
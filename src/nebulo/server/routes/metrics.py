@@ -0,0 +1,24 @@
+from nebulo.server.metrics import MetricsRegistry
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+__all__ = ["get_metrics_route"]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def get_metrics_route(metrics: MetricsRegistry, path: str = "/metrics", name: str = "metrics") -> Route:
+    """Create a Starlette Route exposing metrics in the Prometheus text format
+
+    **Parameters**
+
+    * **metrics**: _NebuloMetrics_ = Registry passed to get_graphql_route
+    * **path**: _str_ = URL path to serve metrics from
+    * **name**: _str_ = Name of the metrics Starlette route
+    """
+
+    async def metrics_endpoint(_: Request) -> PlainTextResponse:
+        return PlainTextResponse(metrics.render(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+    return Route(path=path, endpoint=metrics_endpoint, methods=["GET"], name=name)
@@ -0,0 +1,30 @@
+from nebulo.server.http_cache import NO_CACHE, etag_matches
+from nebulo.server.introspection import IntrospectionCache
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+
+__all__ = ["get_schema_route"]
+
+
+def get_schema_route(introspection: IntrospectionCache, path: str = "/schema.graphql", name: str = "schema") -> Route:
+    """Create a Starlette Route serving the schema in the GraphQL schema definition language
+
+    The SDL is printed once, when the IntrospectionCache is created, and served with an
+    ETag of the schema version
+
+    **Parameters**
+
+    * **introspection**: _IntrospectionCache_ = Cache passed to get_graphql_route
+    * **path**: _str_ = URL path to serve the schema from
+    * **name**: _str_ = Name of the schema Starlette route
+    """
+
+    headers = {"ETag": introspection.etag, "Cache-Control": NO_CACHE}
+
+    async def schema_endpoint(request: Request) -> Response:
+        if etag_matches(request.headers.get("if-none-match"), introspection.etag):
+            return Response(status_code=304, headers=headers)
+        return PlainTextResponse(introspection.sdl, headers=headers)
+
+    return Route(path=path, endpoint=schema_endpoint, methods=["GET"], name=name)
@@ -0,0 +1,68 @@
+"""
+Coalescing of concurrent identical reads
+
+Reads of the same root field of the same normalized operation, with the same variables,
+JWT claims and role, that arrive while one is executing wait for its result instead of
+executing again. Results are only shared while in flight, so they are never stale
+"""
+from __future__ import annotations
+
+import asyncio
+import typing
+
+from nebulo.server.result_cache import CacheKey, QueryResultCache
+
+__all__ = ["SingleFlight", "NULL_SINGLE_FLIGHT"]
+
+
+class Flight:
+    """An execution and the number of reads awaiting it"""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Executes each distinct read once among concurrent callers
+
+    **Parameters**
+
+    * **enabled**: _bool_ = Coalesce reads. When False every read executes on its own
+    """
+
+    key = staticmethod(QueryResultCache.key)
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.flights: typing.Dict[CacheKey, Flight] = {}
+
+    async def run(
+        self, key: CacheKey, execute: typing.Callable[[], typing.Awaitable[typing.Any]]
+    ) -> typing.Tuple[bool, typing.Any]:
+        """Whether an execution for *key* was already in flight, and the result of executing it
+
+        The execution is cancelled if every caller awaiting it is cancelled
+        """
+        flight = self.flights.get(key)
+        is_coalesced = flight is not None
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(execute()))
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self.land(key, flight))
+        flight.waiters += 1
+        try:
+            # One caller being cancelled must not cancel the execution the others await
+            return is_coalesced, await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self.land(key, flight)
+                flight.task.cancel()
+
+    def land(self, key: CacheKey, flight: Flight) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+
+NULL_SINGLE_FLIGHT = SingleFlight(enabled=False)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import random
+import typing
+
+from graphql.language import print_ast
+from nebulo.gql.alias import ResolveInfo
+from nebulo.sql.statement_helpers import Explain
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import ClauseElement
+
+__all__ = ["SlowQueryLog", "NULL_SLOW_QUERY_LOG", "document_hash"]
+
+# Render parameters by name e.g. :param_1
+NAMED_PARAM_DIALECT = postgresql.dialect(paramstyle="named")
+
+
+class SlowQueryLog:
+    """Logs SQL statements that exceed a duration threshold
+
+    **Parameters**
+
+    * **threshold_ms**: _float_ = Statements slower than this many milliseconds are logged. None disables the log
+    * **explain_sample_rate**: _float_ = Fraction of slow read queries to re-run with EXPLAIN (ANALYZE, BUFFERS)
+    * **redact_parameters**: _bool_ = Replace bound parameter values with their type in the log
+    * **logger**: _logging.Logger_ = Logger to write slow queries to
+    """
+
+    def __init__(
+        self,
+        threshold_ms: typing.Optional[float],
+        explain_sample_rate: float = 0.0,
+        redact_parameters: bool = True,
+        logger: typing.Optional[logging.Logger] = None,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.redact_parameters = redact_parameters
+        self.logger = logger or logging.getLogger("nebulo.slow_query")
+
+    def is_slow(self, seconds: float) -> bool:
+        return self.threshold_ms is not None and seconds * 1000 >= self.threshold_ms
+
+    async def observe(
+        self, database, info: ResolveInfo, query: ClauseElement, seconds: float, explain: bool = False
+    ) -> None:
+        """Log a slow statement. Must be called within the transaction that executed *query*
+
+        Only pass *explain* for read-only statements. EXPLAIN ANALYZE executes the statement again
+        """
+        compiled = query.compile(dialect=NAMED_PARAM_DIALECT)
+        record: typing.Dict[str, typing.Any] = {
+            "operation": info.operation.name.value if info.operation.name else None,
+            "document_hash": document_hash(info),
+            "field": info.path.key,
+            "duration_ms": round(seconds * 1000, 3),
+            "sql": str(compiled),
+            "parameters": self.format_parameters(compiled.params),
+        }
+
+        if explain and self.explain_sample_rate > 0 and random.random() < self.explain_sample_rate:
+            record["plan"] = await self.explain(database, query)
+
+        self.logger.warning(
+            "Slow query: operation=%s document_hash=%s field=%s duration_ms=%s parameters=%s\n%s%s",
+            record["operation"],
+            record["document_hash"],
+            record["field"],
+            record["duration_ms"],
+            json.dumps(record["parameters"], default=str),
+            record["sql"],
+            "\n" + record["plan"] if record.get("plan") else "",
+            extra={"nebulo_slow_query": record},
+        )
+
+    def format_parameters(self, params: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        if not self.redact_parameters:
+            return params
+        return {key: f"<{type(value).__name__}>" for key, value in params.items()}
+
+    async def explain(self, database, query: ClauseElement) -> typing.Optional[str]:
+        """Run EXPLAIN (ANALYZE, BUFFERS) in a savepoint so a failure can not abort the request's transaction"""
+        try:
+            async with database.transaction():
+                rows = await database.fetch_all(Explain(query, options="ANALYZE, BUFFERS"))
+        except Exception as exc:  # pylint: disable=broad-except
+            self.logger.debug("Failed to explain slow query: %s", exc)
+            return None
+        return "\n".join(row["QUERY PLAN"] for row in rows)
+
+
+NULL_SLOW_QUERY_LOG = SlowQueryLog(threshold_ms=None)
+
+
+def document_hash(info: ResolveInfo) -> str:
+    """Hash of the normalized GraphQL operation and the fragments it uses
+
+    Formatting and comments do not change the hash. Variables are not included
+    """
+    normalized = print_ast(info.operation) + "".join(print_ast(info.fragments[name]) for name in sorted(info.fragments))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
@@ -1,10 +1,22 @@
 from typing import Optional
 
-from databases import Database
+from nebulo.gql.complexity import ComplexityLimits
 from nebulo.gql.sqla_to_gql import sqla_models_to_graphql_schema
+from nebulo.server.admission import AdmissionController, TokenBucketBackend
+from nebulo.server.backend import get_execution_backend
+from nebulo.server.codec import get_json_codec
+from nebulo.server.compression import CompressionMiddleware
 from nebulo.server.exception import http_exception
-from nebulo.server.routes import get_graphiql_route, get_graphql_route
+from nebulo.server.function_cache import FunctionResultCache
+from nebulo.server.http_cache import PersistedQueries
+from nebulo.server.introspection import IntrospectionCache
+from nebulo.server.metrics import NebuloMetrics, database_pool_collector
+from nebulo.server.result_cache import InvalidationListener, QueryResultCache
+from nebulo.server.routes import get_graphiql_route, get_graphql_route, get_metrics_route, get_schema_route
+from nebulo.server.single_flight import SingleFlight
+from nebulo.server.slow_query import SlowQueryLog
 from nebulo.sql.reflection.manager import reflect_sqla_models
+from nebulo.sql.reflection.statistics import reflect_row_estimates
 from sqlalchemy import create_engine
 from starlette.applications import Starlette
 from starlette.exceptions import HTTPException
@@ -18,13 +30,123 @@ def create_app(
     jwt_identifier: Optional[str] = None,
     jwt_secret: Optional[str] = None,
     default_role: Optional[str] = None,
+    server_timing: bool = False,
+    timing_extensions: bool = False,
+    metrics: bool = False,
+    metrics_path: str = "/metrics",
+    metrics_dir: Optional[str] = None,
+    slow_query_ms: Optional[float] = None,
+    explain_sample_rate: float = 0.0,
+    max_query_depth: Optional[int] = None,
+    max_query_cost: Optional[float] = None,
+    max_query_breadth: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    max_concurrency_per_user: Optional[int] = None,
+    rate_limit: Optional[float] = None,
+    rate_limit_burst: Optional[float] = None,
+    admission_timeout: float = 5.0,
+    token_buckets: Optional[TokenBucketBackend] = None,
+    batch_transaction: bool = False,
+    max_batch_size: int = 25,
+    json_codec: str = "json",
+    persisted_query_cache_size: int = 1000,
+    introspection_cache_size: int = 32,
+    compression: bool = False,
+    compression_minimum_size: int = 1024,
+    compression_level: int = 6,
+    function_cache_size: int = 0,
+    function_cache_ttl: float = 300.0,
+    result_cache_size: int = 0,
+    result_cache_channel: Optional[str] = "nebulo_cache",
+    join_strategy: str = "subquery",
+    execution_backend: str = "databases",
+    pgbouncer: bool = False,
+    statement_cache_size: int = 100,
+    role_pool_size: int = 0,
+    max_role_pools: int = 8,
+    single_flight: bool = False,
+    deadline_header: Optional[str] = None,
 ) -> Starlette:
-    """Instantiate the Starlette app"""
+    """Instantiate the Starlette app
+
+    When serving with multiple worker processes, pass a *metrics_dir* shared by
+    all workers so each scrape reports the totals across processes
+
+    SQL statements slower than *slow_query_ms* are logged to the "nebulo.slow_query"
+    logger and *explain_sample_rate* of the slow reads also log their query plan
+
+    Operations nested deeper than *max_query_depth* tables, selecting more than
+    *max_query_breadth* fields in one selection set or with an estimated cost above
+    *max_query_cost* rows are rejected before any SQL is built. Costs use the planner's
+    row estimates for each table, as of startup
+
+    At most *max_concurrency* operations execute at once, and at most *max_concurrency_per_user*
+    for a single JWT subject or role. Each user may also spend *rate_limit* query cost per second
+    with bursts up to *rate_limit_burst*. Operations wait up to *admission_timeout* seconds to be
+    admitted before being rejected with HTTP 429. Limits are enforced per worker process unless
+    a shared *token_buckets* backend is provided for rate limits
+
+    Requests may batch up to *max_batch_size* operations in a JSON array. Batches run on a
+    single connection and, with *batch_transaction*, in a single transaction
+
+    *json_codec* selects the JSON implementation, "json" or "orjson". If orjson is not
+    installed the standard library is used
+
+    Up to *persisted_query_cache_size* persisted queries are kept in memory. Set it to 0 to
+    disable persisted queries
+
+    Results of up to *introspection_cache_size* distinct introspection queries are kept in memory.
+    Set it to 0 to execute every introspection query. The schema is served in the GraphQL schema
+    definition language at /schema.graphql
+
+    With *compression*, responses of at least *compression_minimum_size* bytes are compressed
+    with brotli or gzip at *compression_level*, from 1 (fastest) to 9 (smallest)
+
+    Results of immutable SQL functions are cached for *function_cache_ttl* seconds in up to
+    *function_cache_size* bytes of memory per worker. The cache is disabled by default
+
+    Results of queries reading only tables with a @cache comment directive are cached in up to
+    *result_cache_size* bytes of memory per worker. Results are invalidated by mutations and by
+    notifications on *result_cache_channel* naming a changed table. The cache is disabled by default
+
+    *join_strategy* selects how nested relationships are read. "subquery" selects a correlated
+    subquery per relationship, "lateral" joins relationships with LEFT JOIN LATERAL and "auto"
+    joins connections nested under connections laterally
+
+    *execution_backend* selects how statements are executed. "databases" uses the databases
+    package and "asyncpg" uses asyncpg directly, avoiding the per-statement overhead of databases
+
+    Each connection caches up to *statement_cache_size* prepared statements. With *pgbouncer*, for
+    connections through PgBouncer in transaction pooling mode, statements are not prepared and
+    no state outlives a transaction. Result cache invalidations are then only received from
+    mutations, as LISTEN requires a session
+
+    With a *role_pool_size* above 0, up to *max_role_pools* roles each get a pool of that many
+    connections with the role set for their session, so requests only set their JWT claims. Role
+    pools require the asyncpg execution backend and are incompatible with *pgbouncer*
+
+    With *single_flight*, concurrent identical reads with the same variables, claims and role
+    share a single execution
+
+    Requests may send their time budget in milliseconds in the *deadline_header* header, e.g.
+    "X-Timeout-Ms". Statements are given a statement_timeout of the budget remaining when their
+    transaction begins. Work for clients that disconnect is always cancelled
+    """
 
     if not (jwt_identifier is not None) == (jwt_secret is not None):
         raise Exception("jwt_token_identifier and jwt_secret must be provided together")
 
-    database = Database(connection)
+    if pgbouncer and role_pool_size > 0:
+        raise Exception("role_pool_size sets the role for each connection's session, which pgbouncer does not preserve")
+
+    # Named prepared statements are bound to a server session, which PgBouncer does not preserve
+    database = get_execution_backend(
+        execution_backend,
+        connection,
+        role_pool_size=role_pool_size,
+        max_role_pools=max_role_pools,
+        statement_cache_size=0 if pgbouncer else statement_cache_size,
+    )
     # Reflect database to sqla models
     sqla_engine = create_engine(connection)
     sqla_models, sql_functions = reflect_sqla_models(engine=sqla_engine, schema=schema)
@@ -39,6 +161,34 @@ def create_app(
 
     graphql_path = "/"
 
+    complexity = None
+    # Rate limits are weighted by the estimated query cost
+    if any(limit is not None for limit in (max_query_depth, max_query_cost, max_query_breadth, rate_limit)):
+        complexity = ComplexityLimits(
+            max_depth=max_query_depth,
+            max_cost=max_query_cost,
+            max_breadth=max_query_breadth,
+            row_estimates=reflect_row_estimates(sqla_engine, schema=schema),
+        )
+
+    metrics_registry = NebuloMetrics(multiprocess_dir=metrics_dir) if metrics else None
+
+    admission = None
+    if any(limit is not None for limit in (max_concurrency, max_concurrency_per_user, rate_limit)):
+        admission = AdmissionController(
+            max_concurrency=max_concurrency,
+            max_concurrency_per_key=max_concurrency_per_user,
+            rate=rate_limit,
+            burst=rate_limit_burst,
+            queue_timeout=admission_timeout,
+            buckets=token_buckets,
+        )
+
+    result_cache = QueryResultCache(max_bytes=result_cache_size)
+
+    # The schema's SDL is printed once, at startup
+    introspection = IntrospectionCache(gql_schema, maxsize=introspection_cache_size)
+
     graphql_route = get_graphql_route(
         gql_schema=gql_schema,
         database=database,
@@ -46,16 +196,55 @@ def create_app(
         default_role=default_role,
         path=graphql_path,
         name="graphql",
+        server_timing=server_timing,
+        timing_extensions=timing_extensions,
+        metrics=metrics_registry,
+        slow_query_log=SlowQueryLog(slow_query_ms, explain_sample_rate=explain_sample_rate),
+        complexity=complexity,
+        admission=admission,
+        batch_transaction=batch_transaction,
+        max_batch_size=max_batch_size,
+        json_codec=get_json_codec(json_codec),
+        persisted_queries=PersistedQueries(maxsize=persisted_query_cache_size) if persisted_query_cache_size else None,
+        function_cache=FunctionResultCache(max_bytes=function_cache_size, ttl=function_cache_ttl),
+        result_cache=result_cache,
+        join_strategy=join_strategy,
+        single_flight=SingleFlight(enabled=single_flight),
+        deadline_header=deadline_header,
+        introspection=introspection if introspection_cache_size else None,
     )
 
     graphiql_route = get_graphiql_route(graphiql_path="/graphiql", graphql_path=graphql_path, name="graphiql")
 
+    schema_route = get_schema_route(introspection, path="/schema.graphql", name="schema")
+
+    routes = [graphql_route, graphiql_route, schema_route]
+    on_startup = [database.connect]
+    on_shutdown = [database.disconnect]
+
+    if metrics_registry is not None:
+        metrics_registry.add_collector(database_pool_collector(database, metrics_registry))
+        routes.append(get_metrics_route(metrics_registry, path=metrics_path))
+        on_startup.append(metrics_registry.start)
+        on_shutdown.append(metrics_registry.stop)
+
+    if result_cache.enabled and result_cache_channel and not pgbouncer:
+        listener = InvalidationListener(connection, result_cache, channel=result_cache_channel)
+        on_startup.append(listener.start)
+        on_shutdown.append(listener.stop)
+
+    middleware = [Middleware(CORSMiddleware, allow_origins=["*"])]
+    if compression:
+        middleware.append(
+            Middleware(CompressionMiddleware, minimum_size=compression_minimum_size, level=compression_level)
+        )
+
     _app = Starlette(
-        routes=[graphql_route, graphiql_route],
-        middleware=[Middleware(CORSMiddleware, allow_origins=["*"])],
+        routes=routes,
+        middleware=middleware,
         exception_handlers={HTTPException: http_exception},
-        on_startup=[database.connect],
-        on_shutdown=[database.disconnect],
+        on_startup=on_startup,
+        on_shutdown=on_shutdown,
     )
 
     return _app
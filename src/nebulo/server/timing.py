@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import typing
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+__all__ = ["RequestTimer", "NullTimer", "NULL_TIMER"]
+
+
+class RequestTimer:
+    """Accumulates the duration of named phases while serving a single request
+
+    Phases recorded more than once, e.g. by multiple root fields, are summed
+    """
+
+    def __init__(self) -> None:
+        self.phases: typing.Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> typing.Iterator[None]:
+        """Time the enclosed block and record it under *name*"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def merge(self, other: RequestTimer) -> None:
+        """Add the phases recorded by *other* to this timer"""
+        for name, seconds in other.phases.items():
+            self.record(name, seconds)
+
+    def to_dict(self) -> typing.Dict[str, float]:
+        """Phase durations in milliseconds"""
+        return {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}
+
+    def to_server_timing(self) -> str:
+        """Phase durations formatted as a Server-Timing header value"""
+        return ", ".join(f"{name};dur={duration}" for name, duration in self.to_dict().items())
+
+
+class NullTimer(RequestTimer):
+    """A RequestTimer that records nothing, used when timing is disabled"""
+
+    _null_context = nullcontext()
+
+    def phase(self, name: str) -> typing.ContextManager[None]:  # type: ignore
+        return self._null_context
+
+    def record(self, name: str, seconds: float) -> None:
+        pass
+
+
+NULL_TIMER = NullTimer()
@@ -16,6 +16,13 @@ def get_table_name(sqla_model: TableProtocol) -> str:
     return str(sqla_model.__table__.name)
 
 
+@lru_cache()
+def get_qualified_table_name(sqla_model: TableProtocol) -> str:
+    """Schema qualified name of the table e.g. public.account"""
+    table = sqla_model.__table__
+    return f"{table.schema}.{table.name}" if table.schema else str(table.name)
+
+
 @lru_cache()
 def get_relationships(sqla_model: TableProtocol) -> List[RelationshipProperty]:
     """Relationships with other tables"""
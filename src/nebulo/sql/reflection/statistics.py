@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from typing import Dict
+
+from sqlalchemy import text as sql_text
+
+
+def reflect_row_estimates(engine, schema: str) -> Dict[str, float]:
+    """Planner row count estimates for the tables and materialized views in a schema
+
+    Tables that have never been vacuumed or analyzed are omitted
+    """
+
+    sql = sql_text(
+        """
+    select
+        c.relname table_name,
+        c.reltuples row_estimate
+    from
+        pg_class c
+        join pg_namespace n on c.relnamespace = n.oid
+    where
+        n.nspname = :schema
+        and c.relkind in ('r', 'p', 'm')
+        and c.reltuples >= 0
+    """
+    )
+    rows = engine.execute(sql, schema=schema).fetchall()
+    return {table_name: float(row_estimate) for table_name, row_estimate in rows}
@@ -0,0 +1,70 @@
+"""
+Full-text search expressions for tables with tsvector columns or an @search comment directive
+
+Expressions are rendered with literal configurations and separators so they match
+expression indexes e.g.
+
+    create index on post using gin (to_tsvector('english', coalesce(title, '') || ' ' || coalesce(body, '')));
+"""
+from __future__ import annotations
+
+import typing
+from functools import lru_cache, reduce
+
+from nebulo.config import Config
+from nebulo.sql.inspect import get_columns, get_table_name
+from nebulo.sql.table_base import TableProtocol
+from sqlalchemy import func, literal_column, or_
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import FromClause
+
+__all__ = ["is_searchable", "to_search_clause", "to_search_rank"]
+
+
+@lru_cache()
+def is_searchable(sqla_model: TableProtocol) -> bool:
+    return bool(to_search_vectors(sqla_model, sqla_model.__table__))
+
+
+def to_search_vectors(sqla_model: TableProtocol, table: FromClause) -> typing.List[ColumnElement]:
+    """tsvector expressions to search, reading columns from *table*"""
+    search = Config.search(sqla_model)
+    vectors = [table.c[column.name] for column in get_columns(sqla_model) if isinstance(column.type, TSVECTOR)]
+    if search is not None and search.columns:
+        unknown_columns = [name for name in search.columns if name not in table.c]
+        if unknown_columns:
+            raise ValueError(
+                f"@search on table {get_table_name(sqla_model)} names unknown columns {', '.join(unknown_columns)}"
+            )
+        separator = literal_column("' '")
+        text = reduce(
+            lambda left, right: left + separator + right,
+            [func.coalesce(table.c[name], literal_column("''")) for name in search.columns],
+        )
+        vectors.append(func.to_tsvector(to_regconfig(sqla_model), text))
+    return vectors
+
+
+def to_regconfig(sqla_model: TableProtocol) -> ColumnElement:
+    search = Config.search(sqla_model)
+    return literal_column(f"'{search.config if search is not None else 'english'}'::regconfig")
+
+
+def to_tsquery(sqla_model: TableProtocol, text: str) -> ColumnElement:
+    return func.websearch_to_tsquery(to_regconfig(sqla_model), text)
+
+
+def to_search_clause(sqla_model: TableProtocol, table: FromClause, text: str) -> ColumnElement:
+    """Rows of *table* matching the web search syntax query *text*. Each vector is matched separately so
+    each may use its own GIN index"""
+    query = to_tsquery(sqla_model, text)
+    return or_(*[vector.op("@@")(query) for vector in to_search_vectors(sqla_model, table)])
+
+
+def to_search_rank(sqla_model: TableProtocol, table: FromClause, text: str) -> ColumnElement:
+    """Relevance of rows of *table* to the query *text*, higher is more relevant"""
+    query = to_tsquery(sqla_model, text)
+    return reduce(
+        lambda left, right: left + right, [func.ts_rank(x, query) for x in to_search_vectors(sqla_model, table)]
+    )
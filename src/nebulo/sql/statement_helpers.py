@@ -1,5 +1,25 @@
 from sqlalchemy import literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
 
 
 def literal_string(text):
     return literal_column(f"'{text}'")
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN a statement, preserving its bound parameters
+
+    Rows are returned in a single column named "QUERY PLAN"
+    """
+
+    def __init__(self, statement: ClauseElement, options: str = ""):
+        self.statement = statement
+        self.options = options
+
+
+@compiles(Explain)
+def compile_explain(element: Explain, compiler, **kwargs) -> str:
+    options = f"({element.options}) " if element.options else ""
+    return f"EXPLAIN {options}" + compiler.process(element.statement, **kwargs)
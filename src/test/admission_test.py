@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from nebulo.server.admission import AdmissionController, MemoryTokenBuckets, TooManyRequests, admission_key
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver');
+"""
+
+QUERY = "{ allAccounts { edges { node { id } } } }"
+
+
+def test_admission_key():
+    assert admission_key({"sub": 5, "role": "api_user"}, "anon") == "sub:5"
+    assert admission_key({"role": "api_user"}, "anon") == "role:api_user"
+    assert admission_key({}, "anon") == "role:anon"
+    assert admission_key({}, None) == "anonymous"
+
+
+def test_token_buckets_refill(event_loop):
+    buckets = MemoryTokenBuckets()
+    assert event_loop.run_until_complete(buckets.take("a", 10, rate=10, burst=10)) == 0
+    wait = event_loop.run_until_complete(buckets.take("a", 5, rate=10, burst=10))
+    assert 0 < wait <= 0.5
+    # Buckets are independent per key
+    assert event_loop.run_until_complete(buckets.take("b", 10, rate=10, burst=10)) == 0
+
+
+def test_token_buckets_are_bounded(event_loop):
+    buckets = MemoryTokenBuckets(maxsize=2, ttl=0.05)
+    for key in ("a", "b", "c"):
+        event_loop.run_until_complete(buckets.take(key, 10, rate=10, burst=10))
+    assert len(buckets.buckets) == 2
+
+    # Unused buckets are dropped once full
+    event_loop.run_until_complete(asyncio.sleep(0.1))
+    assert len(buckets.buckets) == 0
+    assert event_loop.run_until_complete(buckets.take("c", 10, rate=10, burst=10)) == 0
+
+
+def test_admission_concurrency_per_key(event_loop):
+    admission = AdmissionController(max_concurrency_per_key=1, queue_timeout=0.05)
+
+    async def run():
+        async with admission.admit("a"):
+            # Other users are unaffected
+            async with admission.admit("b"):
+                pass
+            with pytest.raises(TooManyRequests):
+                async with admission.admit("a"):
+                    pass
+        # Released slots admit queued operations
+        async with admission.admit("a"):
+            pass
+
+    event_loop.run_until_complete(run())
+    assert admission._per_key == {}
+
+
+def test_admission_queues_until_slot_is_free(event_loop):
+    admission = AdmissionController(max_concurrency=1, queue_timeout=1)
+    order = []
+
+    async def operation(name):
+        async with admission.admit(name):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    event_loop.run_until_complete(asyncio.gather(operation("a"), operation("b")))
+    assert order == ["a", "b"]
+
+
+def test_admission_rate_limit_weighted_by_cost(event_loop):
+    admission = AdmissionController(rate=10, burst=100, queue_timeout=0.01)
+
+    async def run():
+        async with admission.admit("a", cost=100):
+            pass
+        with pytest.raises(TooManyRequests) as exc_info:
+            async with admission.admit("a", cost=50):
+                pass
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after > 4
+
+    event_loop.run_until_complete(run())
+
+
+def test_admission_refunds_tokens_of_rejected_operations(event_loop):
+    admission = AdmissionController(max_concurrency=1, rate=10, burst=10, queue_timeout=0.05)
+
+    async def run():
+        async with admission.admit("a"):
+            with pytest.raises(TooManyRequests):
+                async with admission.admit("b", cost=10):
+                    pass
+        # The rejected operation's tokens were returned, so b is admitted without waiting to refill
+        async with admission.admit("b", cost=10):
+            pass
+
+    event_loop.run_until_complete(run())
+
+
+def test_admission_rejection_response(client_builder):
+    client = client_builder(SQL_UP, rate_limit=1, rate_limit_burst=1, admission_timeout=0)
+    with client:
+        resp = client.post("/", json={"query": QUERY})
+        assert resp.status_code == 200
+        assert resp.json()["errors"] == []
+
+        resp = client.post("/", json={"query": QUERY})
+        assert resp.status_code == 429
+        assert "Retry-After" in resp.headers
@@ -0,0 +1,109 @@
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+CREATE TABLE payment (
+    id serial primary key,
+    account_id int not null references account (id),
+    currency text not null,
+    amount numeric not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver'),
+(2, 'rachel');
+
+INSERT INTO payment (id, account_id, currency, amount) VALUES
+(1, 1, 'usd', 10),
+(2, 1, 'usd', 20),
+(3, 1, 'eur', 5),
+(4, 2, 'usd', 100);
+"""
+
+
+def test_aggregates(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = """
+    {
+        allPayments(first: 1) {
+            edges { node { id } }
+            aggregates {
+                count
+                sum { amount }
+                avg { amount }
+                min { amount }
+                max { amount }
+            }
+        }
+    }
+    """
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+
+    connection = result["data"]["allPayments"]
+    # Aggregates ignore pagination
+    assert len(connection["edges"]) == 1
+    assert connection["aggregates"] == [
+        {
+            "count": 4,
+            "sum": {"amount": 135},
+            "avg": {"amount": 33.75},
+            "min": {"amount": 5},
+            "max": {"amount": 100},
+        }
+    ]
+
+
+def test_aggregates_group_by(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = """
+    {
+        allPayments(condition: {currency: "usd"}) {
+            byAccount: aggregates(groupBy: [ACCOUNT_ID, CURRENCY]) {
+                keys { accountId currency amount }
+                total: sum { amount }
+            }
+        }
+    }
+    """
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+
+    assert result["data"]["allPayments"]["byAccount"] == [
+        {"keys": {"accountId": 1, "currency": "usd", "amount": None}, "total": {"amount": 30}},
+        {"keys": {"accountId": 2, "currency": "usd", "amount": None}, "total": {"amount": 100}},
+    ]
+
+
+def test_aggregates_nested_connection(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = """
+    {
+        allAccounts {
+            edges {
+                node {
+                    name
+                    paymentsByIdToAccountId {
+                        aggregates { count }
+                    }
+                }
+            }
+        }
+    }
+    """
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+
+    counts = {
+        edge["node"]["name"]: edge["node"]["paymentsByIdToAccountId"]["aggregates"][0]["count"]
+        for edge in result["data"]["allAccounts"]["edges"]
+    }
+    assert counts == {"oliver": 3, "rachel": 1}
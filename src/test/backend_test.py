@@ -0,0 +1,123 @@
+import pytest
+from nebulo.gql.resolve.resolvers.claims import build_claims, has_claims
+from nebulo.server.backend import AsyncpgBackend, CompiledQuery, RoleAffineBackend, get_execution_backend
+from nebulo.server.starlette import create_app
+from sqlalchemy import column, literal, select, table
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver'),
+(2, 'rachel');
+"""
+
+
+def test_asyncpg_backend_compiles_positional_parameters():
+    backend = AsyncpgBackend("postgresql://localhost/db")
+    account = table("account", column("id"), column("name"))
+    stmt = select([account.c.name]).where(account.c.id == 5).where(account.c.name != literal("buddy"))
+
+    sql, args = backend.compile(stmt)
+    assert "$1" in sql and "$2" in sql
+    assert "%(" not in sql
+    assert sorted(args, key=str) == [5, "buddy"]
+
+    # Compiled queries and SQL text are passed through
+    assert backend.compile(CompiledQuery(sql, args)) == (sql, args)
+    assert backend.compile("select 1") == ("select 1", [])
+
+
+def test_unknown_execution_backend():
+    with pytest.raises(ValueError):
+        get_execution_backend("unknown", "postgresql://localhost/db")
+
+
+def test_asyncpg_execution_backend(client_builder):
+    client = client_builder(SQL_UP, execution_backend="asyncpg")
+    query = """
+mutation {
+  createAccount(input: {clientMutationId: "a1", account: {id: 3, name: "Buddy"}}) {
+    account { id name }
+  }
+}
+    """
+    with client:
+        resp = client.post("/", json={"query": query})
+        assert resp.json()["errors"] == []
+        assert resp.json()["data"]["createAccount"]["account"] == {"id": 3, "name": "Buddy"}
+
+        resp = client.post("/", json={"query": "{ allAccounts(condition: {id: 2}) { edges { node { name } } } }"})
+    assert resp.json()["errors"] == []
+    assert resp.json()["data"]["allAccounts"]["edges"] == [{"node": {"name": "rachel"}}]
+
+
+SQL_TRANSACTION = """
+CREATE TABLE account (
+    id serial primary key
+);
+
+CREATE FUNCTION public.describe_transaction(prefix text) RETURNS text AS $$
+    SELECT prefix || current_setting('transaction_read_only') || ' ' || current_setting('role')
+$$ LANGUAGE sql IMMUTABLE;
+"""
+
+
+@pytest.mark.parametrize(
+    "execution_backend, default_role, expected",
+    [
+        # Anonymous reads run outside of a transaction
+        ("databases", None, "off none"),
+        ("asyncpg", None, "off none"),
+        ("databases", "postgres", "off postgres"),
+        # Authenticated reads begin a read only transaction along with setting claims
+        ("asyncpg", "postgres", "on postgres"),
+    ],
+)
+def test_read_transaction(client_builder, execution_backend, default_role, expected):
+    client = client_builder(SQL_TRANSACTION, execution_backend=execution_backend, default_role=default_role)
+    with client:
+        resp = client.post("/", json={"query": '{ describeTransaction(prefix: "") }'})
+    assert resp.json()["errors"] == []
+    assert resp.json()["data"]["describeTransaction"] == expected
+
+
+def test_compile_literal_escapes_claims():
+    backend = AsyncpgBackend("postgresql://localhost/db")
+    sql = backend.compile_literal(build_claims({"sub": "o'neil"}, None))
+    assert "'o''neil'" in sql
+
+
+def test_role_pools_are_bounded():
+    backend = RoleAffineBackend("postgresql://localhost/db", role_pool_size=2, max_role_pools=1)
+    with backend.use_role("anon") as pinned:
+        assert pinned
+    with backend.use_role("admin") as pinned:
+        assert not pinned
+    with backend.use_role(None) as pinned:
+        assert not pinned
+    with backend.use_role("anon") as pinned:
+        assert pinned
+
+
+def test_pinned_roles_are_not_set_per_transaction():
+    sql = str(build_claims({"role": "anon", "sub": "1"}, None, set_role=False))
+    assert sql.count("set_config(") == 2
+    assert not has_claims({}, "anon", set_role=False)
+
+
+def test_role_pools_require_session_state():
+    with pytest.raises(Exception):
+        create_app("postgresql://localhost/db", execution_backend="asyncpg", pgbouncer=True, role_pool_size=2)
+
+
+def test_role_pool(client_builder):
+    client = client_builder(SQL_TRANSACTION, execution_backend="asyncpg", default_role="postgres", role_pool_size=2)
+    with client:
+        resp = client.post("/", json={"query": '{ describeTransaction(prefix: "") }'})
+    assert resp.json()["errors"] == []
+    # The role is set for the connection's session, so the read needs no transaction
+    assert resp.json()["data"]["describeTransaction"] == "off postgres"
@@ -0,0 +1,72 @@
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver'),
+(2, 'rachel');
+"""
+
+BATCH = [
+    {"query": "query getAccounts { allAccounts { edges { node { id } } } }"},
+    {
+        "query": "query getAccount($accountId: Int!) { allAccounts(condition: {id: $accountId}) { edges { node { name } } } }",
+        "variables": {"accountId": 2},
+    },
+]
+
+
+def test_batch_returns_array_of_results(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.post("/", json=BATCH)
+    assert resp.status_code == 200
+    payload = resp.json()
+    assert isinstance(payload, list)
+    assert len(payload) == 2
+    assert all(result["errors"] == [] for result in payload)
+    assert len(payload[0]["data"]["allAccounts"]["edges"]) == 2
+    assert payload[1]["data"]["allAccounts"]["edges"][0]["node"]["name"] == "rachel"
+
+
+def test_batch_in_single_transaction(client_builder):
+    client = client_builder(SQL_UP, batch_transaction=True, default_role="postgres")
+    with client:
+        resp = client.post("/", json=BATCH)
+    assert resp.status_code == 200
+    payload = resp.json()
+    assert [result["errors"] for result in payload] == [[], []]
+
+
+def test_batch_errors_are_per_operation(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.post("/", json=[BATCH[0], {"query": "{ notAField }"}])
+    assert resp.status_code == 200
+    payload = resp.json()
+    assert payload[0]["errors"] == []
+    assert payload[1]["data"] is None
+    assert len(payload[1]["errors"]) == 1
+
+
+def test_batch_size_limit(client_builder):
+    client = client_builder(SQL_UP, max_batch_size=1)
+    with client:
+        resp = client.post("/", json=BATCH)
+        assert resp.status_code == 400
+
+        resp = client.post("/", json=[])
+        assert resp.status_code == 400
+
+
+def test_batch_admission_rejections_are_per_operation(client_builder):
+    client = client_builder(SQL_UP, rate_limit=1, rate_limit_burst=1, admission_timeout=0.01)
+    with client:
+        resp = client.post("/", json=BATCH)
+    assert resp.status_code == 200
+    payload = resp.json()
+    assert payload[0]["errors"] == []
+    assert payload[1]["data"] is None
+    assert payload[1]["errors"][0]["message"] == "Rate limit exceeded"
@@ -0,0 +1,72 @@
+import asyncio
+from time import perf_counter
+
+import pytest
+from nebulo.server.cancellation import DeadlineExceeded, cancel_on_disconnect, remaining_ms
+from starlette.requests import ClientDisconnect, Request
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver');
+
+CREATE FUNCTION public.current_statement_timeout(prefix text) RETURNS text AS $$
+    SELECT prefix || current_setting('statement_timeout')
+$$ LANGUAGE sql IMMUTABLE;
+"""
+
+
+def make_request(disconnect_after: float) -> Request:
+    async def receive():
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    return Request({"type": "http", "method": "POST", "headers": []}, receive)
+
+
+def test_cancel_on_disconnect(event_loop):
+    cancelled = []
+
+    async def work():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(ClientDisconnect):
+        event_loop.run_until_complete(cancel_on_disconnect(make_request(0.01), work()))
+    assert cancelled == [True]
+
+
+def test_completes_before_disconnect(event_loop):
+    async def work():
+        return 5
+
+    assert event_loop.run_until_complete(cancel_on_disconnect(make_request(1), work())) == 5
+
+
+def test_remaining_ms():
+    assert 900 < remaining_ms(perf_counter() + 1) <= 1000
+    with pytest.raises(DeadlineExceeded):
+        remaining_ms(perf_counter() - 1)
+
+
+def test_deadline_header(client_builder):
+    client = client_builder(SQL_UP, deadline_header="X-Timeout-Ms")
+    query = '{ currentStatementTimeout(prefix: "") }'
+    with client:
+        resp = client.post("/", json={"query": query}, headers={"X-Timeout-Ms": "60000"})
+        assert resp.json()["errors"] == []
+        timeout = resp.json()["data"]["currentStatementTimeout"]
+        assert timeout.endswith("ms") and 50000 <= int(timeout[:-2]) < 60000
+
+        resp = client.post("/", json={"query": query}, headers={"X-Timeout-Ms": "0"})
+        assert resp.json()["errors"][0]["message"] == "Deadline exceeded"
+
+        resp = client.post("/", json={"query": query}, headers={"X-Timeout-Ms": "soon"})
+        assert resp.status_code == 400
@@ -1,5 +1,5 @@
 from click.testing import CliRunner
-from nebulo.cli import dump_schema, main
+from nebulo.cli import dump_schema, explain, main
 
 
 def test_cli_version():
@@ -25,3 +25,68 @@ def test_cli_schema_dump(app_builder, connection_str):
     assert resp.exit_code == 0
     print(resp.output)
     assert "Query" in resp.output
+
+
+def test_cli_explain(app_builder, connection_str, tmp_path):
+    runner = CliRunner()
+
+    _ = app_builder(
+        """
+    create table author (
+        id serial primary key,
+        name text
+    );
+
+    create table book (
+        id serial primary key,
+        author_id int references author(id)
+    );
+    """
+    )
+
+    query_file = tmp_path / "query.graphql"
+    query_file.write_text(
+        """
+    query ($name: String) {
+        allAuthors(condition: {name: $name}) {
+            edges {
+                node {
+                    booksByIdToAuthorId {
+                        totalCount
+                    }
+                }
+            }
+        }
+    }
+    """
+    )
+    variables_file = tmp_path / "variables.json"
+    variables_file.write_text('{"name": "oliver"}')
+
+    resp = runner.invoke(explain, ["-c", connection_str, "-q", str(query_file), "-v", str(variables_file)])
+    print(resp.output)
+    assert resp.exit_code == 0
+    assert "-- allAuthors" in resp.output
+    assert "'oliver'" in resp.output
+    assert "Seq Scan" in resp.output
+    assert "No index on author.name used as a filter column" in resp.output
+    assert "No index on book.author_id used as a join column" in resp.output
+
+
+def test_cli_explain_rejects_mutations(app_builder, connection_str, tmp_path):
+    runner = CliRunner()
+
+    _ = app_builder(
+        """
+    create table account (
+        id serial primary key
+    );
+    """
+    )
+
+    query_file = tmp_path / "query.graphql"
+    query_file.write_text("mutation { createAccount(input: {account: {}}) { clientMutationId } }")
+
+    resp = runner.invoke(explain, ["-c", connection_str, "-q", str(query_file)])
+    assert resp.exit_code != 0
+    assert "Only query operations" in resp.output
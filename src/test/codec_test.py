@@ -0,0 +1,65 @@
+import logging
+
+import pytest
+from nebulo.server.codec import JSON_CODEC, get_json_codec
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver');
+"""
+
+QUERY = "{ allAccounts { edges { node { id name } } } }"
+
+
+def test_json_codec_roundtrip():
+    obj = {"data": {"name": "ünïcode", "count": 2}, "errors": []}
+    assert JSON_CODEC.dumps(obj) == '{"data":{"name":"ünïcode","count":2},"errors":[]}'.encode("utf-8")
+    assert JSON_CODEC.loads(JSON_CODEC.dumps(obj)) == obj
+
+
+def test_orjson_codec_roundtrip():
+    pytest.importorskip("orjson")
+    codec = get_json_codec("orjson")
+    assert codec.name == "orjson"
+    obj = {"data": {"name": "ünïcode", "big": 2**70}, "errors": []}
+    # Integers too large for orjson fall back to the standard library
+    assert codec.loads(codec.dumps(obj)) == obj
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_json_codec("simplejson")
+
+
+def test_missing_orjson_falls_back(monkeypatch, caplog):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def fake_import(name, *args, **kwargs):
+        if name == "orjson":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", fake_import)
+    with caplog.at_level(logging.WARNING):
+        assert get_json_codec("orjson") is JSON_CODEC
+    assert "orjson is not installed" in caplog.text
+
+
+@pytest.mark.parametrize("json_codec", ["json", "orjson"])
+def test_app_json_codec(client_builder, json_codec):
+    client = client_builder(SQL_UP, json_codec=json_codec)
+    with client:
+        resp = client.post("/", json={"query": QUERY})
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/json"
+        assert resp.json()["data"]["allAccounts"]["edges"][0]["node"]["name"] == "oliver"
+
+        resp = client.post("/", data="{not json", headers={"content-type": "application/json"})
+        assert resp.status_code == 400
@@ -0,0 +1,118 @@
+from graphql import parse
+from nebulo.gql.complexity import ComplexityLimits, query_breadth, query_cost, query_depth
+from nebulo.gql.parse_info import parse_document
+
+SQL_UP = """
+CREATE TABLE author (
+    id serial primary key,
+    name text not null
+);
+
+CREATE TABLE book (
+    id serial primary key,
+    title text not null,
+    author_id int not null,
+
+    constraint fk_book_author_id
+        foreign key (author_id)
+        references author (id)
+);
+
+INSERT INTO author (id, name) VALUES
+(1, 'oliver'),
+(2, 'buddy');
+
+INSERT INTO book (id, title, author_id) VALUES
+(1, 'book title', 1);
+"""
+
+QUERY = """
+{
+    allAuthors(first: 5) {
+        totalCount
+        edges {
+            node {
+                id
+                name
+                booksByIdToAuthorId {
+                    edges {
+                        node {
+                            id
+                            authorByAuthorIdToId {
+                                id
+                                name
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+
+def test_complexity_estimates(schema_builder):
+    schema = schema_builder(SQL_UP)
+    _, trees = parse_document(schema, parse(QUERY))
+    tree = trees[0]
+
+    assert query_depth(tree) == 3
+    assert query_breadth(tree) == 3
+    # 5 authors * (1 + book connection of up to 20 books * (1 + author))
+    assert query_cost(tree) == 1 + 5 * (1 + (1 + 20 * (1 + 1)))
+    # Connections are bounded by the table's row estimate
+    assert query_cost(tree, {"author": 2, "book": 1}) == 1 + 2 * (1 + (1 + 1 * (1 + 1))) + 2 * 0.001
+
+
+def test_complexity_limits(schema_builder):
+    schema = schema_builder(SQL_UP)
+    _, trees = parse_document(schema, parse(QUERY))
+
+    assert ComplexityLimits(max_depth=3, max_cost=211, max_breadth=3).validate(trees) == []
+
+    errors = ComplexityLimits(max_depth=2, max_cost=100, max_breadth=2).validate(trees)
+    assert [str(error) for error in errors] == [
+        "Query breadth 3 exceeds the maximum of 2",
+        "Query depth 3 exceeds the maximum of 2",
+        "Query cost 211 exceeds the maximum of 100",
+    ]
+
+
+def test_complexity_null_page_size(schema_builder):
+    schema = schema_builder(SQL_UP)
+    _, trees = parse_document(schema, parse("{ allAuthors(first: null) { edges { node { id } } } }"))
+
+    # A null page size reads the default page of 20 rows
+    assert query_cost(trees[0]) == 1 + 20 * 1
+    assert ComplexityLimits(max_cost=100).validate(trees) == []
+
+
+def test_complexity_rejects_before_execution(client_builder):
+    client = client_builder(SQL_UP, max_query_depth=2)
+    with client:
+        resp = client.post("/", json={"query": QUERY})
+    assert resp.status_code == 200
+    payload = resp.json()
+    assert payload["data"] is None
+    assert payload["errors"][0]["message"] == "Query depth 3 exceeds the maximum of 2"
+
+
+def test_complexity_allows_cheap_queries(client_builder):
+    client = client_builder(SQL_UP, max_query_depth=2, max_query_cost=1000, max_query_breadth=5)
+    with client:
+        resp = client.post("/", json={"query": "{ allAuthors { edges { node { id } } } }"})
+    assert resp.status_code == 200
+    payload = resp.json()
+    assert payload["errors"] == []
+    assert len(payload["data"]["allAuthors"]["edges"]) == 2
+
+
+def test_complexity_null_page_size_executes(client_builder):
+    client = client_builder(SQL_UP, max_query_cost=1000)
+    with client:
+        resp = client.post("/", json={"query": "{ allAuthors(first: null) { edges { node { id } } } }"})
+    assert resp.status_code == 200
+    payload = resp.json()
+    assert payload["errors"] == []
+    assert len(payload["data"]["allAuthors"]["edges"]) == 2
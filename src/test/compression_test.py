@@ -0,0 +1,88 @@
+import gzip
+
+import pytest
+from nebulo.server.compression import CompressionMiddleware, negotiate_encoding
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name)
+SELECT x, 'account name ' || x FROM generate_series(1, 20) x;
+"""
+
+QUERY = "{ allAccounts { edges { node { id name } } } }"
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate, br", ("br", "gzip")) == "br"
+    assert negotiate_encoding("gzip, deflate, br", ("gzip",)) == "gzip"
+    assert negotiate_encoding("br;q=0.5, gzip", ("br", "gzip")) == "gzip"
+    assert negotiate_encoding("gzip;q=0", ("gzip",)) is None
+    assert negotiate_encoding("*", ("br", "gzip")) == "br"
+    assert negotiate_encoding("", ("gzip",)) is None
+
+
+def build_client(minimum_size: int) -> TestClient:
+    async def endpoint(_):
+        return PlainTextResponse("x" * 2000, headers={"ETag": '"abc"'})
+
+    app = Starlette(
+        routes=[Route("/", endpoint)],
+        middleware=[Middleware(CompressionMiddleware, minimum_size=minimum_size, level=9)],
+    )
+    return TestClient(app)
+
+
+def test_compression_gzip():
+    client = build_client(minimum_size=1000)
+    resp = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert resp.headers["etag"] == 'W/"abc"'
+    assert int(resp.headers["content-length"]) < 100
+    # requests transparently decompresses the body
+    assert resp.content == b"x" * 2000
+
+
+def test_compression_level():
+    assert gzip.decompress(CompressionMiddleware(None, level=1).compress(b"x" * 2000, "gzip")) == b"x" * 2000
+
+
+def test_compression_brotli():
+    brotli = pytest.importorskip("brotli")
+    client = build_client(minimum_size=1000)
+    resp = client.get("/", headers={"Accept-Encoding": "gzip, br"})
+    assert resp.headers["content-encoding"] == "br"
+    assert brotli.decompress(CompressionMiddleware(None).compress(b"x" * 2000, "br")) == b"x" * 2000
+
+
+def test_compression_minimum_size():
+    client = build_client(minimum_size=5000)
+    resp = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert resp.headers["etag"] == '"abc"'
+    assert resp.text == "x" * 2000
+
+
+def test_compression_not_accepted():
+    client = build_client(minimum_size=0)
+    resp = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in resp.headers
+
+
+def test_app_compression(client_builder):
+    client = client_builder(SQL_UP, compression=True, compression_minimum_size=100)
+    with client:
+        resp = client.post("/", json={"query": QUERY}, headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    # requests transparently decompresses the body
+    assert len(resp.json()["data"]["allAccounts"]["edges"]) == 20
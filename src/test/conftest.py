@@ -83,11 +83,13 @@ def schema_builder(session, engine):
 
 @pytest.fixture
 def app_builder(event_loop, connection_str, session) -> Callable[[str, Optional[str], Optional[str]], Starlette]:
-    def build(sql: str, jwt_identifier: Optional[str] = None, jwt_secret: Optional[str] = None) -> Starlette:
+    def build(
+        sql: str, jwt_identifier: Optional[str] = None, jwt_secret: Optional[str] = None, **app_kwargs
+    ) -> Starlette:
         session.execute(sql)
         session.commit()
         # Create the schema
-        app = create_app(connection_str, jwt_identifier=jwt_identifier, jwt_secret=jwt_secret)
+        app = create_app(connection_str, jwt_identifier=jwt_identifier, jwt_secret=jwt_secret, **app_kwargs)
         return app
 
     return build
@@ -100,9 +102,11 @@ def client_builder(
     # NOTE: Client must be used as a context manager for on_startup and on_shutdown to execute
     # e.g. connect to the database
 
-    def build(sql: str, jwt_identifier: Optional[str] = None, jwt_secret: Optional[str] = None) -> TestClient:
+    def build(
+        sql: str, jwt_identifier: Optional[str] = None, jwt_secret: Optional[str] = None, **app_kwargs
+    ) -> TestClient:
         importlib.reload(table_base)
-        app = app_builder(sql, jwt_identifier, jwt_secret)
+        app = app_builder(sql, jwt_identifier, jwt_secret, **app_kwargs)
         client = TestClient(app)
         return client
 
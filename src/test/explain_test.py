@@ -0,0 +1,19 @@
+from nebulo.gql.explain import sequential_scans
+
+
+def test_sequential_scans_from_json_plan():
+    plan = [
+        {
+            "Plan": {
+                "Node Type": "Nested Loop",
+                "Plans": [
+                    {"Node Type": "Seq Scan", "Relation Name": "author", "Filter": "(name = 'oliver'::text)"},
+                    {"Node Type": "Index Scan", "Relation Name": "book"},
+                ],
+            }
+        }
+    ]
+    scans = sequential_scans(plan)
+    assert len(scans) == 1
+    assert scans[0].relation == "author"
+    assert scans[0].filter == "(name = 'oliver'::text)"
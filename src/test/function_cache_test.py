@@ -0,0 +1,81 @@
+import json
+
+from nebulo.server.function_cache import FunctionResultCache
+from nebulo.sql.reflection.function import SQLFunction
+from sqlalchemy import Text
+
+SQL_UP = """
+create sequence call_count;
+
+-- Declared immutable so calls are cached, counts calls so cache hits can be observed
+create function public.count_calls(some_text text)
+returns text
+as $$
+    select some_text || nextval('call_count')::text;
+$$ language sql immutable;
+
+create function public.to_lower(some_text text)
+returns text
+as $$
+    select lower(some_text);
+$$ language sql immutable;
+
+create table trash (
+    id serial primary key
+);
+"""
+
+TO_UPPER = SQLFunction("public", "to_upper", ["some_text"], ["text"], [Text()], Text(), "pg_catalog", "text", True)
+
+
+def test_function_cache_keys():
+    cache = FunctionResultCache(max_bytes=1000, ttl=60)
+    key = cache.key(TO_UPPER, {"some_text": "abc"}, None)
+    assert cache.get(key) == (False, None)
+    cache.set(key, "ABC")
+    assert cache.get(key) == (True, "ABC")
+    # Arguments and role are part of the key
+    assert cache.get(cache.key(TO_UPPER, {"some_text": "abd"}, None)) == (False, None)
+    assert cache.get(cache.key(TO_UPPER, {"some_text": "abc"}, "anon_api")) == (False, None)
+
+
+def test_function_cache_size_bound():
+    cache = FunctionResultCache(max_bytes=100, ttl=60)
+    cache.set(cache.key(TO_UPPER, {"some_text": "a"}, None), "x" * 200)
+    assert len(cache.results) == 0
+
+    for ix in range(20):
+        cache.set(cache.key(TO_UPPER, {"some_text": str(ix)}, None), "x" * 10)
+    assert 0 < cache.results.currsize <= 100
+
+
+def test_function_cache_disabled():
+    cache = FunctionResultCache(max_bytes=0)
+    key = cache.key(TO_UPPER, {"some_text": "abc"}, None)
+    cache.set(key, "ABC")
+    assert not cache.enabled
+    assert cache.get(key) == (False, None)
+
+
+def test_immutable_function_results_are_cached(client_builder):
+    client = client_builder(SQL_UP, function_cache_size=1024 * 1024)
+    query = '{ a: countCalls(some_text: "a") lower: toLower(some_text: "ABC") }'
+    with client:
+        first = json.loads(client.post("/", json={"query": query}).text)
+        second = json.loads(client.post("/", json={"query": query}).text)
+        other = json.loads(client.post("/", json={"query": '{ countCalls(some_text: "b") }'}).text)
+
+    assert first["errors"] == []
+    assert first["data"] == {"a": "a1", "lower": "abc"}
+    assert second["data"] == first["data"]
+    assert other["data"] == {"countCalls": "b2"}
+
+
+def test_immutable_functions_sharing_a_return_type(client_builder):
+    client = client_builder(SQL_UP)
+    query = '{ countCalls(some_text: "a") toLower(some_text: "ABC") }'
+    with client:
+        resp = json.loads(client.post("/", json={"query": query}).text)
+    assert resp["errors"] == []
+    assert resp["data"]["toLower"] == "abc"
+    assert resp["data"]["countCalls"] == "a1"
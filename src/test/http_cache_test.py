@@ -0,0 +1,146 @@
+import hashlib
+import json
+
+import pytest
+from graphql import parse
+from nebulo.config import CacheControl, Config
+from nebulo.gql.parse_info import parse_document
+from nebulo.server.http_cache import PersistedQueries, etag_matches, get_cache_control
+from sqlalchemy import Column, Integer, MetaData, Table
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+CREATE TABLE offer (
+    id serial primary key,
+    account_id int references account (id)
+);
+
+CREATE TABLE product (
+    id serial primary key
+);
+
+comment on table account is E'@cache_control max_age=60';
+comment on table product is E'@cache_control max_age=10, private';
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver'),
+(2, 'rachel');
+"""
+
+QUERY = "{ allAccounts { edges { node { id name } } } }"
+
+
+def test_cache_control_directive():
+    class Entity:
+        __table__ = Table("entity", MetaData(), Column("id", Integer, primary_key=True))
+
+    assert Config.cache_control(Entity) is None
+    Entity.__table__.comment = "@cache_control max_age=60"
+    assert Config.cache_control(Entity) == CacheControl(max_age=60, private=False)
+    Entity.__table__.comment = "@exclude delete\n@cache_control max_age=5, private"
+    assert Config.cache_control(Entity) == CacheControl(max_age=5, private=True)
+    Entity.__table__.comment = "@cache_control private"
+    with pytest.raises(ValueError):
+        Config.cache_control(Entity)
+
+
+def test_get_cache_control(schema_builder):
+    schema = schema_builder(SQL_UP)
+
+    def cache_control(query: str, private: bool = False) -> str:
+        _, trees = parse_document(schema, parse(query))
+        return get_cache_control(trees, private=private)
+
+    assert cache_control("{ allAccounts { totalCount } }") == "public, max-age=60"
+    assert cache_control("{ allAccounts { totalCount } }", private=True) == "private, max-age=60"
+    assert cache_control("{ allAccounts { totalCount } allProducts { totalCount } __typename }") == (
+        "private, max-age=10"
+    )
+    assert cache_control("{ allAccounts { totalCount } allOffers { totalCount } }") == "no-cache"
+
+
+def test_nested_table_without_cache_control(schema_builder):
+    schema = schema_builder(SQL_UP)
+    query = "{ allAccounts { edges { node { id offersByIdToAccountId { totalCount } } } } }"
+    _, trees = parse_document(schema, parse(query))
+    # offer has no hint, so the response may not be reused without revalidating
+    assert get_cache_control(trees, private=False) == "no-cache"
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+
+
+def test_persisted_queries():
+    store = PersistedQueries(maxsize=1)
+    sha256_hash = hashlib.sha256(QUERY.encode("utf-8")).hexdigest()
+    assert store.get(sha256_hash) is None
+    store.register(sha256_hash, QUERY)
+    assert store.get(sha256_hash) == QUERY
+    with pytest.raises(Exception):
+        store.register("not the hash", QUERY)
+
+
+def test_get_request_etag(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.get("/", params={"query": QUERY})
+        assert resp.status_code == 200
+        assert resp.json()["errors"] == []
+        assert resp.headers["cache-control"] == "public, max-age=60"
+        etag = resp.headers["etag"]
+
+        resp = client.get("/", params={"query": QUERY}, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.content == b""
+        assert resp.headers["etag"] == etag
+
+
+def test_get_request_without_cache_hint(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.get("/", params={"query": "{ allAccounts { totalCount } allOffers { totalCount } }"})
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == "no-cache"
+
+
+def test_get_request_rejects_mutations(client_builder):
+    client = client_builder(SQL_UP)
+    query = "mutation { createOffer(input: {offer: {id: 5}}) { offer { id } } }"
+    with client:
+        resp = client.get("/", params={"query": query})
+    assert resp.status_code == 200
+    assert resp.json()["data"] is None
+    assert resp.headers["cache-control"] == "no-store"
+
+
+@pytest.mark.parametrize("variables", ["[1]", "3", "not json"])
+def test_get_request_rejects_invalid_variables(client_builder, variables):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.get("/", params={"query": QUERY, "variables": variables})
+    assert resp.status_code == 400
+
+
+def test_persisted_query_over_get(client_builder):
+    client = client_builder(SQL_UP)
+    sha256_hash = hashlib.sha256(QUERY.encode("utf-8")).hexdigest()
+    extensions = {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}
+    with client:
+        resp = client.get("/", params={"extensions": json.dumps(extensions)})
+        assert resp.json()["errors"][0]["message"] == "PersistedQueryNotFound"
+
+        resp = client.post("/", json={"query": QUERY, "extensions": extensions})
+        assert resp.json()["errors"] == []
+
+        resp = client.get("/", params={"extensions": json.dumps(extensions)})
+        assert resp.json()["errors"] == []
+        assert len(resp.json()["data"]["allAccounts"]["edges"]) == 2
@@ -0,0 +1,74 @@
+from graphql import build_schema, get_introspection_query, parse
+from nebulo.server.introspection import IntrospectionCache, is_introspection
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+"""
+
+
+def test_is_introspection():
+    assert is_introspection(parse(get_introspection_query()))
+    assert is_introspection(parse('{ __type(name: "Query") { name } __typename }'))
+    assert is_introspection(parse("query { ...root } fragment root on Query { __schema { queryType { name } } }"))
+    assert not is_introspection(parse("{ __typename allAccounts { totalCount } }"))
+    assert not is_introspection(parse("mutation { __typename }"))
+
+
+def test_introspection_results_are_cached(event_loop):
+    introspection = IntrospectionCache(build_schema("type Query { hello: String }"))
+    query = get_introspection_query()
+    document = parse(query)
+    key = introspection.key(query, {})
+
+    assert introspection.get(key) is None
+    result = event_loop.run_until_complete(introspection.execute(document, key, {}))
+    assert result.errors is None
+    assert introspection.get(key) == (document, result)
+
+    assert introspection.key(query, {"a": 1}) != key
+    assert introspection.key("{ allAccounts { totalCount } }", {}) is None
+    assert introspection.get_etag(key).startswith('"' + introspection.version)
+    assert "hello: String" in introspection.sdl
+
+
+def test_introspection_errors_are_not_cached(event_loop):
+    introspection = IntrospectionCache(build_schema("type Query { hello: String }"))
+    query = "{ __schema { unknown } }"
+    key = introspection.key(query, {})
+    result = event_loop.run_until_complete(introspection.execute(parse(query), key, {}))
+    assert result.errors
+    assert len(introspection.results) == 0
+
+
+def test_introspection_etag(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.post("/", json={"query": get_introspection_query()})
+        assert resp.status_code == 200
+        assert resp.json()["errors"] == []
+        assert resp.json()["data"]["__schema"]["queryType"]["name"] == "Query"
+        etag = resp.headers["ETag"]
+
+        # Conditional requests only apply to GET
+        resp = client.post("/", json={"query": get_introspection_query()}, headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.headers["ETag"] == etag
+        assert resp.json()["data"]["__schema"]["queryType"]["name"] == "Query"
+
+        resp = client.get("/", params={"query": get_introspection_query()}, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+
+def test_schema_sdl_route(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.get("/schema.graphql")
+        assert resp.status_code == 200
+        assert "allAccounts" in resp.text
+        etag = resp.headers["ETag"]
+
+        resp = client.get("/schema.graphql", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
@@ -0,0 +1,94 @@
+import pytest
+from graphql import parse
+from nebulo.gql.parse_info import parse_document
+from nebulo.gql.relay.cursor import CursorStructure
+from nebulo.gql.resolve.transpile.query_builder import JOIN_STRATEGIES, sql_builder
+
+SQL_UP = """
+CREATE TABLE author (
+    id serial primary key,
+    name text not null
+);
+
+CREATE TABLE book (
+    id serial primary key,
+    author_id int not null references author(id),
+    title text not null
+);
+
+INSERT INTO author (id, name) VALUES (1, 'Oliver'), (2, 'Buddy'), (3, 'No Books');
+
+INSERT INTO book (id, author_id, title) VALUES
+(1, 1, 'Book A'),
+(2, 1, 'Book B'),
+(3, 1, 'Book C'),
+(4, 2, 'Book D');
+"""
+
+GQL_QUERY = """
+{
+    allAuthors(first: 2, after: "%s") {
+        totalCount
+        edges {
+            node {
+                nodeId
+                name
+                booksByIdToAuthorId(first: 2) {
+                    totalCount
+                    pageInfo { hasNextPage }
+                    edges {
+                        node {
+                            title
+                            authorByAuthorIdToId { name }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+"""
+
+
+@pytest.mark.parametrize("join_strategy", JOIN_STRATEGIES)
+def test_join_strategies_return_same_result(client_builder, join_strategy):
+    cursor = CursorStructure("author", {"id": 0}).serialize()
+    client = client_builder(SQL_UP, join_strategy=join_strategy)
+    with client:
+        resp = client.post("/", json={"query": GQL_QUERY % cursor})
+    result = resp.json()
+    assert result["errors"] == []
+
+    connection = result["data"]["allAuthors"]
+    assert connection["totalCount"] == 3
+    authors = [x["node"] for x in connection["edges"]]
+    assert [x["name"] for x in authors] == ["Oliver", "Buddy"]
+
+    books = authors[0]["booksByIdToAuthorId"]
+    assert books["totalCount"] == 3
+    assert books["pageInfo"]["hasNextPage"]
+    assert [x["node"]["title"] for x in books["edges"]] == ["Book A", "Book B"]
+    assert books["edges"][0]["node"]["authorByAuthorIdToId"]["name"] == "Oliver"
+
+    books = authors[1]["booksByIdToAuthorId"]
+    assert books["totalCount"] == 1
+    assert not books["pageInfo"]["hasNextPage"]
+
+
+def test_unknown_join_strategy(schema_builder):
+    schema = schema_builder(SQL_UP)
+    _, trees = parse_document(schema, parse("{ allAuthors { totalCount } }"), {}, None)
+    with pytest.raises(ValueError):
+        sql_builder(trees[0], join_strategy="hash")
+
+
+@pytest.mark.parametrize("join_strategy", JOIN_STRATEGIES)
+def test_sql_text_is_stable(schema_builder, join_strategy):
+    # Prepared statements are only reused if every request for a query builds the same SQL
+    schema = schema_builder(SQL_UP)
+    cursor = CursorStructure("author", {"id": 0}).serialize()
+    statements = set()
+    for _ in range(2):
+        _, trees = parse_document(schema, parse(GQL_QUERY % cursor), {}, None)
+        statements.add(str(sql_builder(trees[0], join_strategy=join_strategy)))
+    assert len(statements) == 1
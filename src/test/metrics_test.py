@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+
+from nebulo.server.metrics import Counter, Histogram, MetricsRegistry, NebuloMetrics
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver'),
+(2, 'rachel');
+"""
+
+
+def test_render_counter_and_histogram():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("requests_total", "Requests", ["operation"]))
+    histogram = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+
+    counter.inc(("getAccounts",))
+    counter.inc(("getAccounts",))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{operation="getAccounts"} 2' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("errors_total", "Errors", ["type"]))
+    counter.inc(('Bad"Name',))
+    assert 'errors_total{type="Bad\\"Name"} 1' in registry.render()
+
+
+def test_multiprocess_snapshots_are_merged(tmp_path):
+    worker = NebuloMetrics(multiprocess_dir=str(tmp_path))
+    worker.requests.inc(("anonymous",), 3)
+    worker.request_seconds.observe(0.2, ("anonymous",))
+    # Simulate a snapshot written by another running worker process
+    (tmp_path / f"metrics-{os.getppid()}.json").write_text(
+        '{"nebulo_requests_total": [[["anonymous"], 2]], "nebulo_requests_in_flight": [[[], 1]]}'
+    )
+
+    text = worker.render()
+    assert 'nebulo_requests_total{operation="anonymous"} 5' in text
+    assert "nebulo_requests_in_flight 1" in text
+    # Merging does not modify the worker's own counters
+    assert worker.requests.samples[("anonymous",)] == 3
+
+
+def test_gauges_of_exited_workers_are_dropped(tmp_path):
+    worker = NebuloMetrics(multiprocess_dir=str(tmp_path))
+    snapshot = '{"nebulo_requests_total": [[["anonymous"], 2]], "nebulo_requests_in_flight": [[[], 1]]}'
+    # A worker that is no longer running
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    (tmp_path / f"metrics-{exited.pid}.json").write_text(snapshot)
+    # A worker that stopped writing snapshots
+    stale_path = tmp_path / f"metrics-{os.getppid()}.json"
+    stale_path.write_text(snapshot)
+    os.utime(stale_path, (0, 0))
+
+    text = worker.render()
+    assert 'nebulo_requests_total{operation="anonymous"} 4' in text
+    assert "nebulo_requests_in_flight 1" not in text
+
+
+def test_metrics_route(client_builder):
+    client = client_builder(SQL_UP, metrics=True)
+    query = "query getAccounts { allAccounts { edges { node { id } } } }"
+    with client:
+        resp = client.post("/", json={"query": query})
+        assert resp.status_code == 200
+        resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert 'nebulo_requests_total{operation="getAccounts"} 1' in resp.text
+    assert 'nebulo_db_query_duration_seconds_count{field="allAccounts"} 1' in resp.text
+    # Counts the table rows in the result, not the statements executed
+    assert 'nebulo_db_rows_total{field="allAccounts"} 2' in resp.text
+    assert "nebulo_requests_in_flight 0" in resp.text
+
+
+def test_metrics_route_disabled_by_default(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.get("/metrics")
+    assert resp.status_code in (404, 405)
@@ -0,0 +1,108 @@
+from graphql import parse
+from nebulo.gql.complexity import query_cost
+from nebulo.gql.parse_info import parse_document
+from nebulo.gql.relay.node_interface import NodeIdStructure
+
+SQL_UP = """
+CREATE TABLE author (
+    id serial primary key,
+    name text not null
+);
+
+CREATE TABLE book (
+    id serial primary key,
+    title text not null,
+    author_id int not null,
+
+    constraint fk_book_author_id
+        foreign key (author_id)
+        references author (id)
+);
+
+INSERT INTO author (id, name) VALUES
+(1, 'oliver'),
+(2, 'buddy');
+
+INSERT INTO book (id, title, author_id) VALUES
+(1, 'book title', 2);
+"""
+
+NODES_QUERY = """
+query Nodes($nodeIds: [ID!]!) {
+    nodes(nodeIds: $nodeIds) {
+        nodeId
+        __typename
+        ... on Author {
+            name
+        }
+        ...BookFields
+    }
+}
+
+fragment BookFields on Book {
+    title
+    authorByAuthorIdToId {
+        name
+    }
+}
+"""
+
+
+def node_id(table_name: str, row_id: int) -> str:
+    return NodeIdStructure(table_name=table_name, values={"id": row_id}).serialize()
+
+
+def test_nodes_preserve_order(client_builder):
+    client = client_builder(SQL_UP)
+    node_ids = [node_id("book", 1), node_id("author", 2), node_id("author", 3), node_id("author", 1)]
+
+    with client:
+        resp = client.post("/", json={"query": NODES_QUERY, "variables": {"nodeIds": node_ids}})
+    assert resp.status_code == 200
+    result = resp.json()
+    assert result["errors"] == []
+
+    book, author_2, missing, author_1 = result["data"]["nodes"]
+    assert book == {
+        "nodeId": node_ids[0],
+        "__typename": "Book",
+        "title": "book title",
+        "authorByAuthorIdToId": {"name": "buddy"},
+    }
+    assert author_2 == {"nodeId": node_ids[1], "__typename": "Author", "name": "buddy"}
+    assert missing is None
+    assert author_1["name"] == "oliver"
+
+
+def test_node(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = f"""
+    {{
+        node(nodeId: "{node_id('author', 1)}") {{
+            ... on Author {{
+                name
+            }}
+        }}
+        unknown: node(nodeId: "{node_id('publisher', 1)}") {{
+            nodeId
+        }}
+    }}
+    """
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+    assert result["data"] == {"node": {"name": "oliver"}, "unknown": None}
+
+
+def test_nodes_query_cost(schema_builder):
+    schema = schema_builder(SQL_UP)
+    node_ids = [node_id("book", 1), node_id("author", 2), node_id("author", 1)]
+    _, trees = parse_document(schema, parse(NODES_QUERY), {"nodeIds": node_ids})
+
+    # One tree per table, reading the IDs of that table
+    assert sorted(tree.return_type.name for tree in trees) == ["Author", "Book"]
+    costs = {tree.return_type.name: query_cost(tree) for tree in trees}
+    assert costs["Author"] == 1 + 2 * 1
+    # The author of each book adds a row
+    assert costs["Book"] == 1 + 1 * 2
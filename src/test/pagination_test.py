@@ -307,3 +307,135 @@ def test_invalid_pagination_params(client_builder):
     assert resp.status_code == 200
     result = resp.json()
     assert result["errors"] != []
+
+
+def test_page_info_without_edges(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = """
+    {
+        allAccounts(first: 3) {
+            pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+        }
+    }
+    """
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+        result = resp.json()
+        assert result["errors"] == []
+        page_info = result["data"]["allAccounts"]["pageInfo"]
+        assert page_info["hasNextPage"]
+        assert not page_info["hasPreviousPage"]
+
+        gql_query = f"""
+        {{
+            allAccounts(first: 10, after: "{page_info["endCursor"]}") {{
+                edges {{ cursor node {{ id }} }}
+                pageInfo {{ hasNextPage startCursor endCursor }}
+            }}
+        }}
+        """
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+    connection = result["data"]["allAccounts"]
+    assert [x["node"]["id"] for x in connection["edges"]] == [4, 5, 6, 7]
+    assert not connection["pageInfo"]["hasNextPage"]
+    assert connection["pageInfo"]["startCursor"] == connection["edges"][0]["cursor"]
+    assert connection["pageInfo"]["endCursor"] == connection["edges"][-1]["cursor"]
+
+
+def test_before_cursor_page_order(client_builder):
+    client = client_builder(SQL_UP)
+    before_cursor = CursorStructure(table_name="account", values={"id": 6}).serialize()
+    gql_query = f"""
+    {{
+        allAccounts(last: 3, before: "{before_cursor}") {{
+            edges {{ cursor node {{ id }} }}
+            pageInfo {{ startCursor endCursor }}
+        }}
+    }}
+    """
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+    connection = result["data"]["allAccounts"]
+    # The 3 rows before the cursor, in ascending order
+    assert [x["node"]["id"] for x in connection["edges"]] == [3, 4, 5]
+    assert connection["pageInfo"]["startCursor"] == connection["edges"][0]["cursor"]
+    assert connection["pageInfo"]["endCursor"] == connection["edges"][-1]["cursor"]
+
+
+def test_only_total_count(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.post("/", json={"query": "{ allAccounts(condition: {age: 28}) { totalCount } }"})
+    result = resp.json()
+    assert result["errors"] == []
+    assert result["data"]["allAccounts"] == {"totalCount": 2}
+
+
+def test_empty_page(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = """
+    {
+        allAccounts(condition: {age: 1000}) {
+            totalCount
+            edges { node { id } }
+            pageInfo { hasNextPage startCursor endCursor }
+        }
+    }
+    """
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+    connection = result["data"]["allAccounts"]
+    assert connection["totalCount"] == 0
+    assert connection["edges"] == []
+    assert connection["pageInfo"] == {"hasNextPage": False, "startCursor": None, "endCursor": None}
+
+
+def test_only_has_previous_page(client_builder):
+    sql = """
+    CREATE TABLE account (
+        id serial primary key
+    );
+
+    CREATE TABLE offer (
+        id serial primary key,
+        account_id int not null references account (id)
+    );
+
+    CREATE TABLE empty_account (
+        id serial primary key
+    );
+
+    INSERT INTO account (id) VALUES (1), (2);
+    INSERT INTO offer (account_id) VALUES (1), (1), (2);
+    """
+    client = client_builder(sql)
+    gql_query = """
+    {
+        allEmptyAccounts { pageInfo { hasPreviousPage } }
+        allAccounts {
+            edges {
+                node {
+                    id
+                    offersByIdToAccountId { pageInfo { __typename hasPreviousPage } }
+                }
+            }
+        }
+    }
+    """
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+    assert result["data"]["allEmptyAccounts"] == {"pageInfo": {"hasPreviousPage": False}}
+    edges = result["data"]["allAccounts"]["edges"]
+    assert [x["node"]["id"] for x in edges] == [1, 2]
+    for edge in edges:
+        assert edge["node"]["offersByIdToAccountId"] == {
+            "pageInfo": {"__typename": "PageInfo", "hasPreviousPage": False}
+        }
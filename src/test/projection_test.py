@@ -0,0 +1,60 @@
+from graphql import parse
+from nebulo.gql.parse_info import parse_document
+from nebulo.gql.resolve.transpile.query_builder import sql_builder, sql_finalize
+from sqlalchemy.dialects import postgresql
+
+WIDE_COLUMNS = [f"col_{ix} int default {ix}" for ix in range(60)]
+
+SQL_UP = f"""
+CREATE TABLE author (
+    id serial primary key,
+    name text not null,
+    biography text not null
+);
+
+CREATE TABLE book (
+    id serial primary key,
+    author_id int not null references author(id),
+    title text not null,
+    content bytea,
+    {", ".join(WIDE_COLUMNS)}
+);
+
+INSERT INTO author (id, name, biography) VALUES (1, 'Oliver', repeat('long ', 10000));
+INSERT INTO book (id, author_id, title, content) VALUES (1, 1, 'Book A', 'content');
+"""
+
+
+def test_only_requested_columns_are_read(schema_builder):
+    schema = schema_builder(SQL_UP)
+    query = "{ allBooks { edges { node { title authorByAuthorIdToId { name } } } } }"
+    _, trees = parse_document(schema, parse(query), {}, None)
+    sql = str(sql_finalize(trees[0].name, sql_builder(trees[0])).compile(dialect=postgresql.dialect()))
+    assert "book.author_id" in sql
+    assert "book.content" not in sql
+    assert "author.biography" not in sql
+
+
+def test_only_requested_keys_are_returned(client_builder):
+    client = client_builder(SQL_UP)
+    query = "{ allBooks { edges { node { title } } } }"
+    with client:
+        resp = client.post("/", json={"query": query})
+    result = resp.json()
+    assert result["errors"] == []
+    assert result["data"]["allBooks"]["edges"] == [{"node": {"title": "Book A"}}]
+
+
+def test_select_many_columns(client_builder):
+    client = client_builder(SQL_UP)
+    fields = " ".join(f"col{ix}" for ix in range(60))
+    query = f'{{ allBooks {{ edges {{ node {{ title {fields} }} }} }} book(nodeId: "%s") {{ {fields} }} }}'
+    with client:
+        resp = client.post("/", json={"query": "{ allBooks { edges { node { nodeId } } } }"})
+        node_id = resp.json()["data"]["allBooks"]["edges"][0]["node"]["nodeId"]
+        resp = client.post("/", json={"query": query % node_id})
+    result = resp.json()
+    assert result["errors"] == []
+    node = result["data"]["allBooks"]["edges"][0]["node"]
+    assert node["col59"] == 59
+    assert result["data"]["book"]["col0"] == 0
@@ -0,0 +1,122 @@
+import json
+import time
+
+import pytest
+from nebulo.config import Config
+from nebulo.server.result_cache import QueryResultCache
+from sqlalchemy import Column, Integer, MetaData, Table
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+CREATE TABLE offer (
+    id serial primary key
+);
+
+comment on table account is E'@cache ttl=60';
+
+create function notify_cache() returns trigger as $$
+begin
+    perform pg_notify('nebulo_cache', tg_table_schema || '.' || tg_table_name);
+    return null;
+end;
+$$ language plpgsql;
+
+create trigger account_cache after insert or update or delete on account
+for each statement execute procedure notify_cache();
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver'),
+(2, 'rachel');
+"""
+
+QUERY = "{ allAccounts { totalCount } }"
+
+KEY = ("document", "allAccounts", "{}", "{}", None)
+
+
+def test_cache_directive():
+    class Entity:
+        __table__ = Table("entity", MetaData(), Column("id", Integer, primary_key=True))
+
+    assert Config.cache_ttl(Entity) is None
+    Entity.__table__.comment = "@cache_control max_age=60"
+    assert Config.cache_ttl(Entity) is None
+    Entity.__table__.comment = "@exclude delete\n@cache ttl=3600"
+    assert Config.cache_ttl(Entity) == 3600
+    Entity.__table__.comment = "@cache"
+    with pytest.raises(ValueError):
+        Config.cache_ttl(Entity)
+
+
+def test_result_cache_invalidation():
+    cache = QueryResultCache(max_bytes=1000)
+    tables = ("public.account", "public.offer")
+
+    cache.set(KEY, {"a": 1}, tables, cache.versions(tables), ttl=60)
+    assert cache.get(KEY) == (True, {"a": 1})
+    cache.invalidate(["public.other"])
+    assert cache.get(KEY) == (True, {"a": 1})
+    cache.invalidate(["offer"])
+    assert cache.get(KEY) == (False, None)
+
+    cache.set(KEY, {"a": 1}, tables, cache.versions(tables), ttl=60)
+    cache.invalidate()
+    assert cache.get(KEY) == (False, None)
+
+
+def test_result_cache_skips_results_changed_while_executing():
+    cache = QueryResultCache(max_bytes=1000)
+    tables = ("public.account",)
+    versions = cache.versions(tables)
+    cache.invalidate(["public.account"])
+    cache.set(KEY, {"a": 1}, tables, versions, ttl=60)
+    assert cache.get(KEY) == (False, None)
+
+
+def test_result_cache_disabled():
+    cache = QueryResultCache(max_bytes=0)
+    tables = ("public.account",)
+    cache.set(KEY, {"a": 1}, tables, cache.versions(tables), ttl=60)
+    assert not cache.enabled
+    assert cache.get(KEY) == (False, None)
+
+
+def test_result_cache_invalidated_by_mutation(client_builder, session):
+    client = client_builder(SQL_UP, result_cache_size=1024 * 1024, result_cache_channel=None, metrics=True)
+    mutation = 'mutation { createAccount(input: {account: {id: 4, name: "buddy"}}) { clientMutationId } }'
+    with client:
+        first = json.loads(client.post("/", json={"query": QUERY}).text)
+        # Without a notification channel a change made out of band is not seen until the entry expires
+        session.execute("insert into account (id, name) values (3, 'sophie')")
+        session.commit()
+        cached = json.loads(client.post("/", json={"query": QUERY}).text)
+        metrics = client.get("/metrics").text
+        client.post("/", json={"query": mutation})
+        latest = json.loads(client.post("/", json={"query": QUERY}).text)
+
+    assert first["data"]["allAccounts"]["totalCount"] == 2
+    assert cached["data"]["allAccounts"]["totalCount"] == 2
+    assert 'nebulo_cache_requests_total{cache="result",result="hit"} 1' in metrics
+    assert latest["data"]["allAccounts"]["totalCount"] == 4
+
+
+def test_result_cache_invalidated_by_notification(client_builder, session):
+    client = client_builder(SQL_UP, result_cache_size=1024 * 1024)
+    with client:
+        first = json.loads(client.post("/", json={"query": QUERY}).text)
+        session.execute("insert into account (id, name) values (3, 'sophie')")
+        session.commit()
+
+        # Notifications are delivered asynchronously
+        for _ in range(50):
+            latest = json.loads(client.post("/", json={"query": QUERY}).text)
+            if latest["data"]["allAccounts"]["totalCount"] == 3:
+                break
+            time.sleep(0.1)
+
+    assert first["data"]["allAccounts"]["totalCount"] == 2
+    assert latest["data"]["allAccounts"]["totalCount"] == 3
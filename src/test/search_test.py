@@ -0,0 +1,116 @@
+import pytest
+from nebulo.config import Config, Search
+from nebulo.sql.search import is_searchable
+from sqlalchemy import Column, Integer, MetaData, Table, Text
+
+SQL_UP = """
+CREATE TABLE post (
+    id serial primary key,
+    title text not null,
+    body text
+);
+
+CREATE TABLE document (
+    id serial primary key,
+    content tsvector not null
+);
+
+comment on table post is E'@search title, body, config=english';
+
+create index post_search on post using gin (
+    to_tsvector('english'::regconfig, coalesce(title, '') || ' ' || coalesce(body, ''))
+);
+
+INSERT INTO post (id, title, body) VALUES
+(1, 'Indexing', 'A post about postgres indexes'),
+(2, 'Postgres', 'Postgres full text search with postgres'),
+(3, 'Cooking', 'Nothing to see here'),
+(4, 'Searching', 'Search through postgres');
+
+INSERT INTO document (id, content) VALUES
+(1, to_tsvector('english', 'the quick brown fox')),
+(2, to_tsvector('english', 'lazy dogs'));
+"""
+
+
+def test_search_directive():
+    class Entity:
+        __table__ = Table("entity", MetaData(), Column("id", Integer, primary_key=True))
+
+    assert Config.search(Entity) is None
+    Entity.__table__.comment = "@search title, body"
+    assert Config.search(Entity) == Search(columns=["title", "body"], config="english")
+    Entity.__table__.comment = "@search config=simple"
+    assert Config.search(Entity) == Search(columns=[], config="simple")
+    Entity.__table__.comment = "@search title, config=english'); drop table entity; --"
+    with pytest.raises(ValueError):
+        Config.search(Entity)
+
+
+def test_search_directive_unknown_column():
+    class Entity:
+        __table__ = Table(
+            "entity",
+            MetaData(),
+            Column("id", Integer, primary_key=True),
+            Column("title", Text),
+            comment="@search title, bdy",
+        )
+
+    with pytest.raises(ValueError, match="entity.*bdy"):
+        is_searchable(Entity)
+
+
+def test_search_text_columns(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = '{ allPosts(search: "postgres -indexes") { totalCount edges { node { id } } } }'
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+    assert result["data"]["allPosts"]["totalCount"] == 2
+    assert [x["node"]["id"] for x in result["data"]["allPosts"]["edges"]] == [2, 4]
+
+
+def test_search_tsvector_column(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = '{ allDocuments(search: "foxes") { edges { node { id } } } }'
+    with client:
+        resp = client.post("/", json={"query": gql_query})
+    result = resp.json()
+    assert result["errors"] == []
+    assert [x["node"]["id"] for x in result["data"]["allDocuments"]["edges"]] == [1]
+
+
+def test_ranked_search_pagination(client_builder):
+    client = client_builder(SQL_UP)
+    gql_query = """
+    query Search($after: Cursor) {
+        allPosts(search: "postgres", rankSearch: true, first: 1, after: $after) {
+            edges { node { id } }
+            pageInfo { endCursor hasNextPage }
+        }
+    }
+    """
+    ids = []
+    after = None
+    with client:
+        for _ in range(5):
+            resp = client.post("/", json={"query": gql_query, "variables": {"after": after}})
+            result = resp.json()
+            assert result["errors"] == []
+            connection = result["data"]["allPosts"]
+            ids.extend(x["node"]["id"] for x in connection["edges"])
+            if not connection["pageInfo"]["hasNextPage"]:
+                break
+            after = connection["pageInfo"]["endCursor"]
+
+    # Post 2 mentions postgres the most, posts 1 and 4 tie and are ordered by id
+    assert ids == [2, 1, 4]
+
+
+def test_search_not_available_without_text_search(client_builder):
+    client = client_builder("CREATE TABLE account (id serial primary key);")
+    with client:
+        resp = client.post("/", json={"query": '{ allAccounts(search: "x") { totalCount } }'})
+    assert len(resp.json()["errors"]) == 1
@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+import pytest
+from nebulo.server.single_flight import SingleFlight
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver');
+
+CREATE FUNCTION public.slow_hello() RETURNS text AS $$
+    SELECT pg_sleep(0.5)::text || 'hello'
+$$ LANGUAGE sql STABLE;
+"""
+
+
+def test_concurrent_calls_share_one_execution(event_loop):
+    single_flight = SingleFlight()
+    executions = []
+
+    async def execute():
+        executions.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": 1}
+
+    async def run():
+        return await asyncio.gather(*[single_flight.run("a", execute) for _ in range(5)])
+
+    results = event_loop.run_until_complete(run())
+    assert len(executions) == 1
+    assert [is_coalesced for is_coalesced, _ in results] == [False, True, True, True, True]
+    assert all(result == {"id": 1} for _, result in results)
+
+    # Results are not kept once the execution completes
+    assert single_flight.flights == {}
+    event_loop.run_until_complete(single_flight.run("a", execute))
+    assert len(executions) == 2
+
+
+def test_errors_are_shared(event_loop):
+    single_flight = SingleFlight()
+
+    async def execute():
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    async def run():
+        return await asyncio.gather(*[single_flight.run("a", execute) for _ in range(2)], return_exceptions=True)
+
+    assert all(isinstance(x, ValueError) for x in event_loop.run_until_complete(run()))
+
+
+def test_cancelling_one_caller_does_not_cancel_others(event_loop):
+    single_flight = SingleFlight()
+
+    async def execute():
+        await asyncio.sleep(0.05)
+        return 1
+
+    async def run():
+        first = asyncio.ensure_future(single_flight.run("a", execute))
+        second = asyncio.ensure_future(single_flight.run("a", execute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert event_loop.run_until_complete(run()) == (True, 1)
+
+
+def test_execution_is_cancelled_with_its_last_caller(event_loop):
+    single_flight = SingleFlight()
+    finished = []
+
+    async def execute():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+
+    async def run():
+        caller = asyncio.ensure_future(single_flight.run("a", execute))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.1)
+
+    event_loop.run_until_complete(run())
+    assert finished == []
+    assert single_flight.flights == {}
+
+
+def test_single_flight_app(client_builder):
+    client = client_builder(SQL_UP, single_flight=True)
+    with client:
+        resp = client.post("/", json={"query": "{ allAccounts { edges { node { name } } } }"})
+    assert resp.json()["errors"] == []
+    assert resp.json()["data"]["allAccounts"]["edges"] == [{"node": {"name": "oliver"}}]
+
+
+async def post(app, body, headers):
+    """POST *body* to the ASGI *app*, returning the decoded response"""
+    sent = []
+    request_body = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json")] + [(k.encode(), v.encode()) for k, v in headers.items()],
+    }
+    received = []
+
+    async def receive():
+        if received:
+            # The client stays connected
+            await asyncio.sleep(60)
+            return {"type": "http.disconnect"}
+        received.append(True)
+        return {"type": "http.request", "body": request_body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return json.loads(b"".join(x.get("body", b"") for x in sent if x["type"] == "http.response.body"))
+
+
+def test_reads_with_different_deadlines_are_not_coalesced(client_builder, event_loop):
+    client = client_builder(SQL_UP, single_flight=True, deadline_header="X-Timeout-Ms")
+    query = {"query": "{ slowHello }"}
+
+    async def run():
+        short = asyncio.ensure_future(post(client.app, query, {"X-Timeout-Ms": "200"}))
+        await asyncio.sleep(0.05)
+        long = asyncio.ensure_future(post(client.app, query, {"X-Timeout-Ms": "30000"}))
+        return await short, await long
+
+    with client:
+        short, long = event_loop.run_until_complete(run())
+    # The short deadline's statement timeout does not apply to the concurrent read with a longer deadline
+    assert short["errors"]
+    assert long["errors"] == []
+    assert long["data"]["slowHello"] == "hello"
@@ -0,0 +1,65 @@
+import logging
+
+from nebulo.server.slow_query import SlowQueryLog
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver'),
+(2, 'rachel');
+"""
+
+QUERY = """
+query getAccounts {
+    allAccounts(condition: {name: "oliver"}) {
+        edges {
+            node {
+                id
+            }
+        }
+    }
+}
+"""
+
+
+def test_slow_query_threshold():
+    assert not SlowQueryLog(threshold_ms=None).is_slow(100)
+    assert not SlowQueryLog(threshold_ms=50).is_slow(0.01)
+    assert SlowQueryLog(threshold_ms=50).is_slow(0.05)
+
+
+def test_slow_query_parameter_redaction():
+    params = {"param_1": "secret", "param_2": 5}
+    assert SlowQueryLog(threshold_ms=0).format_parameters(params) == {"param_1": "<str>", "param_2": "<int>"}
+    assert SlowQueryLog(threshold_ms=0, redact_parameters=False).format_parameters(params) == params
+
+
+def test_slow_query_is_logged(client_builder, caplog):
+    client = client_builder(SQL_UP, slow_query_ms=0, explain_sample_rate=1.0)
+    with caplog.at_level(logging.WARNING, logger="nebulo.slow_query"):
+        with client:
+            resp = client.post("/", json={"query": QUERY})
+    assert resp.status_code == 200
+    assert resp.json()["errors"] == []
+
+    records = [x.nebulo_slow_query for x in caplog.records if hasattr(x, "nebulo_slow_query")]
+    assert len(records) == 1
+    record = records[0]
+    assert record["operation"] == "getAccounts"
+    assert record["field"] == "allAccounts"
+    assert len(record["document_hash"]) == 16
+    assert "oliver" not in str(record["parameters"])
+    assert "Execution Time" in record["plan"]
+
+
+def test_slow_query_log_disabled_by_default(client_builder, caplog):
+    client = client_builder(SQL_UP)
+    with caplog.at_level(logging.WARNING, logger="nebulo.slow_query"):
+        with client:
+            resp = client.post("/", json={"query": QUERY})
+    assert resp.status_code == 200
+    assert not [x for x in caplog.records if hasattr(x, "nebulo_slow_query")]
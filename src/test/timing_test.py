@@ -0,0 +1,75 @@
+from nebulo.server.timing import NULL_TIMER, RequestTimer
+
+SQL_UP = """
+CREATE TABLE account (
+    id serial primary key,
+    name text not null
+);
+
+INSERT INTO account (id, name) VALUES
+(1, 'oliver'),
+(2, 'rachel');
+"""
+
+QUERY = """
+{
+    allAccounts {
+        edges {
+            node {
+                id
+            }
+        }
+    }
+}
+"""
+
+
+def test_request_timer_accumulates_phases():
+    timer = RequestTimer()
+    with timer.phase("gql_parse"):
+        pass
+    timer.record("query", 0.002)
+    timer.record("query", 0.001)
+
+    timings = timer.to_dict()
+    assert list(timings) == ["gql_parse", "query"]
+    assert timings["query"] == 3.0
+    assert "query;dur=3.0" in timer.to_server_timing()
+
+
+def test_null_timer_records_nothing():
+    with NULL_TIMER.phase("gql_parse"):
+        pass
+    NULL_TIMER.record("query", 1.0)
+    assert NULL_TIMER.to_dict() == {}
+
+
+def test_server_timing_header(client_builder):
+    client = client_builder(SQL_UP, server_timing=True)
+    with client:
+        resp = client.post("/", json={"query": QUERY})
+    assert resp.status_code == 200
+    header = resp.headers["Server-Timing"]
+    for phase in ["body_parse", "gql_parse", "allAccounts.sql_builder", "allAccounts.query", "serialize"]:
+        assert phase + ";dur=" in header
+    assert "extensions" not in resp.json()
+
+
+def test_timing_extensions(client_builder):
+    client = client_builder(SQL_UP, timing_extensions=True)
+    with client:
+        resp = client.post("/", json={"query": QUERY})
+    assert resp.status_code == 200
+    assert "Server-Timing" not in resp.headers
+    timings = resp.json()["extensions"]["timings"]
+    assert "allAccounts.parse_resolve_info" in timings
+    assert "allAccounts.json_loads" in timings
+
+
+def test_timing_disabled_by_default(client_builder):
+    client = client_builder(SQL_UP)
+    with client:
+        resp = client.post("/", json={"query": QUERY})
+    assert resp.status_code == 200
+    assert "Server-Timing" not in resp.headers
+    assert "extensions" not in resp.json()